@@ -0,0 +1,443 @@
+"""
+JSON API (wersja 1) dla kiosków, ekranów przywoławczych i innych integracji.
+
+Endpointy kolejki, lekarzy, grafików, wyszukiwania i eksportu wymagają
+zalogowanej sesji personelu albo nagłówka "Authorization: Bearer <API_TOKEN>"
+(gdy API_TOKEN jest ustawiony w konfiguracji). Endpointy rezerwacji i listy
+oczekujących są publiczne – tak jak strony pacjenta.
+
+Endpointy batch wykonują wszystkie operacje w jednej transakcji:
+albo przechodzą wszystkie, albo żadna.
+"""
+import hmac
+from datetime import date as dt_date
+from functools import wraps
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+from availability import next_slots_args
+from booking_store import BOOKED, validate_patient
+import export
+from database import (
+    add_to_queue, get_conn, get_doctor_schedule, get_queue, immediate_transaction,
+    move_patient, serve_next, serve_patient, set_note,
+)
+from schedules import ScheduleImportError, import_schedules
+from search import SEARCH_PAGE_SIZE, search_patients
+from slots import find_slot, list_doctors
+import slots as slot_calendar
+from waitlist import WaitlistError
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+MAX_BATCH = 500
+MAX_QUEUE_PAGE = 500
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(ApiError)
+def handle_api_error(error):
+    return jsonify({"error": error.message}), error.status
+
+
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get("API_TOKEN")
+        auth = request.headers.get("Authorization", "")
+        if token and hmac.compare_digest(auth, f"Bearer {token}"):
+            return view(*args, **kwargs)
+        if current_app.extensions["auth"].current_user() is not None:
+            return view(*args, **kwargs)
+        raise ApiError("Brak autoryzacji", 401)
+    return wrapper
+
+
+def _json():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ApiError("Oczekiwano obiektu JSON")
+    return data
+
+
+def _bookings():
+    return current_app.extensions["bookings"]
+
+
+def _availability():
+    return current_app.extensions["availability"]
+
+
+def _waitlist():
+    return current_app.extensions["waitlist"]
+
+
+def _public(appt):
+    # token anulowania zna tylko rezerwujący (odpowiedź na utworzenie, e-mail);
+    # odczyt po kolejnym id go nie zdradza
+    return {k: v for k, v in appt.items() if k != "cancel_token"}
+
+
+def _slot_from(data):
+    try:
+        slot_id = int(data.get("slot_id"))
+    except (TypeError, ValueError):
+        raise ApiError("Pole 'slot_id' jest wymagane")
+    return find_slot(str(data.get("date", "")), slot_id)
+
+
+def _queue_json(conn, doctor_id, limit=-1, offset=0):
+    return [dict(p) for p in get_queue(conn, doctor_id, limit, offset)]
+
+
+def _queue_page_args(args):
+    """(limit, offset) strony kolejki z parametrów żądania; bez `limit` cała kolejka."""
+    limit = args.get("limit", type=int)
+    offset = max(args.get("offset", default=0, type=int), 0)
+    return (-1 if limit is None else max(1, min(limit, MAX_QUEUE_PAGE))), offset
+
+
+def _require_doctor(conn, doctor_id):
+    if conn.execute("SELECT 1 FROM doctors WHERE id=?", (doctor_id,)).fetchone() is None:
+        raise ApiError("Nie znaleziono lekarza", 404)
+
+
+# ---------------------------
+# LEKARZE I GRAFIKI
+# ---------------------------
+
+@api.get("/doctors")
+@api_login_required
+def doctors():
+    rows = get_conn().execute("SELECT id, name, hours FROM doctors ORDER BY id").fetchall()
+    return jsonify([dict(r) for r in rows])
+
+
+@api.get("/doctors/<int:doctor_id>/schedule")
+@api_login_required
+def doctor_schedule(doctor_id):
+    return jsonify([
+        {"day": r["day_of_week"], "start_time": r["start_time"], "end_time": r["end_time"]}
+        for r in get_doctor_schedule(doctor_id)
+    ])
+
+
+@api.post("/schedules/batch")
+@api_login_required
+def schedules_batch():
+    """
+    Wpisy: doctor_id, day, start_time, end_time [, every_weeks, valid_from, valid_to].
+    Opcjonalnie "exceptions" (dni bez przyjęć) i "replace": true (zastąp grafik lekarzy).
+    """
+    data = _json()
+    entries = data.get("entries")
+    exceptions = data.get("exceptions") or []
+    if (not isinstance(entries, list) or not isinstance(exceptions, list)
+            or not entries + exceptions or len(entries) + len(exceptions) > MAX_BATCH):
+        raise ApiError(f"Pole 'entries' musi być listą 1..{MAX_BATCH} wpisów")
+
+    try:
+        added, closed = import_schedules(entries, exceptions, replace=bool(data.get("replace")))
+    except ScheduleImportError as e:
+        return jsonify({"error": e.errors[0], "errors": e.errors}), 400
+
+    slot_calendar.invalidate()
+    current_app.extensions["page_cache"].invalidate("schedule", "slots")
+    return jsonify({"added": added, "exceptions": closed}), 201
+
+
+# ---------------------------
+# KOLEJKA PACJENTÓW
+# ---------------------------
+
+@api.get("/doctors/<int:doctor_id>/queue")
+@api_login_required
+def queue(doctor_id):
+    limit, offset = _queue_page_args(request.args)
+    return jsonify(_queue_json(get_conn(), doctor_id, limit, offset))
+
+
+@api.get("/doctors/<int:doctor_id>/queue/events")
+@api_login_required
+def queue_events(doctor_id):
+    """Strumień SSE: stan kolejki (albo strony offset/limit) na start, potem same zmiany."""
+    limit, offset = _queue_page_args(request.args)
+    stream = current_app.extensions["queue_broker"].subscribe(doctor_id, limit, offset)
+    return Response(
+        stream,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@api.post("/doctors/<int:doctor_id>/queue")
+@api_login_required
+def queue_add(doctor_id):
+    name = str(_json().get("name", "")).strip()
+    if not name:
+        raise ApiError("Pole 'name' jest wymagane")
+
+    conn = get_conn()
+    _require_doctor(conn, doctor_id)
+    with immediate_transaction(conn):
+        patient_id = add_to_queue(conn, name, doctor_id)
+    return jsonify({"id": patient_id, "queue": _queue_json(conn, doctor_id)}), 201
+
+
+@api.post("/doctors/<int:doctor_id>/queue/batch")
+@api_login_required
+def queue_add_batch(doctor_id):
+    names = _json().get("names")
+    if (not isinstance(names, list) or not names or len(names) > MAX_BATCH
+            or not all(isinstance(n, str) and n.strip() for n in names)):
+        raise ApiError(f"Pole 'names' musi być listą 1..{MAX_BATCH} niepustych napisów")
+
+    conn = get_conn()
+    _require_doctor(conn, doctor_id)
+    with immediate_transaction(conn):
+        ids = [add_to_queue(conn, n.strip(), doctor_id) for n in names]
+    return jsonify({"ids": ids, "queue": _queue_json(conn, doctor_id)}), 201
+
+
+@api.post("/doctors/<int:doctor_id>/queue/serve-next")
+@api_login_required
+def queue_serve_next(doctor_id):
+    """Obsługuje pierwszego pacjenta i od razu zwraca nowy stan kolejki."""
+    conn = get_conn()
+    with conn:
+        served_id = serve_next(conn, doctor_id)
+    if served_id is None:
+        raise ApiError("Kolejka jest pusta", 404)
+
+    waiting = _queue_json(conn, doctor_id)
+    return jsonify({
+        "served_id": served_id,
+        "next": waiting[0] if waiting else None,
+        "queue": waiting,
+    })
+
+
+@api.post("/patients/<int:patient_id>/serve")
+@api_login_required
+def patient_serve(patient_id):
+    conn = get_conn()
+    with conn:
+        patient = serve_patient(conn, patient_id)
+    if patient is None:
+        raise ApiError("Nie znaleziono pacjenta", 404)
+    return jsonify({"served_id": patient_id, "queue": _queue_json(conn, patient["doctor_id"])})
+
+
+@api.post("/patients/<int:patient_id>/move")
+@api_login_required
+def patient_move(patient_id):
+    direction = _json().get("direction")
+    if direction not in ("up", "down"):
+        raise ApiError("Pole 'direction' musi mieć wartość 'up' albo 'down'")
+
+    conn = get_conn()
+    with conn:
+        patient, moved = move_patient(conn, patient_id, direction)
+    if patient is None:
+        raise ApiError("Nie znaleziono pacjenta", 404)
+    if not moved:
+        raise ApiError("Nie można przesunąć pacjenta", 409)
+    return jsonify({"queue": _queue_json(conn, patient["doctor_id"])})
+
+
+@api.put("/patients/<int:patient_id>/note")
+@api_login_required
+def patient_note(patient_id):
+    note_text = _json().get("note")
+    if not isinstance(note_text, str):
+        raise ApiError("Pole 'note' jest wymagane")
+
+    conn = get_conn()
+    with conn:
+        updated = set_note(conn, patient_id, note_text)
+    if not updated:
+        raise ApiError("Nie znaleziono pacjenta", 404)
+    return jsonify({"id": patient_id, "note": note_text})
+
+
+# ---------------------------
+# TERMINY I REZERWACJE
+# ---------------------------
+
+@api.get("/slots")
+def free_slots():
+    doctor_id = request.args.get("doctor_id", type=int)
+    day = request.args.get("date") or dt_date.today().isoformat()
+    if doctor_id is None:
+        raise ApiError("Parametr 'doctor_id' jest wymagany")
+    return jsonify(_availability().free_slots(doctor_id, day))
+
+
+@api.get("/slots/next")
+def next_free_slots():
+    limit, days, doctor_id = next_slots_args(request.args)
+    return jsonify(_availability().next_free_slots(limit=limit, doctor_id=doctor_id, days=days))
+
+
+@api.get("/slots/doctors")
+def slot_doctors():
+    return jsonify(list(list_doctors()))
+
+
+@api.post("/bookings")
+def booking_create():
+    data = _json()
+    patient_name = str(data.get("patient_name", "")).strip()
+    email = str(data.get("email", "")).strip()
+
+    error = validate_patient(patient_name, email)
+    if error:
+        raise ApiError(error)
+
+    slot = _slot_from(data)
+    if slot is None:
+        raise ApiError("Nie znaleziono terminu do rezerwacji.", 404)
+
+    appt = _bookings().book(slot, patient_name, email=email, reason=data.get("reason"))
+    if appt is None:
+        raise ApiError("Termin zajęty", 409)
+    return jsonify(appt), 201
+
+
+@api.get("/bookings/<int:appointment_id>")
+def booking_get(appointment_id):
+    appt = _bookings().get(appointment_id)
+    if appt is None:
+        raise ApiError("Nie znaleziono rezerwacji.", 404)
+    return jsonify(_public(appt))
+
+
+@api.delete("/bookings/<int:appointment_id>")
+def booking_cancel(appointment_id):
+    appt = _bookings().cancel(appointment_id)
+    if appt is None:
+        raise ApiError("Nie znaleziono rezerwacji.", 404)
+    return jsonify(_public(appt))
+
+
+@api.post("/bookings/<int:appointment_id>/reschedule")
+def booking_reschedule(appointment_id):
+    data = _json()
+    appt = _bookings().get(appointment_id)
+    if appt is None or appt["status"] != BOOKED:
+        raise ApiError("Nie znaleziono aktywnej rezerwacji.", 404)
+
+    slot = _slot_from(data)
+    if slot is None:
+        raise ApiError("Nie znaleziono wybranego terminu.", 404)
+
+    appt = _bookings().reschedule(appointment_id, slot)
+    if appt is None:
+        raise ApiError("Termin zajęty", 409)
+    return jsonify(_public(appt))
+
+
+# ---------------------------
+# LISTA OCZEKUJĄCYCH
+# ---------------------------
+
+@api.post("/waitlist")
+def waitlist_join():
+    data = _json()
+    doctor_id = data.get("doctor_id")
+    if doctor_id is not None and not isinstance(doctor_id, int):
+        raise ApiError("Pole 'doctor_id' musi być liczbą")
+    try:
+        entry = _waitlist().add(
+            str(data.get("patient_name", "")).strip(),
+            str(data.get("email", "")).strip(),
+            data.get("date_from"),
+            data.get("date_to"),
+            doctor_id=doctor_id,
+            time_from=data.get("time_from"),
+            time_to=data.get("time_to"),
+        )
+    except WaitlistError as e:
+        raise ApiError(str(e))
+    return jsonify(entry), 201
+
+
+def _offer(token):
+    offer = _waitlist().get_offer(token)
+    if offer is None:
+        raise ApiError("Nie znaleziono oferty.", 404)
+    return offer
+
+
+@api.get("/waitlist/offers/<token>")
+def waitlist_offer(token):
+    return jsonify(_offer(token))
+
+
+@api.post("/waitlist/offers/<token>/accept")
+def waitlist_accept(token):
+    _offer(token)
+    appt = _waitlist().accept(token)
+    if appt is None:
+        raise ApiError("Oferta jest już nieaktualna.", 409)
+    return jsonify(appt)
+
+
+@api.post("/waitlist/offers/<token>/decline")
+def waitlist_decline(token):
+    """Odrzuca ofertę; {"leave": true} wypisuje też z listy oczekujących."""
+    _offer(token)
+    data = request.get_json(silent=True)
+    leave = isinstance(data, dict) and bool(data.get("leave"))
+    if not _waitlist().decline(token, leave=leave):
+        raise ApiError("Oferta jest już nieaktualna.", 409)
+    return jsonify(_offer(token))
+
+
+@api.get("/patients/search")
+@api_login_required
+def patients_search():
+    """Wyszukiwanie po nazwisku i notatkach (?q=, ?page=) – bieżące kolejki i archiwum."""
+    q = request.args.get("q", "").strip()
+    if not q:
+        raise ApiError("Parametr 'q' jest wymagany")
+    page = max(request.args.get("page", default=1, type=int), 1)
+    rows = search_patients(q, limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE)
+    return jsonify({
+        "results": [dict(r, archived=bool(r["archived"])) for r in rows[:SEARCH_PAGE_SIZE]],
+        "page": page,
+        "has_next": len(rows) > SEARCH_PAGE_SIZE,
+    })
+
+
+# ---------------------------
+# EKSPORT
+# ---------------------------
+
+@api.get("/export/<kind>.<fmt>")
+@api_login_required
+def export_data(kind, fmt):
+    """Plik CSV/NDJSON wysyłany w trakcie czytania z bazy (?date_from, ?date_to, ?doctor_id, ?gzip=1)."""
+    gzip = request.args.get("gzip") in ("1", "true")
+    date_from = request.args.get("date_from")
+    date_to = request.args.get("date_to")
+    try:
+        chunks = export.stream(
+            kind, fmt, gzip=gzip, date_from=date_from, date_to=date_to,
+            doctor_id=request.args.get("doctor_id", type=int),
+        )
+    except export.ExportError as e:
+        raise ApiError(str(e))
+
+    name = export.filename(kind, fmt, gzip, date_from, date_to)
+    return Response(
+        stream_with_context(chunks),
+        mimetype="application/gzip" if gzip else export.MIMETYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}"', "X-Accel-Buffering": "no"},
+    )
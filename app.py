@@ -1,72 +1,62 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash
-from database import get_conn, init_db
+from database import get_conn, init_app
 from database import get_doctor_schedule, add_schedule
-import datetime
+from database import queue_number, get_queue, queue_length
+from database import add_to_queue, serve_patient, move_patient, set_note
+from database import immediate_transaction, reserve_appointment as reserve_appointment_db
+from booking_store import BookingStore, BOOKED, validate_patient
+import slots as slot_calendar
+from slots import find_slot, list_doctors
+from availability import AvailabilityIndex, next_slots_args
+from api import api
+from events import QueueBroker
+from eta import EtaEngine
+from page_cache import PageCache
+from metrics import Metrics
+from notifications import Notifier
+from waitlist import Waitlist, WaitlistError
+from auth import Auth
+import migrations
+import schedules
+from search import SEARCH_PAGE_SIZE, search_patients
+import archive
+import export
+from schedules import ScheduleImportError, import_schedules, parse_upload
 from datetime import date as dt_date, datetime as dt_datetime, timedelta
-import re
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 app.secret_key = "super_secret_key"
+# ustawienia bazy (DB_POOL_SIZE, DB_SYNCHRONOUS, ...) można podać jako FLASK_DB_...
+app.config.from_prefixed_env()
+init_app(app)
+migrations.init_app(app)
+Metrics().init_app(app)
+auth = Auth()
+auth.init_app(app)
+slot_calendar.init_app(app)
+schedules.init_app(app)
+archive.init_app(app)
+export.init_app(app)
+page_cache = PageCache()
+page_cache.init_app(app)
 
 # ---------------------------
-# INIT DATABASE
+# SYSTEM REZERWACJI „ROKSA” – TERMINY Z GRAFIKÓW LEKARZY
 # ---------------------------
-init_db()
-
-# ---------------------------
-# DANE „ROKSA” – MOCK DLA SYSTEMU REZERWACJI
-# ---------------------------
-
-doctors = [
-    {"id": 1, "name": "dr Anna Kowalska"},
-    {"id": 2, "name": "dr Piotr Nowak"},
-    {"id": 3, "name": "dr Maria Zielińska"},
-]
-
-appointments: list[dict] = []
-next_appointment_id = 1
-AVG_VISIT_MIN = 15
 
-
-def get_slots_for(selected_date: str):
-    """Mock slotów – na razie bez DB, ale działa do prezentacji."""
-    return [
-        {
-            "slot_id": 101,
-            "doctor_id": 1,
-            "doctor_name": "dr Anna Kowalska",
-            "date": selected_date,
-            "time": "09:00",
-        },
-        {
-            "slot_id": 102,
-            "doctor_id": 1,
-            "doctor_name": "dr Anna Kowalska",
-            "date": selected_date,
-            "time": "09:30",
-        },
-        {
-            "slot_id": 201,
-            "doctor_id": 2,
-            "doctor_name": "dr Piotr Nowak",
-            "date": selected_date,
-            "time": "10:00",
-        },
-        {
-            "slot_id": 202,
-            "doctor_id": 2,
-            "doctor_name": "dr Piotr Nowak",
-            "date": selected_date,
-            "time": "10:30",
-        },
-        {
-            "slot_id": 301,
-            "doctor_id": 3,
-            "doctor_name": "dr Maria Zielińska",
-            "date": selected_date,
-            "time": "11:00",
-        },
-    ]
+bookings = BookingStore()
+availability = AvailabilityIndex(bookings)
+app.extensions["bookings"] = bookings
+app.extensions["availability"] = availability
+app.register_blueprint(api)
+# wolne terminy zmieniają się przy każdej rezerwacji, także tej z API
+bookings.add_listener(lambda event, appt, previous=None: page_cache.invalidate("slots"))
+notifier = Notifier(bookings)
+notifier.init_app(app)
+# zwolnione terminy od razu trafiają do pacjentów z listy oczekujących
+waitlist = Waitlist(bookings, notifier)
+waitlist.init_app(app)
+DASHBOARD_PAGE_SIZE = int(app.config.get("DASHBOARD_PAGE_SIZE", 100))
 
 
 # ---------------------------
@@ -78,18 +68,78 @@ from functools import wraps
 def login_required(view):
     @wraps(view)
     def wrapper(*args, **kwargs):
-        if 'user_id' not in session:
+        # konto sprawdzane w bazie (przez krótki cache) – zablokowanie działa też na otwarte sesje
+        user = auth.current_user()
+        if user is None:
+            session.clear()
             flash("Musisz się zalogować!", "danger")
             return redirect(url_for('login'))
+        # rola z bazy, nie z ciasteczka
+        if session.get("role") != user["role"] or session.get("doctor_id") != user["doctor_id"]:
+            session["role"] = user["role"]
+            session["doctor_id"] = user["doctor_id"]
         return view(*args, **kwargs)
     return wrapper
 
 
 
-def get_eta(position, avg_minutes=15):
-    now = datetime.datetime.now()
-    eta = now + datetime.timedelta(minutes=position * avg_minutes)
-    return eta.strftime("%H:%M")
+eta_engine = EtaEngine()
+eta_engine.init_app(app)
+
+
+def queue_rows(doctor_id, limit=-1, offset=0):
+    """Wiersze kolejki z ETA – jeden przebieg, bez dopasowywania list po id."""
+    patients = get_queue(get_conn(), doctor_id, limit, offset)
+    etas = eta_engine.queue_etas(doctor_id, len(patients), first=offset)
+    return [
+        {"id": p["id"], "name": p["name"], "position": p["position"], "queue_no": p["queue_no"], "eta": eta}
+        for p, eta in zip(patients, etas)
+    ]
+
+
+def eta_clock(doctor_id):
+    # z tych dwóch liczb ekran sam liczy ETA: start + (numer - 1) * mean
+    start, mean = eta_engine.queue_clock(doctor_id)
+    return {"start": start, "mean": mean}
+
+
+def queue_snapshot(doctor_id, limit=-1, offset=0):
+    """Stan kolejki lekarza (cała albo jedna strona) – pierwsza wiadomość dla ekranu (SSE)."""
+    return {"queue": queue_rows(doctor_id, limit, offset), "eta": eta_clock(doctor_id)}
+
+
+def queue_changes(doctor_id, events):
+    """
+    Zmiany w kolejce dla ekranów (SSE): przy każdym zdarzeniu aktualny wiersz pacjenta
+    (None, gdy już nie czeka) i jego klucz `position` – ekran poprawia tylko te wiersze.
+    """
+    conn = get_conn()
+    ids = sorted({e["patient_id"] for e in events})
+    patients = {
+        p["id"]: p for p in conn.execute(
+            f"SELECT id, name, position, status FROM patients WHERE id IN ({','.join('?' * len(ids))})",
+            ids
+        )
+    }
+    changes = []
+    for event in events:
+        p = patients.get(event["patient_id"])
+        row = None
+        if p is not None and p["status"] == "oczekuje":
+            queue_no = queue_number(conn, doctor_id, p["position"])
+            row = {"id": p["id"], "name": p["name"], "position": p["position"], "queue_no": queue_no,
+                   "eta": eta_engine.queue_etas(doctor_id, 1, first=queue_no - 1)[0]}
+        changes.append({
+            **event,
+            "position": p["position"] if p is not None else None,
+            "queue_no": row["queue_no"] if row else None,
+            "row": row,
+        })
+    return {"events": changes, "eta": eta_clock(doctor_id)}
+
+
+queue_broker = QueueBroker(queue_snapshot, queue_changes)
+queue_broker.init_app(app)
 
 
 # ---------------------------
@@ -102,23 +152,28 @@ def login():
         username = request.form["username"]
         password = request.form["password"]
 
-        conn = get_conn()
-        user = conn.execute(
-            "SELECT * FROM users WHERE username=? AND password=?",
-            (username, password)
-        ).fetchone()
-        conn.close()
+        # limit nieudanych prób – osobno na login i na adres IP
+        limit_keys = (f"user:{username.lower()}", f"ip:{request.remote_addr}")
+        if not auth.limiter.allow(limit_keys):
+            flash("Zbyt wiele nieudanych prób logowania. Spróbuj ponownie za chwilę.", "danger")
+            return render_template("login.html"), 429
+
+        user = auth.authenticate(username, password)
 
         if user:
+            auth.limiter.reset(limit_keys[:1])
+            session.clear()
             session["user_id"] = user["id"]
             session["username"] = user["username"]
             session["role"] = user["role"]
+            session["doctor_id"] = user["doctor_id"]
             if user["role"] == "lekarz":
                 return redirect(url_for("doctor_panel"))
             else:
                 return redirect(url_for("dashboard"))
 
         else:
+            auth.limiter.consume(limit_keys)
             flash("Złe dane logowania!", "danger")
 
     return render_template("login.html")
@@ -137,32 +192,75 @@ def dashboard():
         flash("Brak dostępu do panelu rejestratorki", "danger")
         return redirect(url_for("doctor_panel"))
 
-    conn = get_conn()
-    patients = conn.execute(
-        "SELECT * FROM patients WHERE status='oczekuje' ORDER BY position"
-    ).fetchall()
-
-    doctors_db = conn.execute(
-        "SELECT * FROM doctors"
-    ).fetchall()
+    doctors = list_doctors()
 
-    conn.close()
+    # każdy lekarz ma własną kolejkę – rejestratorka przełącza się między nimi
+    doctor_id = request.args.get("doctor_id", type=int)
+    if doctor_id is None and doctors:
+        doctor_id = doctors[0]["id"]
 
-    eta_list = []
-    for p in patients:
-        eta_list.append({
-            "id": p["id"],
-            "name": p["name"],
-            "position": p["position"],
-            "eta": get_eta(p["position"] - 1)
-        })
+    # długie kolejki dzielimy na strony – numer w kolejce i ETA liczone od początku kolejki
+    total = queue_length(get_conn(), doctor_id)
+    pages = max(1, -(-total // DASHBOARD_PAGE_SIZE))
+    page = min(max(request.args.get("page", default=1, type=int), 1), pages)
+    offset = (page - 1) * DASHBOARD_PAGE_SIZE
 
     return render_template(
         "dashboard.html",
         username=session.get("username"),
-        patients=patients,
-        doctors=doctors_db,
-        eta_list=eta_list
+        patients=queue_rows(doctor_id, DASHBOARD_PAGE_SIZE, offset),
+        doctors=doctors,
+        selected_doctor_id=doctor_id,
+        page=page,
+        pages=pages,
+        page_offset=offset,
+        page_size=DASHBOARD_PAGE_SIZE,
+    )
+
+
+@app.route("/history")
+@login_required
+def history():
+    if session.get("role") != "rejestratorka":
+        flash("Brak dostępu do historii wizyt", "danger")
+        return redirect(url_for("doctor_panel"))
+
+    doctor_id = request.args.get("doctor_id", type=int)
+    date_from = request.args.get("date_from") or None
+    date_to = request.args.get("date_to") or None
+    page = max(request.args.get("page", default=1, type=int), 1)
+
+    # pobieramy jeden wiersz więcej – wiadomo, czy jest następna strona, bez COUNT(*) po archiwum
+    rows = archive.history(doctor_id, date_from, date_to,
+                           limit=DASHBOARD_PAGE_SIZE + 1, offset=(page - 1) * DASHBOARD_PAGE_SIZE)
+
+    return render_template(
+        "history.html",
+        visits=rows[:DASHBOARD_PAGE_SIZE],
+        doctors={d["id"]: d["name"] for d in list_doctors()},
+        selected_doctor_id=doctor_id,
+        date_from=date_from or "",
+        date_to=date_to or "",
+        page=page,
+        has_next=len(rows) > DASHBOARD_PAGE_SIZE,
+    )
+
+
+@app.route("/search")
+@login_required
+def search():
+    q = request.args.get("q", "").strip()
+    page = max(request.args.get("page", default=1, type=int), 1)
+    rows = search_patients(q, limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE)
+
+    return render_template(
+        "search.html",
+        username=session.get("username"),
+        q=q,
+        results=rows[:SEARCH_PAGE_SIZE],
+        doctors={d["id"]: d["name"] for d in list_doctors()},
+        page=page,
+        has_next=len(rows) > SEARCH_PAGE_SIZE,
     )
 
 
@@ -173,23 +271,15 @@ def doctor_panel():
         flash("Brak dostępu do panelu lekarza", "danger")
         return redirect(url_for("dashboard"))
 
-    conn = get_conn()
-    patients = conn.execute("""
-        SELECT * FROM patients
-        WHERE status='oczekuje'
-        ORDER BY position
-    """).fetchall()
-    conn.close()
+    doctor_id = session.get("doctor_id")
+    if doctor_id is None:
+        flash("Konto lekarza nie jest przypisane do żadnego lekarza", "danger")
 
-    from datetime import datetime as dt_now, timedelta as td
-    AVG_VISIT_MIN_LOCAL = 15
+    conn = get_conn()
+    patients = get_queue(conn, doctor_id)
 
     patients_with_visit_time = []
-    for idx, p in enumerate(patients):
-        visit_time = (
-            dt_now.now() + td(minutes=idx * AVG_VISIT_MIN_LOCAL)
-        ).strftime("%H:%M")
-
+    for p, visit_time in zip(patients, eta_engine.queue_etas(doctor_id, len(patients))):
         patient_dict = dict(p)
         patient_dict["visit_time"] = visit_time
         patients_with_visit_time.append(patient_dict)
@@ -197,6 +287,7 @@ def doctor_panel():
     return render_template(
         "doctor.html",
         patients=patients_with_visit_time,
+        doctor_id=doctor_id,
         username=session.get("username")
     )
 
@@ -205,67 +296,34 @@ def doctor_panel():
 @login_required
 def mark_served(patient_id):
     conn = get_conn()
-    conn.execute(
-        "UPDATE patients SET status='obsłużony' WHERE id=?",
-        (patient_id,)
-    )
+    patient = serve_patient(conn, patient_id)
     conn.commit()
 
-    conn.execute("""
-        UPDATE patients
-        SET position = position - 1
-        WHERE position > (
-            SELECT position FROM patients WHERE id=?
-        )
-    """, (patient_id,))
-    conn.commit()
-    conn.close()
-
     flash("Pacjent oznaczony jako obsłużony", "success")
-    return redirect(url_for("dashboard"))
+    if session.get("role") == "lekarz":
+        return redirect(url_for("doctor_panel"))
+    return redirect(url_for("dashboard", doctor_id=patient["doctor_id"] if patient else None))
 
 
 @app.route("/move/<int:patient_id>/<direction>")
 @login_required
 def move(patient_id, direction):
     conn = get_conn()
-
-    current = conn.execute(
-        "SELECT id, position FROM patients WHERE id=?",
-        (patient_id,)
-    ).fetchone()
+    current, moved = move_patient(conn, patient_id, direction)
 
     if not current:
         flash("Pacjent nie istnieje!", "danger")
         return redirect(url_for("dashboard"))
 
-    pos = current["position"]
-
-    if direction == "up" and pos > 1:
-        new_pos = pos - 1
-    elif direction == "down":
-        new_pos = pos + 1
-    else:
+    doctor_id = current["doctor_id"]
+    if not moved:
         flash("Nie można przesunąć pacjenta", "danger")
-        return redirect(url_for("dashboard"))
-
-    conn.execute("""
-        UPDATE patients
-        SET position = ?
-        WHERE position = ?
-    """, (pos, new_pos))
-
-    conn.execute("""
-        UPDATE patients
-        SET position = ?
-        WHERE id = ?
-    """, (new_pos, patient_id))
+        return redirect(url_for("dashboard", doctor_id=doctor_id))
 
     conn.commit()
-    conn.close()
 
     flash("Pacjent przesunięty", "success")
-    return redirect(url_for("dashboard"))
+    return redirect(url_for("dashboard", doctor_id=doctor_id))
 
 
 @app.route("/note/<int:patient_id>", methods=["GET", "POST"])
@@ -275,12 +333,8 @@ def note(patient_id):
 
     if request.method == "POST":
         note_text = request.form["note"]
-        conn.execute(
-            "UPDATE patients SET note=? WHERE id=?",
-            (note_text, patient_id)
-        )
+        set_note(conn, patient_id, note_text)
         conn.commit()
-        conn.close()
 
         flash("Notatka zapisana!", "success")
 
@@ -292,7 +346,6 @@ def note(patient_id):
     patient = conn.execute(
         "SELECT * FROM patients WHERE id=?", (patient_id,)
     ).fetchone()
-    conn.close()
 
     if not patient:
         flash("Nie znaleziono pacjenta!", "danger")
@@ -308,29 +361,21 @@ def note(patient_id):
 @login_required
 def add_patient():
     name = request.form["name"]
-    doctor_id = 1  # na MVP tylko jeden lekarz
+    doctor_id = request.form.get("doctor_id", type=int)
 
     conn = get_conn()
-
-    last_pos = conn.execute(
-        "SELECT MAX(position) AS maxpos FROM patients"
-    ).fetchone()["maxpos"]
-
-    next_pos = 1 if last_pos is None else last_pos + 1
-
-    conn.execute(
-        "INSERT INTO patients (name, doctor_id, position, status) VALUES (?, ?, ?, 'oczekuje')",
-        (name, doctor_id, next_pos)
-    )
-    conn.commit()
-    conn.close()
+    if doctor_id is None:
+        doctor_id = conn.execute("SELECT MIN(id) FROM doctors").fetchone()[0]
+    with immediate_transaction(conn):
+        add_to_queue(conn, name, doctor_id)
 
     flash("Pacjent dodany do kolejki", "success")
-    return redirect(url_for("dashboard"))
+    return redirect(url_for("dashboard", doctor_id=doctor_id))
 
 
 @app.route("/doctors", methods=["GET", "POST"])
 @login_required
+@page_cache.cached("doctors")
 def doctors_view():
     conn = get_conn()
 
@@ -343,12 +388,13 @@ def doctors_view():
             (name, hours)
         )
         conn.commit()
+        slot_calendar.invalidate()
+        page_cache.invalidate()
         flash("Lekarz dodany!", "success")
 
     doctors_db = conn.execute(
         "SELECT * FROM doctors"
     ).fetchall()
-    conn.close()
 
     return render_template("doctors.html", doctors=doctors_db)
 
@@ -369,7 +415,8 @@ def edit_doctor(doctor_id):
             (name, hours, doctor_id)
         )
         conn.commit()
-        conn.close()
+        slot_calendar.invalidate()
+        page_cache.invalidate()
         flash("Dane lekarza zaktualizowane!", "success")
         return redirect(url_for("doctors_view"))
 
@@ -378,7 +425,6 @@ def edit_doctor(doctor_id):
         "SELECT * FROM doctors WHERE id=?",
         (doctor_id,)
     ).fetchone()
-    conn.close()
 
     return render_template("edit_doctor.html", doctor=doctor)
 @login_required
@@ -386,13 +432,15 @@ def delete_doctor(doctor_id):
     conn = get_conn()
     conn.execute("DELETE FROM doctors WHERE id=?", (doctor_id,))
     conn.commit()
-    conn.close()
+    slot_calendar.invalidate()
+    page_cache.invalidate()
     flash("Lekarz został usunięty!", "success")
     return redirect(url_for("doctors_view"))
 
 app.add_url_rule('/doctors/delete/<int:doctor_id>', view_func=delete_doctor, methods=['POST'])
 @app.route("/appointments")
 @login_required
+@page_cache.cached("appointments", "doctors")
 def appointments_view():
     conn = get_conn()
     available = conn.execute(
@@ -401,7 +449,6 @@ def appointments_view():
         "JOIN doctors d ON a.doctor_id = d.id "
         "WHERE a.status='wolny'"
     ).fetchall()
-    conn.close()
 
     return render_template("appointments.html", appointments=available)
 
@@ -414,22 +461,19 @@ def reserve_appointment(appointment_id):
     if request.method == "POST":
         name = request.form["name"]
 
-        last_pos = conn.execute(
-            "SELECT MAX(position) AS maxpos FROM patients"
-        ).fetchone()["maxpos"]
-        next_pos = 1 if last_pos is None else last_pos + 1
-        conn.execute(
-            "INSERT INTO patients (name, doctor_id, position, status) VALUES (?, ?, ?, 'oczekuje')",
-            (name, appointment_id, next_pos)
-        )
-        conn.execute(
-            "UPDATE appointments SET status='zarezerwowany', patient_id=(SELECT MAX(id) FROM patients) WHERE id=?",
-            (appointment_id,)
-        )
-        conn.commit()
-        conn.close()
+        # sprawdzenie terminu, zajęcie go i dopisanie pacjenta – jedna transakcja
+        with immediate_transaction(conn):
+            patient_id = reserve_appointment_db(conn, appointment_id, name)
+        if patient_id is None:
+            flash("Ten termin jest już zajęty", "danger")
+            return redirect(url_for("appointments_view"))
+        page_cache.invalidate("appointments")
 
-        flash(f"Rezerwacja zapisana! Twój numer w kolejce: {next_pos}", "success")
+        patient = conn.execute(
+            "SELECT doctor_id, position FROM patients WHERE id=?", (patient_id,)
+        ).fetchone()
+        queue_no = queue_number(conn, patient["doctor_id"], patient["position"])
+        flash(f"Rezerwacja zapisana! Twój numer w kolejce: {queue_no}", "success")
         return redirect(url_for("appointments_view"))
 
     appointment = conn.execute(
@@ -437,12 +481,12 @@ def reserve_appointment(appointment_id):
         "FROM appointments a JOIN doctors d ON a.doctor_id = d.id "
         "WHERE a.id=?", (appointment_id,)
     ).fetchone()
-    conn.close()
 
     return render_template("reserve_form.html", appointment=appointment)
 
 
 @app.route("/doctor/<int:doctor_id>/schedule")
+@page_cache.cached("schedule")
 def doctor_schedule(doctor_id):
     schedule = get_doctor_schedule(doctor_id)
     doctor = {"id": doctor_id}
@@ -462,11 +506,38 @@ def schedule_add():
     end_time = request.form["end_time"]
 
     add_schedule(doctor_id, day_of_week, start_time, end_time)
+    slot_calendar.invalidate()
+    page_cache.invalidate("schedule", "slots")
 
     flash("Grafik zapisany", "success")
     return redirect(f"/doctor/{doctor_id}/schedule")
 
 
+@app.route("/schedule/import", methods=["POST"])
+@login_required
+def schedule_import():
+    """Grafiki wielu lekarzy naraz z pliku CSV/JSON (format opisany w schedules.py)."""
+    upload = request.files.get("file")
+    if upload is None or not upload.filename:
+        flash("Wybierz plik z grafikiem", "danger")
+        return redirect(url_for("doctors_view"))
+
+    try:
+        entries, exceptions = parse_upload(upload.filename, upload.read().decode("utf-8-sig"))
+        added, closed = import_schedules(entries, exceptions, replace=bool(request.form.get("replace")))
+    except UnicodeDecodeError:
+        flash("Plik musi być zapisany w UTF-8", "danger")
+        return redirect(url_for("doctors_view"))
+    except ScheduleImportError as e:
+        flash("Import przerwany: " + "; ".join(e.errors[:10]), "danger")
+        return redirect(url_for("doctors_view"))
+
+    slot_calendar.invalidate()
+    page_cache.invalidate("schedule", "slots")
+    flash(f"Zaimportowano {added} wpisów grafiku i {closed} wyjątków", "success")
+    return redirect(url_for("doctors_view"))
+
+
 # ---------------------------
 # ROUTES – CZĘŚĆ ROKSY (PACJENT + PANEL REJESTRATORKI)
 # ---------------------------
@@ -478,22 +549,15 @@ def public_home():
 
 
 @app.route("/slots")
+@page_cache.cached("slots", "doctors")
 def show_slots():
-    doctor_id = request.args.get("doctor_id", default=1, type=int)
+    doctors = list_doctors()
+    doctor_id = request.args.get("doctor_id", type=int)
+    if doctor_id is None and doctors:
+        doctor_id = doctors[0]["id"]
     selected_date = request.args.get("date") or dt_date.today().isoformat()
 
-    all_slots = get_slots_for(selected_date)
-
-    booked_slot_ids = {
-        a["slot_id"]
-        for a in appointments
-        if a["date"] == selected_date and a["status"] == "BOOKED"
-    }
-
-    slots = [
-        s for s in all_slots
-        if s["doctor_id"] == doctor_id and s["slot_id"] not in booked_slot_ids
-    ]
+    slots = availability.free_slots(doctor_id, selected_date)
 
     return render_template(
         "slots.html",
@@ -504,6 +568,20 @@ def show_slots():
     )
 
 
+@app.route("/slots/next")
+def next_slots():
+    limit, days, doctor_id = next_slots_args(request.args)
+
+    slots = availability.next_free_slots(limit=limit, doctor_id=doctor_id, days=days)
+
+    return render_template(
+        "next_slots.html",
+        doctors=list_doctors(),
+        slots=slots,
+        selected_doctor_id=doctor_id,
+    )
+
+
 @app.route("/book")
 def book_form():
     slot_id = request.args.get("slot_id", type=int)
@@ -512,19 +590,12 @@ def book_form():
     if slot_id is None or date is None:
         return "Brak wymaganych parametrów.", 400
 
-    all_slots = get_slots_for(date)
-    slot = next((s for s in all_slots if s["slot_id"] == slot_id), None)
+    slot = find_slot(date, slot_id)
 
     if slot is None:
         return "Nie znaleziono wybranego terminu.", 404
 
-    already_booked = any(
-        a["slot_id"] == slot_id
-        and a["date"] == date
-        and a["status"] == "BOOKED"
-        for a in appointments
-    )
-    if already_booked:
+    if bookings.is_taken(slot["doctor_id"], date, slot_id):
         return (
             "<h3>Termin zajęty ❌</h3>"
             "<p>Wybrany termin został już zarezerwowany.</p>"
@@ -535,29 +606,52 @@ def book_form():
     return render_template("book.html", slot=slot)
 
 
+def estimate_entry_time(day, first_time, own_time, queue_number, avg_visit_min):
+    """
+    Kolejka dnia rusza o pierwszym zajętym terminie i przesuwa się o średni czas
+    wizyty lekarza na pacjenta – ale nikt nie wchodzi przed godziną swojego terminu.
+    """
+    start = dt_datetime.strptime(day + " " + first_time, "%Y-%m-%d %H:%M")
+    estimated_dt = start + timedelta(minutes=(queue_number - 1) * avg_visit_min)
+    return max(estimated_dt.strftime("%H:%M"), own_time)
+
+
+def day_queue(doctor_id, day):
+    """
+    Rezerwacje dnia lekarza z numerem w kolejce i przybliżonym czasem wejścia –
+    przeliczane hurtem dla całego dnia. Liczone z bazy (nie z maski dostępności
+    procesu), więc wszystkie procesy serwera pokazują te same numery, także dla
+    rezerwacji spoza bieżącej siatki terminów.
+    """
+    todays = bookings.for_doctor_day(doctor_id, day)
+    avg_visit_min = eta_engine.expected_minutes(doctor_id)
+    for queue_number, appt in enumerate(todays, start=1):
+        appt["queue_number"] = queue_number
+        appt["estimated_time"] = estimate_entry_time(
+            day, todays[0]["time"], appt["time"], queue_number, avg_visit_min
+        )
+    return todays
+
+
+def queue_info(appt):
+    """Numer w kolejce i przybliżony czas wejścia dla rezerwacji."""
+    own = next(a for a in day_queue(appt["doctor_id"], appt["date"]) if a["id"] == appt["id"])
+    return own["queue_number"], own["estimated_time"]
+
+
 @app.route("/confirm", methods=["POST"])
 def confirm():
-    global next_appointment_id
-
     slot_id = request.form.get("slot_id", type=int)
     patient_name = request.form.get("patient_name", "").strip()
     email = request.form.get("email", "").strip()
     reason = request.form.get("reason", "")
     date = request.form.get("date")
 
-    if len(patient_name) < 3:
-        return (
-            "<h3>Błąd ❌</h3>"
-            "<p>Imię i nazwisko musi mieć co najmniej 3 znaki.</p>"
-            "<a href='/slots'>Wróć</a>",
-            400,
-        )
-
-    email_regex = r"^[^@]+@[^@]+\.[^@]+$"
-    if not re.match(email_regex, email):
+    error = validate_patient(patient_name, email)
+    if error:
         return (
             "<h3>Błąd ❌</h3>"
-            "<p>Niepoprawny adres e-mail.</p>"
+            f"<p>{error}</p>"
             "<a href='/slots'>Wróć</a>",
             400,
         )
@@ -565,17 +659,12 @@ def confirm():
     if slot_id is None or date is None:
         return "Brak danych rezerwacji.", 400
 
-    all_slots = get_slots_for(date)
-    slot = next((s for s in all_slots if s["slot_id"] == slot_id), None)
+    slot = find_slot(date, slot_id)
     if slot is None:
         return "Nie znaleziono terminu do rezerwacji.", 404
 
-    if any(
-        a["slot_id"] == slot_id
-        and a["date"] == date
-        and a["status"] == "BOOKED"
-        for a in appointments
-    ):
+    appt = bookings.book(slot, patient_name, email=email, reason=reason)
+    if appt is None:
         return (
             "<h3>Termin zajęty ❌</h3>"
             "<p>Wybrany termin został już zarezerwowany.</p>"
@@ -583,33 +672,7 @@ def confirm():
             400,
         )
 
-    appt = {
-        "id": next_appointment_id,
-        "slot_id": slot_id,
-        "doctor_id": slot["doctor_id"],
-        "doctor_name": slot["doctor_name"],
-        "date": slot["date"],
-        "time": slot["time"],
-        "patient_name": patient_name,
-        "email": email,
-        "reason": reason,
-        "status": "BOOKED",
-    }
-    appointments.append(appt)
-    next_appointment_id += 1
-
-    todays = [
-        a for a in appointments
-        if a["doctor_id"] == appt["doctor_id"]
-        and a["date"] == appt["date"]
-        and a["status"] == "BOOKED"
-    ]
-    todays_sorted = sorted(todays, key=lambda x: x["time"])
-    queue_number = [a["id"] for a in todays_sorted].index(appt["id"]) + 1
-
-    start = dt_datetime.strptime(appt["date"] + " " + appt["time"], "%Y-%m-%d %H:%M")
-    estimated_dt = start + timedelta(minutes=(queue_number - 1) * AVG_VISIT_MIN)
-    estimated_time = estimated_dt.strftime("%H:%M")
+    queue_number, estimated_time = queue_info(appt)
 
     return render_template(
         "confirm.html",
@@ -617,43 +680,37 @@ def confirm():
         queue_number=queue_number,
         estimated_time=estimated_time,
         appointment_id=appt["id"],
+        cancel_token=appt["cancel_token"],
     )
 
 
-@app.route("/cancel/<int:appointment_id>")
-def cancel_appointment(appointment_id: int):
-    appt = next((a for a in appointments if a["id"] == appointment_id), None)
+@app.route("/booking/<token>/cancel")
+def cancel_by_token_form(token):
+    appt = bookings.get_by_token(token)
     if appt is None:
         return "Nie znaleziono rezerwacji.", 404
+    return render_template("cancel_confirm.html", appointment=appt, token=token)
 
-    appt["status"] = "CANCELLED"
 
-    return render_template("cancel.html", appointment=appt)
+@app.route("/booking/<token>/cancel", methods=["POST"])
+def cancel_by_token(token):
+    appt = bookings.get_by_token(token)
+    if appt is None:
+        return "Nie znaleziono rezerwacji.", 404
+    return render_template("cancel.html", appointment=bookings.cancel(appt["id"]))
 
 
 @app.route("/reschedule/<int:appointment_id>")
 def reschedule_form(appointment_id: int):
-    appt = next((a for a in appointments if a["id"] == appointment_id), None)
-    if appt is None or appt["status"] != "BOOKED":
+    appt = bookings.get(appointment_id)
+    if appt is None or appt["status"] != BOOKED:
         return "Nie znaleziono aktywnej rezerwacji.", 404
 
     selected_date = request.args.get("date") or appt["date"]
-    all_slots = get_slots_for(selected_date)
-
-    booked_slot_ids = {
-        a["slot_id"]
-        for a in appointments
-        if a["doctor_id"] == appt["doctor_id"]
-        and a["date"] == selected_date
-        and a["status"] == "BOOKED"
-        and a["id"] != appointment_id
-    }
 
-    slots = [
-        s for s in all_slots
-        if s["doctor_id"] == appt["doctor_id"]
-        and s["slot_id"] not in booked_slot_ids
-    ]
+    # obecny termin pacjenta też pokazujemy jako dostępny
+    own_slot = appt["slot_id"] if appt["date"] == selected_date else None
+    slots = availability.free_slots(appt["doctor_id"], selected_date, also_free=own_slot)
 
     return render_template(
         "reschedule.html",
@@ -665,8 +722,8 @@ def reschedule_form(appointment_id: int):
 
 @app.route("/reschedule/<int:appointment_id>", methods=["POST"])
 def reschedule_save(appointment_id: int):
-    appt = next((a for a in appointments if a["id"] == appointment_id), None)
-    if appt is None or appt["status"] != "BOOKED":
+    appt = bookings.get(appointment_id)
+    if appt is None or appt["status"] != BOOKED:
         return "Nie znaleziono aktywnej rezerwacji.", 404
 
     slot_id = request.form.get("slot_id", type=int)
@@ -675,18 +732,12 @@ def reschedule_save(appointment_id: int):
     if slot_id is None or date is None:
         return "Brak danych.", 400
 
-    all_slots = get_slots_for(date)
-    slot = next((s for s in all_slots if s["slot_id"] == slot_id), None)
+    slot = find_slot(date, slot_id)
     if slot is None:
         return "Nie znaleziono wybranego terminu.", 404
 
-    if any(
-        a["slot_id"] == slot_id
-        and a["date"] == date
-        and a["status"] == "BOOKED"
-        and a["id"] != appointment_id
-        for a in appointments
-    ):
+    appt = bookings.reschedule(appointment_id, slot)
+    if appt is None:
         return (
             "<h3>Termin zajęty ❌</h3>"
             "<p>Wybrany termin został już zarezerwowany.</p>"
@@ -694,24 +745,7 @@ def reschedule_save(appointment_id: int):
             400,
         )
 
-    appt["slot_id"] = slot_id
-    appt["doctor_id"] = slot["doctor_id"]
-    appt["doctor_name"] = slot["doctor_name"]
-    appt["date"] = slot["date"]
-    appt["time"] = slot["time"]
-
-    todays = [
-        a for a in appointments
-        if a["doctor_id"] == appt["doctor_id"]
-        and a["date"] == appt["date"]
-        and a["status"] == "BOOKED"
-    ]
-    todays_sorted = sorted(todays, key=lambda x: x["time"])
-    queue_number = [a["id"] for a in todays_sorted].index(appt["id"]) + 1
-
-    start = dt_datetime.strptime(appt["date"] + " " + appt["time"], "%Y-%m-%d %H:%M")
-    estimated_dt = start + timedelta(minutes=(queue_number - 1) * AVG_VISIT_MIN)
-    estimated_time = estimated_dt.strftime("%H:%M")
+    queue_number, estimated_time = queue_info(appt)
 
     return render_template(
         "confirm.html",
@@ -719,30 +753,100 @@ def reschedule_save(appointment_id: int):
         queue_number=queue_number,
         estimated_time=estimated_time,
         appointment_id=appt["id"],
+        cancel_token=appt["cancel_token"],
+    )
+
+
+# ---------------------------
+# LISTA OCZEKUJĄCYCH
+# ---------------------------
+
+@app.route("/waitlist")
+def waitlist_form():
+    form = {
+        "doctor_id": request.args.get("doctor_id", type=int),
+        "date_from": request.args.get("date") or dt_date.today().isoformat(),
+    }
+    return render_template("waitlist.html", doctors=list_doctors(), form=form, entry=None)
+
+
+@app.route("/waitlist", methods=["POST"])
+def waitlist_join():
+    form = request.form.to_dict()
+    form["doctor_id"] = request.form.get("doctor_id", type=int)
+    try:
+        entry = waitlist.add(
+            form.get("patient_name", "").strip(),
+            form.get("email", "").strip(),
+            form.get("date_from"),
+            form.get("date_to") or None,
+            doctor_id=form["doctor_id"],
+            time_from=form.get("time_from") or None,
+            time_to=form.get("time_to") or None,
+        )
+    except WaitlistError as e:
+        return render_template(
+            "waitlist.html", doctors=list_doctors(), form=form, entry=None, error=str(e)
+        ), 400
+
+    return render_template(
+        "waitlist.html",
+        entry=entry,
+        hold_minutes=waitlist.config["WAITLIST_HOLD_MINUTES"],
     )
 
 
+OFFER_MESSAGES = {
+    "accepted": "Termin został już zarezerwowany.",
+    "declined": "Oferta została odrzucona.",
+    "expired": "Czas na potwierdzenie terminu minął.",
+}
+
+
+@app.route("/waitlist/offer/<token>", methods=["GET", "POST"])
+def waitlist_offer(token):
+    offer = waitlist.get_offer(token)
+    if offer is None:
+        return "Nie znaleziono oferty.", 404
+
+    message = None
+    if request.method == "POST":
+        action = request.form.get("action")
+        if action == "accept":
+            appt = waitlist.accept(token)
+            if appt is not None:
+                queue_number, estimated_time = queue_info(appt)
+                return render_template(
+                    "confirm.html",
+                    patient_name=appt["patient_name"],
+                    queue_number=queue_number,
+                    estimated_time=estimated_time,
+                    appointment_id=appt["id"],
+                    cancel_token=appt["cancel_token"],
+                )
+        elif action in ("decline", "leave"):
+            if waitlist.decline(token, leave=action == "leave"):
+                message = ("Wypisano z listy oczekujących." if action == "leave"
+                           else "Termin zwolniony – zaproponujemy kolejny pasujący.")
+        else:
+            return "Nieznana akcja.", 400
+        offer = waitlist.get_offer(token)
+
+    expired = offer["expires_at"] <= dt_datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if message is None and (offer["status"] != "open" or expired):
+        message = OFFER_MESSAGES.get(offer["status"], OFFER_MESSAGES["expired"])
+
+    return render_template("offer.html", offer=offer, message=message, expired=expired)
+
+
 @app.route("/desk")
 def desk():
+    doctors = list_doctors()
     doctor_id = request.args.get("doctor_id", type=int)
-    selected_doctor_id = doctor_id or doctors[0]["id"]
+    selected_doctor_id = doctor_id or (doctors[0]["id"] if doctors else None)
     selected_date = request.args.get("date") or dt_date.today().isoformat()
 
-    all_slots = get_slots_for(selected_date)
-
-    booked_slot_ids = {
-        a["slot_id"]
-        for a in appointments
-        if a["doctor_id"] == selected_doctor_id
-        and a["date"] == selected_date
-        and a["status"] == "BOOKED"
-    }
-
-    free_slots = [
-        s for s in all_slots
-        if s["doctor_id"] == selected_doctor_id
-        and s["slot_id"] not in booked_slot_ids
-    ]
+    free_slots = availability.free_slots(selected_doctor_id, selected_date)
 
     return render_template(
         "desk.html",
@@ -750,14 +854,13 @@ def desk():
         selected_doctor_id=selected_doctor_id,
         selected_date=selected_date,
         free_slots=free_slots,
+        day_bookings=day_queue(selected_doctor_id, selected_date),
         created_appt=None,
     )
 
 
 @app.route("/desk", methods=["POST"])
 def desk_add():
-    global next_appointment_id
-
     patient_name = request.form.get("patient_name", "").strip()
     slot_id = request.form.get("slot_id", type=int)
     date = request.form.get("date")
@@ -765,17 +868,12 @@ def desk_add():
     if not patient_name or slot_id is None or date is None:
         return "Brak wymaganych danych.", 400
 
-    all_slots = get_slots_for(date)
-    slot = next((s for s in all_slots if s["slot_id"] == slot_id), None)
+    slot = find_slot(date, slot_id)
     if slot is None:
         return "Nie znaleziono wybranego terminu.", 404
 
-    if any(
-        a["slot_id"] == slot_id
-        and a["date"] == date
-        and a["status"] == "BOOKED"
-        for a in appointments
-    ):
+    appt = bookings.book(slot, patient_name)
+    if appt is None:
         return (
             "<h3>Termin zajęty ❌</h3>"
             "<p>Wybrany termin został już zarezerwowany.</p>"
@@ -783,45 +881,23 @@ def desk_add():
             400,
         )
 
-    appt = {
-        "id": next_appointment_id,
-        "slot_id": slot_id,
-        "doctor_id": slot["doctor_id"],
-        "doctor_name": slot["doctor_name"],
-        "date": slot["date"],
-        "time": slot["time"],
-        "patient_name": patient_name,
-        "email": None,
-        "reason": None,
-        "status": "BOOKED",
-    }
-    appointments.append(appt)
-    next_appointment_id += 1
-
     selected_doctor_id = slot["doctor_id"]
     selected_date = date
 
-    all_slots = get_slots_for(selected_date)
-    booked_slot_ids = {
-        a["slot_id"]
-        for a in appointments
-        if a["doctor_id"] == selected_doctor_id
-        and a["date"] == selected_date
-        and a["status"] == "BOOKED"
-    }
-    free_slots = [
-        s for s in all_slots
-        if s["doctor_id"] == selected_doctor_id
-        and s["slot_id"] not in booked_slot_ids
-    ]
+    free_slots = availability.free_slots(selected_doctor_id, selected_date)
+    day_bookings = day_queue(selected_doctor_id, selected_date)
+    created = next(a for a in day_bookings if a["id"] == appt["id"])
 
     return render_template(
         "desk.html",
-        doctors=doctors,
+        doctors=list_doctors(),
         selected_doctor_id=selected_doctor_id,
         selected_date=selected_date,
         free_slots=free_slots,
+        day_bookings=day_bookings,
         created_appt=appt,
+        queue_number=created["queue_number"],
+        estimated_time=created["estimated_time"],
     )
 
 
@@ -0,0 +1,126 @@
+"""
+Archiwum pacjentów.
+
+Tabela `patients` trzyma tylko bieżące kolejki. Raz dziennie (cron:
+`flask --app app patients rollover`) obsłużeni pacjenci oraz pacjenci,
+którzy czekali od poprzednich dni i nie zostali obsłużeni, są przenoszeni
+do `patients_archive` – partiami, każda w osobnej krótkiej transakcji,
+żeby nie blokować rejestracji na czas całego przeniesienia.
+
+Historia wizyt (history()) łączy archiwum z obsłużonymi dziś pacjentami,
+którzy jeszcze są w `patients`.
+"""
+from datetime import date as dt_date, datetime as dt_datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+
+from database import get_conn, immediate_transaction, queue_changed
+
+ARCHIVE_BATCH = 500
+STALE_AFTER_DAYS = 1      # oczekujący dodani przed dzisiejszym dniem (0 = oczekujących nie ruszamy)
+HISTORY_PAGE_SIZE = 100
+STALE_STATUS = "nieobsłużony"
+
+
+def _move_batches(conn, where, params, status, batch, now):
+    """Przenosi pacjentów spełniających `where` partiami. Zwraca (liczba, id lekarzy)."""
+    moved = 0
+    doctors = set()
+    while True:
+        with immediate_transaction(conn):
+            rows = conn.execute(
+                f"SELECT id, doctor_id FROM patients WHERE {where} LIMIT ?", (*params, batch)
+            ).fetchall()
+            if not rows:
+                break
+            ids = [r["id"] for r in rows]
+            placeholders = ",".join("?" * len(ids))
+            conn.execute(f"""
+                INSERT INTO patients_archive
+                    (id, name, status, doctor_id, note, added_at, served_at, visit_date, archived_at)
+                SELECT id, name, COALESCE(?, status), doctor_id, note, added_at, served_at,
+                       date(COALESCE(served_at, added_at, ?)), ?
+                FROM patients WHERE id IN ({placeholders})
+            """, (status, now, now, *ids))
+            conn.execute(f"DELETE FROM patients WHERE id IN ({placeholders})", ids)
+        moved += len(rows)
+        doctors.update(r["doctor_id"] for r in rows)
+    return moved, doctors
+
+
+def rollover(stale_after_days=STALE_AFTER_DAYS, batch=ARCHIVE_BATCH, now=None):
+    """
+    Przenosi obsłużonych i porzuconych pacjentów do archiwum.
+    Zwraca (obsłużeni, porzuceni) – liczby przeniesionych wierszy.
+    """
+    conn = get_conn()
+    now = now or dt_datetime.now()
+    now_text = now.strftime("%Y-%m-%d %H:%M:%S")
+
+    served, _ = _move_batches(conn, "status='obsłużony'", (), None, batch, now_text)
+
+    stale, doctors = 0, set()
+    if stale_after_days > 0:
+        cutoff = (now.date() - timedelta(days=stale_after_days - 1)).isoformat()
+        # bez added_at (pacjenci sprzed tej kolumny, dane testowe) nie wiemy, od kiedy
+        # czekają – traktujemy ich jak porzuconych, inaczej zostaliby w kolejce na zawsze
+        stale, doctors = _move_batches(
+            conn, "status='oczekuje' AND (added_at IS NULL OR added_at < ?)", (cutoff,),
+            STALE_STATUS, batch, now_text
+        )
+    # zniknęli pacjenci z bieżących kolejek – ekrany (SSE) dostaną nowy stan
+    for doctor_id in doctors:
+        queue_changed(doctor_id, "archived")
+    return served, stale
+
+
+def history(doctor_id=None, date_from=None, date_to=None, limit=HISTORY_PAGE_SIZE, offset=0):
+    """
+    Wizyty (najnowsze pierwsze) z archiwum i dzisiejsi obsłużeni z bieżącej tabeli.
+    Daty jako "YYYY-MM-DD"; oba zapytania idą po indeksach (doctor_id, data).
+    """
+    date_from = date_from or "0000-00-00"
+    date_to = date_to or "9999-12-31"
+    doctor_filter = "AND doctor_id = :doctor_id" if doctor_id is not None else ""
+    return get_conn().execute(f"""
+        SELECT id, name, status, doctor_id, note, added_at, served_at, visit_date
+        FROM (
+            SELECT id, name, status, doctor_id, note, added_at, served_at,
+                   date(COALESCE(served_at, added_at, datetime('now', 'localtime'))) AS visit_date
+            FROM patients
+            WHERE status='obsłużony' {doctor_filter}
+            UNION ALL
+            SELECT id, name, status, doctor_id, note, added_at, served_at, visit_date
+            FROM patients_archive
+            WHERE visit_date BETWEEN :date_from AND :date_to {doctor_filter}
+        )
+        WHERE visit_date BETWEEN :date_from AND :date_to
+        ORDER BY visit_date DESC, id DESC
+        LIMIT :limit OFFSET :offset
+    """, {
+        "doctor_id": doctor_id, "date_from": date_from, "date_to": date_to,
+        "limit": limit, "offset": offset,
+    }).fetchall()
+
+
+# ---------------------------
+# POLECENIA CLI
+# ---------------------------
+
+patients_cli = AppGroup("patients", help="Pacjenci i archiwum kolejek.")
+
+
+@patients_cli.command("rollover")
+@click.option("--stale-days", type=int, default=STALE_AFTER_DAYS, show_default=True,
+              help="Oczekujący dodani wcześniej niż tyle dni temu trafiają do archiwum (0 = nie).")
+@click.option("--batch", type=int, default=ARCHIVE_BATCH, show_default=True,
+              help="Ile wierszy w jednej transakcji.")
+def rollover_command(stale_days, batch):
+    """Przenosi obsłużonych i porzuconych pacjentów do archiwum (uruchamiać raz dziennie)."""
+    served, stale = rollover(stale_after_days=stale_days, batch=batch)
+    click.echo(f"Zarchiwizowano: obsłużonych {served}, nieobsłużonych {stale} ({dt_date.today()}).")
+
+
+def init_app(app):
+    app.cli.add_command(patients_cli)
@@ -0,0 +1,265 @@
+"""
+Logowanie personelu: hasła haszowane (werkzeug, koszt ustawiany w PASSWORD_HASH_METHOD),
+ograniczenie liczby nieudanych prób (token bucket na login i adres IP) oraz
+krótkotrwały cache ról i statusu kont, dzięki któremu login_required sprawdza
+konto w bazie najwyżej raz na AUTH_CACHE_TTL sekund, a nie przy każdym żądaniu.
+
+Haszowanie i sprawdzanie haseł działa w wątku żądania, ale naraz liczy je
+najwyżej AUTH_WORKERS żądań (semafor) – scrypt zajmuje ~32 MB pamięci na
+wywołanie, więc fala logowań nie wyczerpie pamięci serwera; pozostałe czekają.
+
+Hasła zapisane otwartym tekstem w starych bazach haszuje migracja 6 (migrations.py);
+hasze o innym koszcie niż aktualny PASSWORD_HASH_METHOD są zastępowane nowym
+przy pierwszym udanym logowaniu.
+"""
+import hmac
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import click
+from flask import current_app, session
+from flask.cli import AppGroup
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from database import get_conn
+
+PASSWORD_HASH_METHOD = "scrypt:32768:8:1"
+AUTH_WORKERS = 4
+AUTH_CACHE_TTL = 30
+AUTH_CACHE_SIZE = 1024
+LOGIN_BURST = 5              # tyle nieudanych prób pod rząd
+LOGIN_REFILL_SECONDS = 30    # potem jedna próba na tyle sekund
+LIMITER_MAX_KEYS = 10000
+
+HASH_PREFIXES = ("scrypt:", "pbkdf2:")
+
+
+class TokenBucket:
+    """Żetony na klucz (login, IP): nieudana próba zabiera żeton, co refill sekund przybywa jeden."""
+
+    def __init__(self, burst, refill_seconds, max_keys=LIMITER_MAX_KEYS):
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # klucz -> [żetony, czas ostatniego uzupełnienia]
+
+    def _tokens(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        return min(self.burst, bucket[0] + (now - bucket[1]) / self.refill_seconds)
+
+    def allow(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return all(self._tokens(key, now) >= 1 for key in keys)
+
+    def consume(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._buckets[key] = [max(0.0, self._tokens(key, now) - 1), now]
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+    def reset(self, keys):
+        with self._lock:
+            for key in keys:
+                self._buckets.pop(key, None)
+
+
+class UserCache:
+    """user_id -> (rola, aktywny, doctor_id) ważne przez ttl sekund."""
+
+    def __init__(self, ttl, maxsize=AUTH_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                return None
+            self._users.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = (user, time.monotonic())
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.maxsize:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+
+def _user_info(row):
+    return {"role": row["role"], "active": bool(row["active"]), "doctor_id": row["doctor_id"]}
+
+
+class Auth:
+
+    def __init__(self):
+        self.hash_method = PASSWORD_HASH_METHOD
+        self.limiter = TokenBucket(LOGIN_BURST, LOGIN_REFILL_SECONDS)
+        self.users = UserCache(AUTH_CACHE_TTL)
+        self._slots = threading.BoundedSemaphore(AUTH_WORKERS)
+        self._dummy_hash = None
+
+    def init_app(self, app):
+        self.hash_method = app.config.get("PASSWORD_HASH_METHOD", self.hash_method)
+        self.limiter = TokenBucket(
+            int(app.config.get("LOGIN_BURST", LOGIN_BURST)),
+            float(app.config.get("LOGIN_REFILL_SECONDS", LOGIN_REFILL_SECONDS)),
+        )
+        self.users = UserCache(float(app.config.get("AUTH_CACHE_TTL", AUTH_CACHE_TTL)))
+        self._slots = threading.BoundedSemaphore(int(app.config.get("AUTH_WORKERS", AUTH_WORKERS)))
+        app.cli.add_command(users_cli)
+        app.extensions["auth"] = self
+
+    # --- hasła ---
+
+    def _run(self, fn, *args):
+        with self._slots:
+            return fn(*args)
+
+    def hash_password(self, password):
+        return self._run(generate_password_hash, password, self.hash_method)
+
+    @staticmethod
+    def _check(stored, password):
+        if stored.startswith(HASH_PREFIXES):
+            return check_password_hash(stored, password)
+        return hmac.compare_digest(stored.encode(), password.encode())
+
+    def verify_password(self, stored, password):
+        return self._run(self._check, stored, password)
+
+    def needs_rehash(self, stored):
+        return not stored.startswith(self.hash_method + "$")
+
+    def authenticate(self, username, password):
+        """Wiersz użytkownika przy poprawnym loginie i haśle aktywnego konta, inaczej None."""
+        conn = get_conn()
+        user = conn.execute(
+            "SELECT id, username, password, role, doctor_id, active FROM users WHERE username=?",
+            (username,)
+        ).fetchone()
+
+        if user is None:
+            # tyle samo pracy co dla istniejącego konta – czas odpowiedzi nie zdradza loginów
+            if self._dummy_hash is None:
+                self._dummy_hash = self.hash_password("-")
+            self.verify_password(self._dummy_hash, password)
+            return None
+        if not self.verify_password(user["password"], password) or not user["active"]:
+            return None
+
+        if self.needs_rehash(user["password"]):
+            with conn:
+                conn.execute(
+                    "UPDATE users SET password=? WHERE id=?",
+                    (self.hash_password(password), user["id"])
+                )
+        self.users.put(user["id"], _user_info(user))
+        return user
+
+    # --- sesja ---
+
+    def current_user(self):
+        """Rola/status zalogowanego użytkownika (z cache albo bazy); None, gdy konta brak lub jest wyłączone."""
+        user_id = session.get("user_id")
+        if user_id is None:
+            return None
+        user = self.users.get(user_id)
+        if user is None:
+            row = get_conn().execute(
+                "SELECT role, doctor_id, active FROM users WHERE id=?", (user_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            user = _user_info(row)
+            self.users.put(user_id, user)
+        return user if user["active"] else None
+
+
+# ---------------------------
+# POLECENIA CLI
+# ---------------------------
+
+users_cli = AppGroup("users", help="Konta personelu.")
+
+
+def _auth():
+    return current_app.extensions["auth"]
+
+
+def _set_active(username, active):
+    conn = get_conn()
+    with conn:
+        cur = conn.execute("UPDATE users SET active=? WHERE username=?", (int(active), username))
+    if cur.rowcount == 0:
+        raise click.ClickException(f"Nie ma użytkownika {username}")
+    _auth().users.invalidate()
+
+
+@users_cli.command("create")
+@click.argument("username")
+@click.option("--role", type=click.Choice(["rejestratorka", "lekarz"]), required=True)
+@click.option("--doctor-id", type=int, help="Lekarz, którego kolejkę widzi konto lekarza.")
+@click.password_option()
+def create_user(username, role, doctor_id, password):
+    """Zakłada konto personelu."""
+    conn = get_conn()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO users (username, password, role, doctor_id) VALUES (?, ?, ?, ?)",
+                (username, _auth().hash_password(password), role, doctor_id)
+            )
+    except sqlite3.IntegrityError:
+        raise click.ClickException(f"Użytkownik {username} już istnieje")
+    click.echo("Konto utworzone.")
+
+
+@users_cli.command("set-password")
+@click.argument("username")
+@click.password_option()
+def set_password(username, password):
+    """Ustawia nowe hasło."""
+    conn = get_conn()
+    with conn:
+        cur = conn.execute(
+            "UPDATE users SET password=? WHERE username=?",
+            (_auth().hash_password(password), username)
+        )
+    if cur.rowcount == 0:
+        raise click.ClickException(f"Nie ma użytkownika {username}")
+    click.echo("Hasło zmienione.")
+
+
+@users_cli.command("deactivate")
+@click.argument("username")
+def deactivate_user(username):
+    """Blokuje konto (otwarte sesje wygasną najpóźniej po AUTH_CACHE_TTL sekund)."""
+    _set_active(username, False)
+    click.echo("Konto zablokowane.")
+
+
+@users_cli.command("activate")
+@click.argument("username")
+def activate_user(username):
+    """Odblokowuje konto."""
+    _set_active(username, True)
+    click.echo("Konto odblokowane.")
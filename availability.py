@@ -0,0 +1,189 @@
+"""
+Indeks wolnych terminów: jedna maska bitowa na (lekarz, dzień).
+
+Bit i odpowiada i-temu terminowi z siatki slots.slots_for_day(lekarz, dzień),
+1 = termin wolny. Maska jest liczona raz z tabeli bookings, a potem
+aktualizowana przy rezerwacji, anulowaniu i zmianie terminu (BookingStore
+wywołuje indeks jako słuchacza), więc pytania o dostępność to operacje na
+bitach zamiast przeglądania rezerwacji.
+
+Termin wstrzymany dla oferty z listy oczekujących (HELD) nie jest wolny, ale
+do kolejki dnia się nie liczy, dopóki pacjent nie potwierdzi oferty.
+
+Rezerwacje z innych procesów indeks widzi po AVAILABILITY_TTL sekund – dlatego
+samo zajęcie terminu i tak zawsze rozstrzyga unikalny indeks w bazie, a numery
+w kolejce dnia (app.day_queue) są liczone z bazy, nie z maski.
+"""
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from datetime import date as dt_date, datetime as dt_datetime, timedelta
+from itertools import islice
+
+from slots import list_doctors, slots_for_day
+
+AVAILABILITY_TTL = 30
+AVAILABILITY_MAX_DAYS = 20000
+NEXT_SLOTS_LIMIT = 10
+NEXT_SLOTS_MAX_LIMIT = 50
+NEXT_SLOTS_DAYS = 90
+NEXT_SLOTS_MAX_DAYS = 180
+
+
+def next_slots_args(args):
+    """(limit, days, doctor_id) dla next_free_slots z parametrów żądania, przycięte do dozwolonych zakresów."""
+    limit = args.get("limit", default=NEXT_SLOTS_LIMIT, type=int)
+    days = args.get("days", default=NEXT_SLOTS_DAYS, type=int)
+    return (max(1, min(limit, NEXT_SLOTS_MAX_LIMIT)),
+            max(1, min(days, NEXT_SLOTS_MAX_DAYS)),
+            args.get("doctor_id", type=int))
+
+
+class _DayMask:
+    __slots__ = ("grid", "positions", "free", "loaded_at")
+
+    def __init__(self, grid, positions, free, loaded_at):
+        self.grid = grid
+        self.positions = positions
+        self.free = free
+        self.loaded_at = loaded_at
+
+
+class AvailabilityIndex:
+
+    def __init__(self, bookings):
+        self._bookings = bookings
+        self._lock = threading.Lock()
+        self._days = OrderedDict()
+        bookings.add_listener(self._on_booking_change)
+
+    # --- utrzymanie maski ---
+
+    def _load(self, doctor_id, day, grid):
+        positions = {s["slot_id"]: i for i, s in enumerate(grid)}
+        free = (1 << len(grid)) - 1
+        for slot_id in self._bookings.booked_slot_ids(doctor_id, day):
+            i = positions.get(slot_id)
+            if i is not None:
+                free &= ~(1 << i)
+        return _DayMask(grid, positions, free, time.monotonic())
+
+    def _day(self, doctor_id, day):
+        grid = slots_for_day(doctor_id, day)
+        key = (doctor_id, day)
+        with self._lock:
+            entry = self._days.get(key)
+            # nowa siatka (zmiana grafiku) albo przeterminowany wpis -> przeliczamy
+            if (entry is not None and entry.grid is grid
+                    and time.monotonic() - entry.loaded_at <= AVAILABILITY_TTL):
+                self._days.move_to_end(key)
+                return entry
+
+        entry = self._load(doctor_id, day, grid)
+        with self._lock:
+            self._days[key] = entry
+            self._days.move_to_end(key)
+            while len(self._days) > AVAILABILITY_MAX_DAYS:
+                self._days.popitem(last=False)
+        return entry
+
+    def _set_bit(self, doctor_id, day, slot_id, free):
+        with self._lock:
+            entry = self._days.get((doctor_id, day))
+            if entry is None:
+                return
+            i = entry.positions.get(slot_id)
+            if i is None:
+                return
+            if free:
+                entry.free |= 1 << i
+            else:
+                entry.free &= ~(1 << i)
+
+    def _on_booking_change(self, event, appt, previous=None):
+        if event in ("cancelled", "rescheduled", "released") and previous is not None:
+            self._set_bit(previous["doctor_id"], previous["date"], previous["slot_id"], True)
+        if event in ("booked", "rescheduled", "held"):
+            self._set_bit(appt["doctor_id"], appt["date"], appt["slot_id"], False)
+
+    def invalidate(self):
+        with self._lock:
+            self._days.clear()
+
+    # --- zapytania ---
+
+    def free_mask(self, doctor_id, day):
+        return self._day(doctor_id, day).free
+
+    def is_free(self, doctor_id, day, slot_id):
+        entry = self._day(doctor_id, day)
+        i = entry.positions.get(slot_id)
+        return i is not None and bool(entry.free >> i & 1)
+
+    def free_slots(self, doctor_id, day, also_free=None):
+        """
+        Wolne terminy lekarza w danym dniu.
+        also_free – slot_id traktowany jako wolny (np. obecny termin przy zmianie terminu).
+        """
+        entry = self._day(doctor_id, day)
+        mask = entry.free
+        if also_free in entry.positions:
+            mask |= 1 << entry.positions[also_free]
+
+        result = []
+        while mask:
+            low = mask & -mask
+            result.append(entry.grid[low.bit_length() - 1])
+            mask ^= low
+        return result
+
+    def first_free(self, day, doctor_id=None):
+        """Najwcześniejszy wolny termin w danym dniu – jednego lekarza albo wszystkich."""
+        doctor_ids = [doctor_id] if doctor_id is not None else [d["id"] for d in list_doctors()]
+        best = None
+        for did in doctor_ids:
+            entry = self._day(did, day)
+            if not entry.free:
+                continue
+            slot = entry.grid[(entry.free & -entry.free).bit_length() - 1]
+            if best is None or slot["time"] < best["time"]:
+                best = slot
+        return best
+
+    def days_with_availability(self, start_day=None, weeks=4, doctor_id=None):
+        """Daty (YYYY-MM-DD) w najbliższych `weeks` tygodniach z choć jednym wolnym terminem."""
+        start_day = start_day or dt_date.today()
+        doctor_ids = [doctor_id] if doctor_id is not None else [d["id"] for d in list_doctors()]
+        days = []
+        for offset in range(weeks * 7):
+            day = (start_day + timedelta(days=offset)).isoformat()
+            if any(self._day(did, day).free for did in doctor_ids):
+                days.append(day)
+        return days
+
+    def _free_slots_from(self, doctor_id, start_day, days, not_before):
+        """Wolne terminy lekarza po kolei (dzień, godzina) – liczone leniwie dzień po dniu."""
+        for offset in range(days):
+            day = (start_day + timedelta(days=offset)).isoformat()
+            for slot in self.free_slots(doctor_id, day):
+                if (slot["date"], slot["time"]) >= not_before:
+                    yield slot
+
+    def next_free_slots(self, limit=5, doctor_id=None, start_day=None, days=90, now=None):
+        """
+        `limit` najwcześniejszych wolnych terminów w horyzoncie `days` dni.
+        Strumienie terminów poszczególnych lekarzy są już posortowane, więc łączymy je
+        kopcem (heapq.merge) – liczymy tylko tyle dni każdego lekarza, ile potrzeba.
+        """
+        now = now or dt_datetime.now()
+        start_day = start_day or now.date()
+        not_before = (now.date().isoformat(), now.strftime("%H:%M"))
+        doctor_ids = [doctor_id] if doctor_id is not None else [d["id"] for d in list_doctors()]
+
+        streams = [
+            self._free_slots_from(did, start_day, days, not_before)
+            for did in doctor_ids
+        ]
+        merged = heapq.merge(*streams, key=lambda s: (s["date"], s["time"], s["doctor_id"]))
+        return list(islice(merged, limit))
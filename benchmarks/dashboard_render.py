@@ -0,0 +1,104 @@
+"""
+Czas renderowania panelu rejestratorki w zależności od długości kolejki.
+
+Uruchomienie (z katalogu projektu):
+    python benchmarks/dashboard_render.py [--sizes 1000 2000 4000 8000] [--repeat 5]
+
+Działa na tymczasowej bazie. Dla każdego rozmiaru kolejki mierzy:
+  - pełną kolejkę na jednej stronie (cała lista renderowana naraz),
+  - pierwszą stronę (DASHBOARD_PAGE_SIZE pacjentów), tak jak widzi ją rejestratorka,
+  - odświeżanie na żywo tej strony: pierwszą wiadomość SSE (stan strony) i jej
+    ponowny odczyt przez API, razem z rozmiarem odpowiedzi, obok pierwszej
+    wiadomości SSE z całą kolejką (tak działał panel wcześniej).
+Przy liniowym renderowaniu czas na pacjenta (µs/wiersz) dla pełnej kolejki
+jest w przybliżeniu stały, a czas i rozmiar strony nie zależą od długości kolejki.
+"""
+import argparse
+import pathlib
+import sys
+import tempfile
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import database  # noqa: E402
+
+database.DB_PATH = pathlib.Path(tempfile.mkdtemp()) / "bench.db"
+
+import app as clinic  # noqa: E402
+
+
+def fill_queue(doctor_id, size):
+    with clinic.app.app_context():
+        conn = database.get_conn()
+        with conn:
+            conn.execute("DELETE FROM patients WHERE doctor_id=?", (doctor_id,))
+            conn.executemany(
+                "INSERT INTO patients (name, doctor_id, position, status) VALUES (?, ?, ?, 'oczekuje')",
+                ((f"Pacjent {i}", doctor_id, i) for i in range(1, size + 1))
+            )
+
+
+def measure(client, url, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        best = min(best, time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return best
+
+
+def measure_stream(client, url, repeat):
+    """Najlepszy czas i rozmiar pierwszej wiadomości strumienia SSE."""
+    best, size = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url, buffered=False)
+        assert response.status_code == 200, response.status_code
+        stream = iter(response.response)
+        size = len(next(stream))
+        best = min(best, time.perf_counter() - start)
+        response.close()
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 4000, 8000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with clinic.app.app_context():
+        doctor_id = clinic.list_doctors()[0]["id"]
+
+    client = clinic.app.test_client()
+    client.post("/", data={"username": "rejestratorka", "password": "haslo123"})
+
+    page_size = clinic.DASHBOARD_PAGE_SIZE
+    url = f"/dashboard?doctor_id={doctor_id}"
+    events_url = f"/api/v1/doctors/{doctor_id}/queue/events"
+    page_args = f"?offset=0&limit={page_size}"
+    print(f"{'pacjentów':>10} {'cała kolejka [ms]':>18} {'µs/wiersz':>10} {'1. strona [ms]':>15}"
+          f" {'SSE całość [ms/kB]':>19} {'SSE strona [ms/kB]':>19} {'API strona [ms]':>16}")
+    for size in args.sizes:
+        fill_queue(doctor_id, size)
+
+        clinic.DASHBOARD_PAGE_SIZE = size
+        full = measure(client, url, args.repeat)
+        clinic.DASHBOARD_PAGE_SIZE = page_size
+        paged = measure(client, url, args.repeat)
+
+        sse_full, sse_full_size = measure_stream(client, events_url, args.repeat)
+        sse_page, sse_page_size = measure_stream(client, events_url + page_args, args.repeat)
+        api_page = measure(client, f"/api/v1/doctors/{doctor_id}/queue" + page_args, args.repeat)
+
+        print(f"{size:>10} {full * 1000:>18.1f} {full / size * 1e6:>10.1f} {paged * 1000:>15.1f}"
+              f" {sse_full * 1000:>11.1f} / {sse_full_size / 1024:>5.0f}"
+              f" {sse_page * 1000:>11.1f} / {sse_page_size / 1024:>5.0f}"
+              f" {api_page * 1000:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
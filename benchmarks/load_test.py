@@ -0,0 +1,464 @@
+"""
+Test obciążeniowy najczęściej używanych tras aplikacji.
+
+Tryby:
+    # klient testowy Flaska (w procesie, bez sieci)
+    python benchmarks/load_test.py
+
+    # prawdziwy serwer WSGI (werkzeug, wielowątkowy) uruchamiany przez skrypt
+    python benchmarks/load_test.py --server
+
+    # już działający serwer – baza musi być wcześniej zasiana (--seed-only)
+    python benchmarks/load_test.py --db bench.db --seed-only
+    python benchmarks/load_test.py --db bench.db --url http://127.0.0.1:5000
+
+Baza jest zasiewana podaną liczbą lekarzy (z grafikami), pacjentów w kolejkach
+i rezerwacji. Żądania losowane są wg wag z --mix. Wynik: p50/p95/p99, przepustowość,
+średnia liczba zapytań SQL na żądanie (z nagłówka Server-Timing)
+– wypisany w tabeli i zapisany jako JSON (--output). --compare porównuje z
+wcześniejszym plikiem i kończy się kodem 1 przy regresji p95 powyżej --max-regression.
+"""
+import argparse
+import http.cookiejar
+import json
+import pathlib
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date as dt_date, datetime as dt_datetime, timedelta
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+DEFAULT_MIX = "dashboard=25,doctor_panel=20,show_slots=25,add_patient=10,mark_served=8,confirm=7,desk_add=5"
+PASSWORD = "haslo123"
+STAFF_USER = "rejestratorka"
+QUERY_COUNT = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def load_app(db_path):
+    """Importuje aplikację na wskazanej bazie."""
+    import database
+    database.DB_PATH = pathlib.Path(db_path)
+    import app as clinic
+    return clinic
+
+
+def query_count(server_timing):
+    """Liczba zapytań SQL z nagłówka Server-Timing (metrics.py), np. 'db;dur=1.2;desc="3 queries"'."""
+    match = QUERY_COUNT.search(server_timing or "")
+    return int(match.group(1)) if match else None
+
+
+# ---------------------------
+# DANE TESTOWE
+# ---------------------------
+
+def seed(clinic, doctors, patients, bookings, days, rng):
+    import database
+
+    password_hash = clinic.auth.hash_password(PASSWORD)
+    with clinic.app.app_context():
+        conn = database.get_conn()
+        with conn:
+            first_new = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM doctors").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO doctors (id, name, hours) VALUES (?, ?, '08:00-16:00')",
+                ((first_new + i, f"dr Testowy {first_new + i}") for i in range(doctors))
+            )
+            doctor_ids = [r["id"] for r in conn.execute("SELECT id FROM doctors ORDER BY id")]
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (username, password, role, doctor_id) VALUES (?, ?, 'lekarz', ?)",
+                ((f"bench_lekarz{d}", password_hash, d) for d in doctor_ids)
+            )
+            conn.execute("DELETE FROM doctor_schedule")
+            conn.executemany(
+                "INSERT INTO doctor_schedule (doctor_id, day_of_week, start_time, end_time) VALUES (?, ?, ?, ?)",
+                ((d, day, start, end)
+                 for d in doctor_ids for day in range(1, 6)
+                 for start, end in (("08:00", "12:00"), ("12:30", "16:00")))
+            )
+            # pozycja oczekującego jest unikalna w kolejce lekarza – dopisujemy za istniejącymi
+            positions = defaultdict(int, conn.execute(
+                "SELECT doctor_id, MAX(position) FROM patients WHERE status='oczekuje' GROUP BY doctor_id"
+            ).fetchall())
+            rows = []
+            for i in range(patients):
+                d = rng.choice(doctor_ids)
+                positions[d] += 1
+                rows.append((f"Pacjent {i}", d, positions[d]))
+            conn.executemany(
+                "INSERT INTO patients (name, doctor_id, position, status, added_at) "
+                "VALUES (?, ?, ?, 'oczekuje', datetime('now', 'localtime'))",
+                rows
+            )
+        clinic.slot_calendar.invalidate()
+
+        today = dt_date.today()
+        booked = []
+        for i in range(bookings):
+            day = (today + timedelta(days=rng.randrange(1, days + 1))).isoformat()
+            grid = clinic.slot_calendar.slots_for_day(rng.choice(doctor_ids), day)
+            if grid:
+                s = rng.choice(grid)
+                booked.append((s["slot_id"], s["doctor_id"], s["doctor_name"], s["date"], s["time"],
+                               f"Pacjent online {i}", f"p{i}@example.com"))
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO bookings "
+                "(slot_id, doctor_id, doctor_name, date, time, patient_name, email, status, cancel_token) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 'BOOKED', lower(hex(randomblob(16))))",
+                booked
+            )
+        clinic.availability.invalidate()
+
+        waiting = [r["id"] for r in conn.execute("SELECT id FROM patients WHERE status='oczekuje'")]
+    return doctor_ids, waiting
+
+
+# ---------------------------
+# KLIENCI HTTP
+# ---------------------------
+
+class TestClientDriver:
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self._client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code, query_count(response.headers.get("Server-Timing"))
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    def __init__(self, base_url):
+        self._base = base_url.rstrip("/")
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self._base + path, data=body, method=method)
+        try:
+            with self._opener.open(req, timeout=30) as response:
+                response.read()
+                return response.status, query_count(response.headers.get("Server-Timing"))
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, query_count(e.headers.get("Server-Timing"))
+
+
+# ---------------------------
+# SCENARIUSZE
+# ---------------------------
+
+class Scenario:
+    """Losuje żądania zgodnie z wagami; stan (id pacjentów) współdzielony między wątkami."""
+
+    def __init__(self, mix, doctor_ids, waiting, days, rng):
+        self.routes = list(mix)
+        self.weights = [mix[r] for r in self.routes]
+        self.doctor_ids = doctor_ids
+        self.waiting = waiting
+        self.days = days
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._rng = rng
+
+    def _next_seq(self):
+        with self._lock:
+            self._seq += 1
+            return self._seq
+
+    def _future_day(self, rng):
+        day = dt_date.today() + timedelta(days=rng.randrange(1, self.days + 1))
+        while day.isoweekday() > 5:
+            day += timedelta(days=1)
+        return day.isoformat()
+
+    def _slot(self, rng, doctor_id):
+        day = self._future_day(rng)
+        hour, minute = rng.choice([(h, m) for h in range(8, 16) for m in (0, 30) if (h, m) != (12, 0)])
+        return {"slot_id": doctor_id * 10000 + hour * 100 + minute, "date": day}
+
+    def next_request(self, rng):
+        route = rng.choices(self.routes, self.weights)[0]
+        doctor_id = rng.choice(self.doctor_ids)
+        n = self._next_seq()
+        if route == "dashboard":
+            return route, "staff", "GET", f"/dashboard?doctor_id={doctor_id}", None
+        if route == "doctor_panel":
+            return route, "doctor", "GET", "/doctor", None
+        if route == "show_slots":
+            return route, None, "GET", f"/slots?doctor_id={doctor_id}&date={self._future_day(rng)}", None
+        if route == "add_patient":
+            return route, "staff", "POST", "/add_patient", {"name": f"Nowy {n}", "doctor_id": doctor_id}
+        if route == "mark_served":
+            with self._lock:
+                patient_id = self.waiting.pop() if self.waiting else 0
+            return route, "staff", "GET", f"/mark_served/{patient_id}", None
+        if route == "confirm":
+            return route, None, "POST", "/confirm", {
+                **self._slot(rng, doctor_id), "patient_name": f"Online {n}", "email": f"o{n}@example.com",
+            }
+        if route == "desk_add":
+            return route, "staff", "POST", "/desk", {**self._slot(rng, doctor_id), "patient_name": f"Okienko {n}"}
+        raise ValueError(route)
+
+
+def login(driver, username):
+    status, _ = driver.request("POST", "/", {"username": username, "password": PASSWORD})
+    if status != 302:
+        raise RuntimeError(f"Logowanie {username} nie powiodło się (HTTP {status})")
+
+
+def run_worker(make_driver, scenario, requests, seed_value, doctor_ids, results):
+    rng = random.Random(seed_value)
+    staff = make_driver()
+    login(staff, STAFF_USER)
+    doctor = make_driver()
+    login(doctor, f"bench_lekarz{rng.choice(doctor_ids)}")
+    anonymous = make_driver()
+    drivers = {"staff": staff, "doctor": doctor, None: anonymous}
+
+    for _ in range(requests):
+        route, who, method, path, data = scenario.next_request(rng)
+        start = time.perf_counter()
+        status, queries = drivers[who].request(method, path, data)
+        elapsed = time.perf_counter() - start
+        results.append((route, elapsed, status, queries))
+
+
+# ---------------------------
+# RAPORT
+# ---------------------------
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def summarize(results, wall_time):
+    by_route = defaultdict(list)
+    for row in results:
+        by_route[row[0]].append(row)
+
+    def stats(rows):
+        times = sorted(r[1] * 1000 for r in rows)
+        queries = [r[3] for r in rows if r[3] is not None]
+        return {
+            "requests": len(rows),
+            "errors": sum(1 for r in rows if r[2] >= 500),
+            "client_errors": sum(1 for r in rows if 400 <= r[2] < 500),
+            "p50_ms": round(percentile(times, 50), 3),
+            "p95_ms": round(percentile(times, 95), 3),
+            "p99_ms": round(percentile(times, 99), 3),
+            "mean_queries": round(sum(queries) / len(queries), 2) if queries else None,
+            "throughput_rps": round(len(rows) / wall_time, 1),
+        }
+
+    return {
+        "routes": {route: stats(rows) for route, rows in sorted(by_route.items())},
+        "total": stats(results),
+    }
+
+
+def print_report(summary, baseline=None):
+    header = f"{'trasa':<14} {'żądań':>7} {'błędy':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'SQL':>6} {'req/s':>8}"
+    if baseline:
+        header += f" {'Δp95':>8}"
+    print(header)
+    rows = list(summary["routes"].items()) + [("RAZEM", summary["total"])]
+    for route, s in rows:
+        line = (f"{route:<14} {s['requests']:>7} {s['errors']:>6} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} "
+                f"{s['p99_ms']:>8.2f} {s['mean_queries'] if s['mean_queries'] is not None else '-':>6} "
+                f"{s['throughput_rps']:>8.1f}")
+        if baseline:
+            before = baseline["routes"].get(route) if route != "RAZEM" else baseline["total"]
+            if before:
+                line += f" {(s['p95_ms'] / before['p95_ms'] - 1) * 100:>+7.1f}%"
+        print(line)
+
+
+def regressions(summary, baseline, max_regression):
+    found = []
+    for route, s in summary["routes"].items():
+        before = baseline["routes"].get(route)
+        if before and s["p95_ms"] > before["p95_ms"] * (1 + max_regression / 100):
+            found.append(f"{route}: p95 {before['p95_ms']:.2f} -> {s['p95_ms']:.2f} ms")
+    return found
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------------------------
+# SERWER
+# ---------------------------
+
+def serve(db_path, port):
+    from werkzeug.serving import run_simple
+
+    clinic = load_app(db_path)
+    run_simple("127.0.0.1", port, clinic.app, threaded=True)
+
+
+def start_server(db_path):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen(
+        [sys.executable, __file__, "--serve", "--db", str(db_path), "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + "/public", timeout=1).read()
+            return proc, url
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("Serwer nie wystartował")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        route, _, weight = part.partition("=")
+        mix[route.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db", help="plik bazy (domyślnie tymczasowy)")
+    parser.add_argument("--doctors", type=int, default=20, help="dodatkowi lekarze")
+    parser.add_argument("--patients", type=int, default=5000, help="pacjenci w kolejkach")
+    parser.add_argument("--bookings", type=int, default=5000, help="rezerwacje online")
+    parser.add_argument("--days", type=int, default=30, help="horyzont rezerwacji w dniach")
+    parser.add_argument("--requests", type=int, default=2000, help="łączna liczba żądań")
+    parser.add_argument("--concurrency", type=int, default=8, help="liczba wątków klienta")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="wagi tras, np. dashboard=3,show_slots=1")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--server", action="store_true", help="uruchom serwer WSGI i testuj przez HTTP")
+    parser.add_argument("--url", help="adres działającego serwera (baza zasiana wcześniej)")
+    parser.add_argument("--seed-only", action="store_true", help="tylko zasiej bazę --db")
+    parser.add_argument("--output", help="plik JSON z wynikami")
+    parser.add_argument("--compare", help="wcześniejszy plik JSON do porównania")
+    parser.add_argument("--max-regression", type=float, default=20, help="dopuszczalny wzrost p95 w %%")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=5000, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    db_path = pathlib.Path(args.db or pathlib.Path(tempfile.mkdtemp()) / "load.db")
+    if args.serve:
+        serve(db_path, args.port)
+        return
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    clinic = load_app(db_path)
+
+    if args.url:
+        with clinic.app.app_context():
+            conn = clinic.get_conn()
+            doctor_ids = [r["id"] for r in conn.execute(
+                "SELECT doctor_id AS id FROM users WHERE username LIKE 'bench_lekarz%'")]
+            waiting = [r["id"] for r in conn.execute("SELECT id FROM patients WHERE status='oczekuje'")]
+        if not doctor_ids:
+            parser.error("baza nie jest zasiana – uruchom najpierw z --db ... --seed-only")
+    else:
+        doctor_ids, waiting = seed(clinic, args.doctors, args.patients, args.bookings, args.days, rng)
+    if args.seed_only:
+        print(f"Zasiano {db_path}")
+        return
+    rng.shuffle(waiting)
+
+    server = None
+    if args.server:
+        server, url = start_server(db_path)
+        mode = "wsgi"
+    elif args.url:
+        url, mode = args.url, "http"
+    else:
+        url, mode = None, "test_client"
+
+    def make_driver():
+        return HttpDriver(url) if url else TestClientDriver(clinic.app)
+
+    scenario = Scenario(mix, doctor_ids, waiting, args.days, rng)
+    results = []
+    per_worker = args.requests // args.concurrency
+    workers = [
+        threading.Thread(target=run_worker,
+                         args=(make_driver, scenario, per_worker, args.seed + i, doctor_ids, results))
+        for i in range(args.concurrency)
+    ]
+    start = time.perf_counter()
+    try:
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    wall_time = time.perf_counter() - start
+
+    summary = summarize(results, wall_time)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": dt_datetime.now().isoformat(timespec="seconds"),
+            "mode": mode,
+            "python": sys.version.split()[0],
+            "args": {k: v for k, v in vars(args).items() if k not in ("serve", "port")},
+            "wall_time_s": round(wall_time, 3),
+        },
+        **summary,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(summary, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Zapisano {args.output}")
+
+    if baseline:
+        found = regressions(summary, baseline, args.max_regression)
+        for line in found:
+            print("REGRESJA", line)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Test obciążeniowy rezerwacji terminów (/reserve/<id>).
+
+Uruchomienie (z katalogu projektu):
+    python benchmarks/reserve_stress.py [--slots 20] [--processes 4] [--threads 8] [--attempts 200]
+
+Na tymczasowej bazie tworzy `--slots` wolnych terminów, po czym procesy × wątki
+rezerwują losowe terminy tak szybko, jak się da. Na końcu sprawdza, że:
+  - żaden termin nie został zarezerwowany dwa razy,
+  - każdy zarezerwowany termin wskazuje pacjenta z kolejki właściwego lekarza,
+  - liczba pacjentów dopisanych do kolejek = liczba udanych rezerwacji.
+Kończy się kodem 1, jeśli którykolwiek warunek nie jest spełniony.
+"""
+import argparse
+import multiprocessing
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+DB_ENV = "RESERVE_STRESS_DB"
+
+
+def load_app():
+    import database
+    database.DB_PATH = pathlib.Path(os.environ[DB_ENV])
+    import app as clinic
+    return clinic
+
+
+def prepare(slots):
+    clinic = load_app()
+    with clinic.app.app_context():
+        conn = clinic.get_conn()
+        doctor_ids = [d["id"] for d in clinic.list_doctors()]
+        with conn:
+            conn.execute("DELETE FROM appointments")
+            conn.execute("DELETE FROM patients")
+            conn.executemany(
+                "INSERT INTO appointments (doctor_id, appointment_time, status) VALUES (?, ?, 'wolny')",
+                ((doctor_ids[i % len(doctor_ids)], f"2030-01-01 {8 + i // 4:02d}:{i % 4 * 15:02d}")
+                 for i in range(slots))
+            )
+        return [r["id"] for r in conn.execute("SELECT id FROM appointments")]
+
+
+def worker(appointment_ids, threads, attempts, results):
+    clinic = load_app()
+
+    def run(stats):
+        client = clinic.app.test_client()
+        client.post("/", data={"username": "rejestratorka", "password": "haslo123"})
+        for i in range(attempts):
+            appointment_id = random.choice(appointment_ids)
+            response = client.post(f"/reserve/{appointment_id}", data={"name": f"P{os.getpid()}-{i}"})
+            stats["requests"] += 1
+            if response.status_code != 302:
+                stats["errors"] += 1
+
+    all_stats = [{"requests": 0, "errors": 0} for _ in range(threads)]
+    pool = [threading.Thread(target=run, args=(s,)) for s in all_stats]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put({
+        "requests": sum(s["requests"] for s in all_stats),
+        "errors": sum(s["errors"] for s in all_stats),
+    })
+
+
+def verify():
+    clinic = load_app()
+    with clinic.app.app_context():
+        conn = clinic.get_conn()
+        reserved = conn.execute(
+            "SELECT COUNT(*) FROM appointments WHERE status='zarezerwowany'"
+        ).fetchone()[0]
+        patients = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+        duplicates = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT patient_id FROM appointments "
+            "WHERE patient_id IS NOT NULL GROUP BY patient_id HAVING COUNT(*) > 1)"
+        ).fetchone()[0]
+        mislinked = conn.execute("""
+            SELECT COUNT(*) FROM appointments a
+            LEFT JOIN patients p ON p.id = a.patient_id
+            WHERE a.status='zarezerwowany' AND (p.id IS NULL OR p.doctor_id != a.doctor_id)
+        """).fetchone()[0]
+    return reserved, patients, duplicates, mislinked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--slots", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--attempts", type=int, default=200, help="żądań na wątek")
+    args = parser.parse_args()
+
+    os.environ[DB_ENV] = str(pathlib.Path(tempfile.mkdtemp()) / "stress.db")
+    appointment_ids = prepare(args.slots)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=worker, args=(appointment_ids, args.threads, args.attempts, results))
+        for _ in range(args.processes)
+    ]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    stats = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    requests = sum(s["requests"] for s in stats)
+    errors = sum(s["errors"] for s in stats)
+    reserved, patients, duplicates, mislinked = verify()
+
+    print(f"żądań: {requests} w {elapsed:.1f} s ({requests / elapsed:.0f}/s), błędów HTTP: {errors}")
+    print(f"zarezerwowane terminy: {reserved}/{args.slots}, pacjenci w kolejkach: {patients}")
+    print(f"pacjent w kilku terminach: {duplicates}, termin bez właściwego pacjenta: {mislinked}")
+
+    ok = errors == 0 and duplicates == 0 and mislinked == 0 and patients == reserved
+    print("OK" if ok else "BŁĄD")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
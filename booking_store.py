@@ -0,0 +1,199 @@
+import re
+import secrets
+import sqlite3
+
+from database import get_conn
+
+BOOKED = "BOOKED"
+CANCELLED = "CANCELLED"
+HELD = "HELD"   # termin wstrzymany dla oferty z listy oczekujących (waitlist.py)
+
+EMAIL_REGEX = r"^[^@]+@[^@]+\.[^@]+$"
+
+
+def validate_patient(patient_name, email):
+    """Komunikat błędu dla danych pacjenta z formularza rezerwacji albo None."""
+    if len(patient_name) < 3:
+        return "Imię i nazwisko musi mieć co najmniej 3 znaki."
+    if not re.match(EMAIL_REGEX, email):
+        return "Niepoprawny adres e-mail."
+    return None
+
+
+class BookingStore:
+    """
+    Rezerwacje systemu pacjenta trzymane w tabeli `bookings` w clinic.db.
+    Zajęcie terminu to jeden INSERT – unikalny indeks na (doctor_id, date, slot_id)
+    dla aktywnych rezerwacji odrzuca drugą rezerwację tego samego terminu,
+    także gdy przychodzą równocześnie z kilku procesów.
+
+    Po każdej udanej zmianie wywoływani są słuchacze (add_listener) z argumentami
+    (zdarzenie, rezerwacja, poprzedni_stan) – zdarzenia: "booked", "cancelled",
+    "rescheduled", a dla terminów z listy oczekujących "held" i "released".
+    Tak aktualizują się indeksy w pamięci (np. dostępność terminów).
+
+    Haki transakcji (add_transaction_hook) dostają (conn, zdarzenie, rezerwacja,
+    poprzedni_stan) jeszcze przed zatwierdzeniem zmiany – zapisują w tej samej
+    transakcji (np. powiadomienia do wysłania); wyjątek w haku wycofuje rezerwację.
+    """
+
+    def __init__(self):
+        self._listeners = []
+        self._transaction_hooks = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def add_transaction_hook(self, hook):
+        self._transaction_hooks.append(hook)
+
+    def _in_transaction(self, conn, event, appointment_id, previous=None):
+        appt = dict(conn.execute("SELECT * FROM bookings WHERE id=?", (appointment_id,)).fetchone())
+        for hook in self._transaction_hooks:
+            hook(conn, event, appt, previous)
+
+    def notify(self, event, appt, previous=None):
+        for listener in self._listeners:
+            listener(event, appt, previous)
+
+    def get(self, appointment_id):
+        row = get_conn().execute(
+            "SELECT * FROM bookings WHERE id=?", (appointment_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get_by_token(self, cancel_token):
+        """Rezerwacja po tokenie z linku anulowania (losowy, w przeciwieństwie do id)."""
+        row = get_conn().execute(
+            "SELECT * FROM bookings WHERE cancel_token=?", (cancel_token,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def is_taken(self, doctor_id, date, slot_id, exclude_id=None):
+        row = get_conn().execute(
+            "SELECT id FROM bookings WHERE doctor_id=? AND date=? AND slot_id=? "
+            "AND status IN ('BOOKED', 'HELD')",
+            (doctor_id, date, slot_id)
+        ).fetchone()
+        return row is not None and row["id"] != exclude_id
+
+    def for_doctor_day(self, doctor_id, date):
+        """Aktywne rezerwacje lekarza w danym dniu w kolejności godzin."""
+        rows = get_conn().execute(
+            "SELECT * FROM bookings WHERE doctor_id=? AND date=? AND status='BOOKED' ORDER BY time, id",
+            (doctor_id, date)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def booked_slot_ids(self, doctor_id, date, exclude_id=None):
+        rows = get_conn().execute(
+            "SELECT id, slot_id FROM bookings WHERE doctor_id=? AND date=? "
+            "AND status IN ('BOOKED', 'HELD')",
+            (doctor_id, date)
+        ).fetchall()
+        return {r["slot_id"] for r in rows if r["id"] != exclude_id}
+
+    def book(self, slot, patient_name, email=None, reason=None):
+        """Rezerwuje termin. Zwraca None, jeśli termin jest już zajęty."""
+        conn = get_conn()
+        try:
+            with conn:
+                cur = conn.execute(
+                    """
+                    INSERT INTO bookings
+                        (slot_id, doctor_id, doctor_name, date, time,
+                         patient_name, email, reason, status, cancel_token)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (slot["slot_id"], slot["doctor_id"], slot["doctor_name"],
+                     slot["date"], slot["time"], patient_name, email, reason, BOOKED,
+                     secrets.token_urlsafe(16))
+                )
+                self._in_transaction(conn, "booked", cur.lastrowid)
+        except sqlite3.IntegrityError:
+            return None
+        appt = self.get(cur.lastrowid)
+        self.notify("booked", appt)
+        return appt
+
+    def cancel(self, appointment_id):
+        previous = self.get(appointment_id)
+        if previous is None:
+            return None
+
+        conn = get_conn()
+        with conn:
+            cur = conn.execute(
+                "UPDATE bookings SET status=? WHERE id=? AND status='BOOKED'",
+                (CANCELLED, appointment_id)
+            )
+            if cur.rowcount:
+                self._in_transaction(conn, "cancelled", appointment_id, previous)
+        appt = self.get(appointment_id)
+        if cur.rowcount:
+            self.notify("cancelled", appt, previous)
+        return appt
+
+    def reschedule(self, appointment_id, slot):
+        """Przenosi aktywną rezerwację na nowy termin. Zwraca None, jeśli termin jest zajęty."""
+        previous = self.get(appointment_id)
+        conn = get_conn()
+        try:
+            with conn:
+                cur = conn.execute(
+                    """
+                    UPDATE bookings
+                    SET slot_id=?, doctor_id=?, doctor_name=?, date=?, time=?
+                    WHERE id=? AND status='BOOKED'
+                    """,
+                    (slot["slot_id"], slot["doctor_id"], slot["doctor_name"],
+                     slot["date"], slot["time"], appointment_id)
+                )
+                if cur.rowcount:
+                    self._in_transaction(conn, "rescheduled", appointment_id, previous)
+        except sqlite3.IntegrityError:
+            return None
+        appt = self.get(appointment_id)
+        if cur.rowcount:
+            self.notify("rescheduled", appt, previous)
+        return appt
+
+    # --- terminy wstrzymane dla listy oczekujących ---
+    # Działają w transakcji wywołującego (waitlist.py zapisuje w niej też ofertę);
+    # po zatwierdzeniu wywołujący przekazuje zmianę słuchaczom przez notify().
+
+    def hold(self, conn, slot, patient_name, email):
+        """Wstrzymuje wolny termin (HELD). Zwraca id rezerwacji albo None, jeśli termin jest zajęty."""
+        try:
+            cur = conn.execute(
+                """
+                INSERT INTO bookings
+                    (slot_id, doctor_id, doctor_name, date, time, patient_name, email, status, cancel_token)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (slot["slot_id"], slot["doctor_id"], slot["doctor_name"],
+                 slot["date"], slot["time"], patient_name, email, HELD, secrets.token_urlsafe(16))
+            )
+        except sqlite3.IntegrityError:
+            return None
+        self._in_transaction(conn, "held", cur.lastrowid)
+        return cur.lastrowid
+
+    def confirm_hold(self, conn, appointment_id):
+        """Zamienia wstrzymany termin w rezerwację (zdarzenie "booked")."""
+        cur = conn.execute(
+            "UPDATE bookings SET status=? WHERE id=? AND status=?", (BOOKED, appointment_id, HELD)
+        )
+        if cur.rowcount:
+            self._in_transaction(conn, "booked", appointment_id)
+        return bool(cur.rowcount)
+
+    def release_hold(self, conn, appointment_id):
+        """Zwalnia wstrzymany termin (zdarzenie "released")."""
+        previous = conn.execute("SELECT * FROM bookings WHERE id=?", (appointment_id,)).fetchone()
+        cur = conn.execute(
+            "UPDATE bookings SET status=? WHERE id=? AND status=?", (CANCELLED, appointment_id, HELD)
+        )
+        if cur.rowcount:
+            self._in_transaction(conn, "released", appointment_id, dict(previous))
+        return bool(cur.rowcount)
@@ -1,34 +1,373 @@
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
+from flask import g, has_app_context
+
+# jedyna ścieżka bazy – niezależna od katalogu roboczego; nadpisywana przez DB_PATH w app.config
 DB_PATH = Path(__file__).parent / "clinic.db"
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+# Ustawienia puli połączeń i PRAGMA.
+# Można je nadpisać w app.config kluczami z prefiksem DB_ (np. DB_POOL_SIZE),
+# a przez zmienne środowiskowe: FLASK_DB_POOL_SIZE=16 itd.
+DB_SETTINGS = {
+    "POOL_SIZE": 8,            # ile bezczynnych połączeń trzymamy w puli
+    "JOURNAL_MODE": "WAL",     # czytelnicy nie blokują piszących
+    "SYNCHRONOUS": "NORMAL",   # w trybie WAL bezpieczne i dużo szybsze niż FULL
+    "BUSY_TIMEOUT_MS": 5000,   # ile czekamy na blokadę zamiast od razu "database is locked"
+    "CACHE_SIZE_KB": 8192,     # cache stron na połączenie
+    "STATEMENT_CACHE": 256,    # ile przygotowanych zapytań trzyma każde połączenie
+    "CONNECTION_FACTORY": sqlite3.Connection,  # podklasa np. do pomiaru zapytań (metrics.py)
+    # wołane raz na proces (i ścieżkę bazy) przed pierwszym połączeniem z puli –
+    # migrations.py sprawdza tu wersję schematu; import aplikacji nie dotyka pliku bazy
+    "ON_FIRST_CONNECT": None,
+}
+
+_pool = queue.LifoQueue(maxsize=DB_SETTINGS["POOL_SIZE"])
+_local = threading.local()
+_prepared_path = None
+_prepare_lock = threading.Lock()
+
+
+def configure(**settings):
+    """Nadpisuje ustawienia bazy i opróżnia pulę, żeby nowe PRAGMA zadziałały."""
+    global _pool, _prepared_path
+    DB_SETTINGS.update(settings)
+    _prepared_path = None
+    old_pool = _pool
+    _pool = queue.LifoQueue(maxsize=DB_SETTINGS["POOL_SIZE"])
+    while True:
+        try:
+            old_pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+def connect():
+    """Nowe połączenie spoza puli (skrypty, migracje) – z tymi samymi PRAGMA."""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_SETTINGS["BUSY_TIMEOUT_MS"] / 1000,
+        cached_statements=DB_SETTINGS["STATEMENT_CACHE"],
+        check_same_thread=False,  # połączenie może wrócić do puli i trafić do innego wątku
+        factory=DB_SETTINGS["CONNECTION_FACTORY"],
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode={DB_SETTINGS['JOURNAL_MODE']}")
+    conn.execute(f"PRAGMA synchronous={DB_SETTINGS['SYNCHRONOUS']}")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_SETTINGS['BUSY_TIMEOUT_MS'])}")
+    conn.execute(f"PRAGMA cache_size=-{int(DB_SETTINGS['CACHE_SIZE_KB'])}")
     return conn
 
-def init_db():
-    if not DB_PATH.exists():
-        conn = get_conn()
-        with open(Path(__file__).parent / "schema.sql", "r", encoding="utf-8") as f:
-            conn.executescript(f.read())
-        conn.commit()
+
+def _prepare():
+    global _prepared_path
+    with _prepare_lock:
+        if _prepared_path == DB_PATH:
+            return
+        hook = DB_SETTINGS["ON_FIRST_CONNECT"]
+        if hook is not None:
+            hook()
+        _prepared_path = DB_PATH
+
+
+def _acquire():
+    if _prepared_path != DB_PATH:
+        _prepare()
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return connect()
+
+
+def _release(conn):
+    # niezatwierdzona transakcja (np. po wyjątku w widoku) nie może wrócić do puli
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
         conn.close()
+
+
+def get_conn():
+    """
+    Zwraca połączenie z puli.
+    W trakcie żądania Flask jest to jedno połączenie na kontekst aplikacji,
+    oddawane do puli w teardown – widoki NIE zamykają go same.
+    Poza Flaskiem (skrypty) każdy wątek dostaje własne, trwałe połączenie.
+    """
+    if has_app_context():
+        if "db_conn" not in g:
+            g.db_conn = _acquire()
+        return g.db_conn
+
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _acquire()
+    return conn
+
+
+@contextmanager
+def immediate_transaction(conn):
+    """
+    Transakcja z blokadą zapisu od pierwszej instrukcji (BEGIN IMMEDIATE).
+    Dwa równoległe "sprawdź i zapisz" nie mogą się przeplatać – drugie czeka
+    (busy_timeout) aż pierwsze się zatwierdzi i dopiero wtedy czyta stan.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def release_conn(exc=None):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        _release(conn)
+
+
+def init_app(app):
+    global DB_PATH
+    if app.config.get("DB_PATH"):
+        DB_PATH = Path(app.config["DB_PATH"]).resolve()
+    settings = {
+        key[len("DB_"):]: value
+        for key, value in app.config.items()
+        if key.startswith("DB_") and key[len("DB_"):] in DB_SETTINGS
+    }
+    if settings:
+        configure(**settings)
+    app.teardown_appcontext(release_conn)
+
+
+def next_queue_position(conn, doctor_id):
+    """
+    Klucz sortowania dla nowego pacjenta na końcu kolejki lekarza.
+    `position` to tylko klucz porządku – numer w kolejce (1..N) liczymy przy odczycie,
+    więc obsłużenie pacjenta nie przepisuje pozycji wszystkich za nim.
+    """
+    last_pos = conn.execute(
+        "SELECT MAX(position) AS maxpos FROM patients WHERE doctor_id=? AND status='oczekuje'",
+        (doctor_id,)
+    ).fetchone()["maxpos"]
+    return 1 if last_pos is None else last_pos + 1
+
+
+def queue_number(conn, doctor_id, position):
+    """Numer w kolejce lekarza (1..N) pacjenta o danym kluczu `position`."""
+    return conn.execute(
+        "SELECT COUNT(*) FROM patients WHERE doctor_id=? AND status='oczekuje' AND position <= ?",
+        (doctor_id, position)
+    ).fetchone()[0]
+
+
+def get_queue(conn, doctor_id, limit=-1, offset=0):
+    """
+    Oczekujący pacjenci lekarza z numerem w kolejce (odczyt tylko z indeksu).
+    limit/offset – jedna strona kolejki; numery i tak liczone są od początku kolejki.
+    """
+    return conn.execute("""
+        SELECT id, name, doctor_id, position,
+               ROW_NUMBER() OVER (ORDER BY position) AS queue_no
+        FROM patients
+        WHERE doctor_id=? AND status='oczekuje'
+        ORDER BY position
+        LIMIT ? OFFSET ?
+    """, (doctor_id, limit, offset)).fetchall()
+
+
+def queue_length(conn, doctor_id):
+    return conn.execute(
+        "SELECT COUNT(*) FROM patients WHERE doctor_id=? AND status='oczekuje'",
+        (doctor_id,)
+    ).fetchone()[0]
+
+
+# ---------------------------
+# OPERACJE NA KOLEJCE
+# Nie zatwierdzają transakcji – robi to wywołujący, dzięki czemu
+# kilka operacji (np. z API batch) może pójść w jednej transakcji.
+# ---------------------------
+
+# słuchacze zmian w kolejce: fn(doctor_id, zdarzenie, patient_id)
+QUEUE_LISTENERS = []
+
+
+def queue_changed(doctor_id, event, patient_id=None):
+    for listener in QUEUE_LISTENERS:
+        listener(doctor_id, event, patient_id)
+
+
+def add_to_queue(conn, name, doctor_id):
+    """
+    Dodaje pacjenta na koniec kolejki lekarza. Zwraca id nowego pacjenta.
+    Wywoływać w immediate_transaction – odczyt MAX(position) i INSERT muszą być
+    pod jedną blokadą zapisu, inaczej dwa równoległe dodania dostaną tę samą pozycję.
+    """
+    next_pos = next_queue_position(conn, doctor_id)
+    cur = conn.execute(
+        "INSERT INTO patients (name, doctor_id, position, status, added_at) "
+        "VALUES (?, ?, ?, 'oczekuje', datetime('now', 'localtime'))",
+        (name, doctor_id, next_pos)
+    )
+    queue_changed(doctor_id, "added", cur.lastrowid)
+    return cur.lastrowid
+
+
+def reserve_appointment(conn, appointment_id, name):
+    """
+    Rezerwuje wolny termin (tabela appointments) i dopisuje pacjenta do kolejki lekarza.
+    Zwraca id pacjenta albo None, gdy termin nie istnieje lub jest już zajęty.
+    Wywoływać w immediate_transaction – warunek status='wolny' rozstrzyga wyścig.
+    """
+    appointment = conn.execute(
+        "SELECT doctor_id FROM appointments WHERE id=?", (appointment_id,)
+    ).fetchone()
+    if appointment is None:
+        return None
+
+    claimed = conn.execute(
+        "UPDATE appointments SET status='zarezerwowany' WHERE id=? AND status='wolny'",
+        (appointment_id,)
+    )
+    if claimed.rowcount != 1:
+        return None
+
+    patient_id = add_to_queue(conn, name, appointment["doctor_id"])
+    conn.execute(
+        "UPDATE appointments SET patient_id=? WHERE id=?",
+        (patient_id, appointment_id)
+    )
+    return patient_id
+
+
+def serve_patient(conn, patient_id):
+    """
+    Oznacza oczekującego pacjenta jako obsłużonego. Zwraca wiersz pacjenta albo None.
+    Ponowne oznaczenie (podwójne kliknięcie, odświeżenie linku) niczego nie zmienia –
+    served_at zostaje, a wizyta nie trafia drugi raz do visit_log.
+    """
+    patient = conn.execute(
+        "SELECT id, doctor_id FROM patients WHERE id=?", (patient_id,)
+    ).fetchone()
+    if patient is None:
+        return None
+
+    # pozostali pacjenci nie są przenumerowywani – numery 1..N wynikają z kolejności
+    cur = conn.execute(
+        "UPDATE patients SET status='obsłużony', served_at=datetime('now', 'localtime') "
+        "WHERE id=? AND status='oczekuje'",
+        (patient_id,)
+    )
+    if cur.rowcount == 1:
+        queue_changed(patient["doctor_id"], "served", patient_id)
+    return patient
+
+
+def serve_next(conn, doctor_id):
+    """Obsługuje pierwszego oczekującego pacjenta lekarza. Zwraca jego id albo None."""
+    first = conn.execute("""
+        SELECT id FROM patients
+        WHERE doctor_id=? AND status='oczekuje'
+        ORDER BY position LIMIT 1
+    """, (doctor_id,)).fetchone()
+    if first is None:
+        return None
+    serve_patient(conn, first["id"])
+    return first["id"]
+
+
+def move_patient(conn, patient_id, direction):
+    """
+    Przesuwa pacjenta o jedno miejsce ("up"/"down") w kolejce jego lekarza.
+    Zwraca (pacjent, czy_przesunięto); pacjent jest None, jeśli nie istnieje.
+    """
+    current = conn.execute(
+        "SELECT id, doctor_id, position FROM patients WHERE id=?",
+        (patient_id,)
+    ).fetchone()
+    if not current:
+        return None, False
+
+    pos = current["position"]
+    doctor_id = current["doctor_id"]
+
+    # zamiana miejscami z najbliższym oczekującym sąsiadem w kolejce tego samego lekarza
+    # – zawsze tylko 2 wiersze
+    if direction == "up":
+        neighbour = conn.execute("""
+            SELECT id, position FROM patients
+            WHERE doctor_id=? AND status='oczekuje' AND position < ?
+            ORDER BY position DESC LIMIT 1
+        """, (doctor_id, pos)).fetchone()
+    elif direction == "down":
+        neighbour = conn.execute("""
+            SELECT id, position FROM patients
+            WHERE doctor_id=? AND status='oczekuje' AND position > ?
+            ORDER BY position LIMIT 1
+        """, (doctor_id, pos)).fetchone()
+    else:
+        neighbour = None
+
+    if not neighbour:
+        return current, False
+
+    # pozycja oczekującego jest unikalna w kolejce lekarza (migracja 8), a SQLite
+    # sprawdza unikalność wiersz po wierszu – przesuwany pacjent na chwilę zwalnia miejsce
+    conn.execute("UPDATE patients SET position = NULL WHERE id = ?", (patient_id,))
+    conn.execute("""
+        UPDATE patients
+        SET position = ?
+        WHERE id = ?
+    """, (pos, neighbour["id"]))
+
+    conn.execute("""
+        UPDATE patients
+        SET position = ?
+        WHERE id = ?
+    """, (neighbour["position"], patient_id))
+    queue_changed(doctor_id, "moved", patient_id)
+    # sąsiad też zmienił miejsce – ekrany dostają oba wiersze
+    queue_changed(doctor_id, "moved", neighbour["id"])
+    return current, True
+
+
+def set_note(conn, patient_id, note_text):
+    patient = conn.execute(
+        "SELECT doctor_id FROM patients WHERE id=?", (patient_id,)
+    ).fetchone()
+    if patient is None:
+        return False
+
+    conn.execute(
+        "UPDATE patients SET note=? WHERE id=?",
+        (note_text, patient_id)
+    )
+    queue_changed(patient["doctor_id"], "note", patient_id)
+    return True
+
+
 def get_doctor_schedule(doctor_id):
-    conn = sqlite3.connect("clinic.db")
+    conn = get_conn()
     cur = conn.cursor()
     cur.execute(
         """
-        SELECT day_of_week, start_time, end_time
+        SELECT day_of_week, start_time, end_time, every_weeks, valid_from, valid_to
         FROM doctor_schedule
         WHERE doctor_id = ?
         """,
         (doctor_id,)
     )
     rows = cur.fetchall()
-    conn.close()
     return rows
+
+
 def add_schedule(doctor_id: int, day_of_week: int, start_time: str, end_time: str):
     """
     Dodaje nowy wpis grafiku dla lekarza
@@ -45,4 +384,33 @@ def add_schedule(doctor_id: int, day_of_week: int, start_time: str, end_time: st
         (doctor_id, day_of_week, start_time, end_time)
     )
     conn.commit()
-    conn.close()
+
+
+def add_schedules(entries, exceptions=(), replace_doctor_ids=()):
+    """
+    Dodaje wiele wpisów grafiku w jednej transakcji.
+    entries: krotki (doctor_id, day_of_week, start_time, end_time, every_weeks, valid_from, valid_to)
+    exceptions: krotki (doctor_id albo None, date_from, date_to, reason)
+    replace_doctor_ids: lekarze, których dotychczasowy grafik jest najpierw usuwany
+    """
+    conn = get_conn()
+    with conn:
+        conn.executemany(
+            "DELETE FROM doctor_schedule WHERE doctor_id=?",
+            ((doctor_id,) for doctor_id in replace_doctor_ids)
+        )
+        conn.executemany(
+            """
+            INSERT INTO doctor_schedule
+                (doctor_id, day_of_week, start_time, end_time, every_weeks, valid_from, valid_to)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            entries
+        )
+        conn.executemany(
+            """
+            INSERT INTO schedule_exceptions (doctor_id, date_from, date_to, reason)
+            VALUES (?, ?, ?, ?)
+            """,
+            exceptions
+        )
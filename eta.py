@@ -0,0 +1,139 @@
+"""
+Szacowanie czasu wejścia pacjentów (ETA) na podstawie rzeczywistych długości wizyt.
+
+Przy każdym "Obsłużony" zapisujemy wizytę w visit_log (start, koniec) i aktualizujemy
+średnią kroczącą (EWMA) długości wizyty danego lekarza. ETA całej kolejki liczymy
+jednym przebiegiem (NumPy): jeden odczyt zegara + liczba pacjentów przed nami
+razy średnia długość wizyty. Te same dwie liczby (queue_clock) dostają ekrany
+przez SSE i liczą z nich ETA u siebie, bez przesyłania całej kolejki.
+"""
+import threading
+from datetime import datetime as dt_datetime, timedelta
+
+import numpy as np
+
+import database
+
+DEFAULT_VISIT_MIN = 15
+EWMA_ALPHA = 0.2
+MAX_VISIT_MIN = 120      # dłuższe "wizyty" to najpewniej przerwa – nie liczymy ich
+WARMUP_VISITS = 50
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class EtaEngine:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # doctor_id -> [średnia długość wizyty w min, koniec ostatniej wizyty]
+        self._stats = {}
+
+    def init_app(self, app):
+        database.QUEUE_LISTENERS.append(self._on_queue_change)
+        app.extensions["eta_engine"] = self
+
+    # --- statystyki ---
+
+    def _warm_up(self, doctor_id):
+        rows = database.get_conn().execute("""
+            SELECT started_at, ended_at FROM visit_log
+            WHERE doctor_id=?
+            ORDER BY id DESC LIMIT ?
+        """, (doctor_id, WARMUP_VISITS)).fetchall()
+
+        mean = None
+        for row in reversed(rows):
+            if row["started_at"]:
+                mean = self._ewma(mean, self._minutes(row["started_at"], row["ended_at"]))
+        last_end = dt_datetime.strptime(rows[0]["ended_at"], TS_FORMAT) if rows else None
+        return [mean if mean is not None else DEFAULT_VISIT_MIN, last_end]
+
+    def _stats_for(self, doctor_id):
+        with self._lock:
+            stats = self._stats.get(doctor_id)
+        if stats is None:
+            stats = self._warm_up(doctor_id)
+            with self._lock:
+                stats = self._stats.setdefault(doctor_id, stats)
+        return stats
+
+    @staticmethod
+    def _minutes(started_at, ended_at):
+        delta = dt_datetime.strptime(ended_at, TS_FORMAT) - dt_datetime.strptime(started_at, TS_FORMAT)
+        return delta.total_seconds() / 60
+
+    @staticmethod
+    def _ewma(mean, value):
+        if value is None or not 0 < value <= MAX_VISIT_MIN:
+            return mean
+        return value if mean is None else (1 - EWMA_ALPHA) * mean + EWMA_ALPHA * value
+
+    def _on_queue_change(self, doctor_id, event, patient_id):
+        if event == "served":
+            self.record_service(doctor_id, patient_id)
+
+    def record_service(self, doctor_id, patient_id, now=None):
+        """
+        Zapisuje zakończoną wizytę (w transakcji wywołującego) i aktualizuje średnią.
+        Początek wizyty: koniec poprzedniej wizyty tego dnia albo przyjście pacjenta,
+        jeśli lekarz na niego czekał. Bez żadnej z tych informacji zapisujemy tylko koniec.
+        """
+        now = now or dt_datetime.now()
+        stats = self._stats_for(doctor_id)
+        conn = database.get_conn()
+
+        patient = conn.execute(
+            "SELECT added_at FROM patients WHERE id=?", (patient_id,)
+        ).fetchone()
+        candidates = []
+        if stats[1] is not None and stats[1].date() == now.date():
+            candidates.append(stats[1])
+        if patient is not None and patient["added_at"]:
+            added_at = dt_datetime.strptime(patient["added_at"], TS_FORMAT)
+            if added_at.date() == now.date():
+                candidates.append(added_at)
+        started = max(candidates) if candidates else None
+
+        conn.execute(
+            "INSERT INTO visit_log (doctor_id, patient_id, started_at, ended_at) VALUES (?, ?, ?, ?)",
+            (doctor_id, patient_id,
+             started.strftime(TS_FORMAT) if started else None, now.strftime(TS_FORMAT))
+        )
+
+        with self._lock:
+            if started is not None:
+                minutes = (now - started).total_seconds() / 60
+                stats[0] = self._ewma(stats[0], minutes)
+            stats[1] = now
+
+    # --- ETA ---
+
+    def expected_minutes(self, doctor_id):
+        return self._stats_for(doctor_id)[0]
+
+    def queue_clock(self, doctor_id, now=None):
+        """
+        (minuta doby, od której lekarz jest wolny; średnia długość wizyty w min).
+        Pacjent o indeksie i (0 = pierwszy w kolejce) wchodzi w minucie start + i * średnia.
+        """
+        mean, last_end = self._stats_for(doctor_id)
+        now = now or dt_datetime.now()
+
+        # lekarz jest wolny teraz albo po przewidywanym końcu bieżącej wizyty
+        start = now
+        if last_end is not None and last_end + timedelta(minutes=mean) > now:
+            start = last_end + timedelta(minutes=mean)
+        return start.hour * 60 + start.minute + start.second / 60, mean
+
+    def queue_etas(self, doctor_id, count, now=None, first=0):
+        """
+        Godziny wejścia ("HH:MM") dla `count` kolejnych pacjentów w kolejce lekarza,
+        zaczynając od pacjenta o indeksie `first` (0 = pierwszy w kolejce).
+        """
+        if count <= 0:
+            return []
+        start, mean = self.queue_clock(doctor_id, now)
+        minutes = (start + mean * np.arange(first, first + count)).astype(np.int64) % (24 * 60)
+        hours, mins = np.divmod(minutes, 60)
+        return [f"{h:02d}:{m:02d}" for h, m in zip(hours.tolist(), mins.tolist())]
@@ -0,0 +1,127 @@
+"""
+Powiadomienia o zmianach w kolejkach (Server-Sent Events).
+
+Operacje na kolejce (database.add_to_queue, serve_patient, move_patient, set_note)
+zgłaszają zdarzenia do database.QUEUE_LISTENERS. Broker zbiera je w trakcie żądania
+i po jego zakończeniu (gdy zmiany są już zatwierdzone) raz czyta z bazy tylko
+zmienione wiersze i rozsyła je wszystkim podłączonym ekranom tego lekarza –
+ekran poprawia u siebie te wiersze, zamiast dostawać całą kolejkę.
+Pełny stan idzie tylko jako pierwsza wiadomość po podłączeniu, po zmianach
+bez wskazanego pacjenta (archiwizacja) i do klienta, który nie nadążał –
+a ekran pokazujący jedną stronę kolejki dostaje wtedy tylko tę stronę.
+Setki ekranów = jeden odczyt na zmianę, a nie jeden na klienta.
+
+Broker działa w obrębie jednego procesu – przy kilku workerach ekran dostaje
+zdarzenia z workera, do którego jest podłączony.
+"""
+import json
+import queue
+import threading
+from collections import defaultdict
+
+from flask import g, has_request_context
+
+import database
+
+KEEPALIVE_SECONDS = 15
+SUBSCRIBER_BUFFER = 50
+
+
+def _sse(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class QueueBroker:
+
+    def __init__(self, snapshot, changes):
+        # snapshot(doctor_id, limit, offset) -> stan kolejki (strona albo całość przy limit=-1),
+        # changes(doctor_id, zdarzenia) -> tylko zmienione wiersze; oba zwracają słowniki do JSON
+        self._snapshot = snapshot
+        self._changes = changes
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(dict)   # doctor_id -> {skrzynka: (limit, offset)}
+        self._lagging = set()   # klienci, którym przepadła wiadomość – dostaną pełny stan
+
+    def init_app(self, app):
+        database.QUEUE_LISTENERS.append(self._record)
+        app.teardown_request(self._flush)
+        app.extensions["queue_broker"] = self
+
+    def _record(self, doctor_id, event, patient_id):
+        if has_request_context():
+            g.setdefault("queue_events", []).append((doctor_id, event, patient_id))
+        else:
+            self.publish(doctor_id, [{"type": event, "patient_id": patient_id}])
+
+    def _flush(self, exc=None):
+        pending = g.pop("queue_events", None)
+        if not pending or exc is not None:
+            return
+
+        by_doctor = defaultdict(list)
+        for doctor_id, event, patient_id in pending:
+            by_doctor[doctor_id].append({"type": event, "patient_id": patient_id})
+        for doctor_id, events in by_doctor.items():
+            self.publish(doctor_id, events)
+
+    def publish(self, doctor_id, events):
+        with self._lock:
+            subscribers = list(self._subscribers.get(doctor_id, {}).items())
+        if not subscribers:
+            return  # nikt nie słucha – nie czytamy bazy
+
+        changes = None
+        if all(e["patient_id"] is not None for e in events):
+            changes = _sse(self._changes(doctor_id, events))
+
+        full = {}   # (limit, offset) -> stan tej strony, czytany raz dla wszystkich jej ekranów
+        for subscriber, window in subscribers:
+            if changes is not None and subscriber not in self._lagging:
+                if not self._put(subscriber, changes):
+                    # zbyt wolny klient – pomijamy, dostanie pełny stan przy następnej zmianie
+                    self._lagging.add(subscriber)
+                continue
+            # zmiana bez wskazanego pacjenta albo zgubiona wcześniej wiadomość – pełny stan
+            if window not in full:
+                full[window] = _sse({"events": events, **self._snapshot(doctor_id, *window)})
+            if self._put(subscriber, full[window]):
+                self._lagging.discard(subscriber)
+
+    @staticmethod
+    def _put(subscriber, message):
+        try:
+            subscriber.put_nowait(message)
+        except queue.Full:
+            return False
+        return True
+
+    def subscribe(self, doctor_id, limit=-1, offset=0):
+        """
+        Rejestruje nowego klienta i zwraca generator wiadomości SSE.
+        Pierwsza wiadomość to pełny stan kolejki albo tylko strony limit/offset
+        (wywołać w kontekście żądania), kolejne – tylko zmiany.
+        """
+        window = (limit, offset)
+        initial = _sse({"events": [], **self._snapshot(doctor_id, *window)})
+
+        inbox = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+
+        def stream():
+            # rejestracja dopiero przy starcie strumienia, żeby `finally` zawsze ją sprzątnęło
+            with self._lock:
+                self._subscribers[doctor_id][inbox] = window
+            try:
+                yield initial
+                while True:
+                    try:
+                        yield inbox.get(timeout=KEEPALIVE_SECONDS)
+                    except queue.Empty:
+                        yield ": keepalive\n\n"
+            finally:
+                with self._lock:
+                    self._subscribers[doctor_id].pop(inbox, None)
+                    self._lagging.discard(inbox)
+                    if not self._subscribers[doctor_id]:
+                        del self._subscribers[doctor_id]
+
+        return stream()
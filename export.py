@@ -0,0 +1,217 @@
+"""
+Eksport danych do raportów: wizyty (`appointments`), pacjenci (archiwum +
+bieżące kolejki) i rezerwacje pacjentów (`bookings`) jako CSV albo NDJSON,
+opcjonalnie spakowane gzipem.
+
+Wiersze są czytane kursorem partiami (fetchmany) i od razu wysyłane – odpowiedź
+zaczyna się po pierwszej partii, a zużycie pamięci nie zależy od liczby wierszy.
+Zapytania idą po indeksach dat w kolejności indeksu, więc SQLite nie musi
+najpierw sortować całego wyniku.
+
+Dostępne pod /api/v1/export/<rodzaj>.<format> i jako `flask export ...`.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date as dt_date, timedelta
+
+import click
+from flask.cli import with_appcontext
+
+from database import get_conn
+
+FETCH_ROWS = 1000
+FORMATS = ("csv", "ndjson")
+MIMETYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _next_day(value):
+    return (dt_date.fromisoformat(value) + timedelta(days=1)).isoformat()
+
+
+def _filters(column, date_from, date_to, doctor_id, doctor_column="doctor_id", end_exclusive=False):
+    """Warunek WHERE i parametry; dla kolumn z godziną koniec zakresu to następny dzień."""
+    where, params = [], []
+    if date_from:
+        where.append(f"{column} >= ?")
+        params.append(date_from)
+    if date_to:
+        if end_exclusive:
+            where.append(f"{column} < ?")
+            params.append(_next_day(date_to))
+        else:
+            where.append(f"{column} <= ?")
+            params.append(date_to)
+    if doctor_id is not None:
+        where.append(f"{doctor_column} = ?")
+        params.append(doctor_id)
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+
+def _appointments(date_from, date_to, doctor_id):
+    where, params = _filters("a.appointment_time", date_from, date_to, doctor_id,
+                             doctor_column="a.doctor_id", end_exclusive=True)
+    yield f"""
+        SELECT a.id, a.doctor_id, d.name AS doctor_name, a.appointment_time, a.status,
+               a.patient_id, COALESCE(p.name, pa.name) AS patient_name
+        FROM appointments a
+        LEFT JOIN doctors d ON d.id = a.doctor_id
+        LEFT JOIN patients p ON p.id = a.patient_id
+        LEFT JOIN patients_archive pa ON pa.id = a.patient_id
+        {where}
+        ORDER BY a.appointment_time, a.id
+    """, params
+
+
+def _patients(date_from, date_to, doctor_id):
+    # najpierw archiwum (po indeksie dat), potem bieżące kolejki – bez sortowania całości
+    where, params = _filters("visit_date", date_from, date_to, doctor_id)
+    yield f"""
+        SELECT id, name, status, doctor_id, note, added_at, served_at, visit_date
+        FROM patients_archive{where}
+        ORDER BY visit_date, id
+    """, params
+    where, params = _filters("visit_date", date_from, date_to, doctor_id)
+    yield f"""
+        SELECT * FROM (
+            SELECT id, name, status, doctor_id, note, added_at, served_at,
+                   date(COALESCE(served_at, added_at, datetime('now', 'localtime'))) AS visit_date
+            FROM patients
+        ){where}
+        ORDER BY id
+    """, params
+
+
+def _bookings(date_from, date_to, doctor_id):
+    where, params = _filters("date", date_from, date_to, doctor_id)
+    yield f"""
+        SELECT id, doctor_id, doctor_name, date, time, slot_id, patient_name, email, reason, status
+        FROM bookings{where}
+        ORDER BY date, time, id
+    """, params
+
+
+EXPORTS = {
+    "appointments": _appointments,
+    "patients": _patients,
+    "bookings": _bookings,
+}
+
+
+def _check_date(value):
+    if not value:
+        return None
+    try:
+        return dt_date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ExportError(f"Niepoprawna data {value!r} (YYYY-MM-DD)")
+
+
+def iter_rows(kind, date_from=None, date_to=None, doctor_id=None, conn=None):
+    """Generator: najpierw nazwy kolumn, potem wiersze – czytane partiami po FETCH_ROWS."""
+    if kind not in EXPORTS:
+        raise ExportError(f"Nieznany eksport {kind!r} (dostępne: {', '.join(EXPORTS)})")
+    date_from, date_to = _check_date(date_from), _check_date(date_to)
+    return _read(EXPORTS[kind](date_from, date_to, doctor_id), conn)
+
+
+def _read(queries, conn):
+    conn = conn or get_conn()
+    header = False
+    for sql, params in queries:
+        cursor = conn.execute(sql, params)
+        try:
+            if not header:
+                header = True
+                yield [c[0] for c in cursor.description]
+            while True:
+                rows = cursor.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(next(rows))
+    for n, row in enumerate(rows, start=1):
+        writer.writerow(tuple(row))
+        if n % FETCH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(rows):
+    columns = next(rows)
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+        if len(lines) == FETCH_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(kind, fmt="csv", gzip=False, **filters):
+    """
+    Generator kolejnych kawałków pliku (bytes). Błędy rodzaju, formatu
+    i dat zgłasza od razu (ExportError), zanim zacznie się wysyłanie.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Nieznany format {fmt!r} (dostępne: {', '.join(FORMATS)})")
+    rows = iter_rows(kind, **filters)
+    chunks = (c.encode("utf-8") for c in (_csv_chunks if fmt == "csv" else _ndjson_chunks)(rows))
+    return _gzip(chunks) if gzip else chunks
+
+
+def filename(kind, fmt, gzip=False, date_from=None, date_to=None):
+    parts = [kind] + [d for d in (date_from, date_to) if d]
+    return "_".join(parts) + f".{fmt}" + (".gz" if gzip else "")
+
+
+# ---------------------------
+# POLECENIA CLI
+# ---------------------------
+
+@click.command("export")
+@with_appcontext
+@click.argument("kind", type=click.Choice(list(EXPORTS)))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default="csv", show_default=True)
+@click.option("--from", "date_from", help="Od dnia (YYYY-MM-DD).")
+@click.option("--to", "date_to", help="Do dnia włącznie (YYYY-MM-DD).")
+@click.option("--doctor", "doctor_id", type=int, help="Tylko ten lekarz.")
+@click.option("--gzip", is_flag=True, help="Kompresja gzip.")
+@click.option("-o", "--output", type=click.File("wb"), default="-",
+              help="Plik wynikowy (domyślnie standardowe wyjście).")
+def export_command(kind, fmt, date_from, date_to, doctor_id, gzip, output):
+    """Zapisuje eksport KIND (appointments, patients, bookings)."""
+    try:
+        chunks = stream(kind, fmt, gzip=gzip, date_from=date_from, date_to=date_to, doctor_id=doctor_id)
+    except ExportError as e:
+        raise click.ClickException(str(e))
+    for chunk in chunks:
+        output.write(chunk)
+
+
+def init_app(app):
+    app.cli.add_command(export_command)
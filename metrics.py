@@ -0,0 +1,243 @@
+"""
+Pomiary czasu żądań: ile trwały zapytania SQL, ile renderowanie szablonów,
+ile całe żądanie – zagregowane w histogramy dostępne pod /metrics
+(format tekstowy Prometheusa).
+
+Zapytania mierzy podklasa połączenia sqlite3 (DB_CONNECTION_FACTORY), więc
+obejmuje to każde połączenie z puli database.get_conn(). Zapytania wolniejsze
+niż SLOW_QUERY_MS trafiają do logu "clinic.slow_sql" (albo pliku SLOW_QUERY_LOG)
+– z treścią SQL bez wartości parametrów i literałów tekstowych.
+
+Każda odpowiedź ma nagłówek Server-Timing (db, tpl, app), widoczny w narzędziach
+deweloperskich przeglądarki. /metrics wymaga nagłówka "Authorization: Bearer
+<METRICS_TOKEN>"; bez ustawionego METRICS_TOKEN jest wyłączone (404).
+"""
+import hmac
+import logging
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from time import perf_counter
+
+from flask import (
+    Response, abort, before_render_template, g, has_app_context, has_request_context,
+    request, template_rendered,
+)
+
+import database
+
+SLOW_QUERY_MS = 100
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+slow_log = logging.getLogger("clinic.slow_sql")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def redact(sql):
+    """SQL do logu: literały tekstowe zamienione na ?, białe znaki zwinięte."""
+    return _WHITESPACE.sub(" ", _STRING_LITERAL.sub("?", sql)).strip()
+
+
+# ---------------------------
+# POMIAR ZAPYTAŃ
+# ---------------------------
+
+def _record_query(sql, params, elapsed, count=1):
+    if has_app_context():
+        g.db_time = g.get("db_time", 0.0) + elapsed
+        g.db_queries = g.get("db_queries", 0) + count
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        endpoint = request.endpoint if has_request_context() else None
+        slow_log.warning("%.1f ms [%s] %s (parametry: %d, ukryte)",
+                         elapsed * 1000, endpoint or "-", redact(sql), len(params or ()))
+
+
+def _record_fetch(elapsed):
+    if has_app_context():
+        g.db_time = g.get("db_time", 0.0) + elapsed
+
+
+class TimedCursor(sqlite3.Cursor):
+
+    def execute(self, sql, parameters=()):
+        start = perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_query(sql, parameters, perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_query(sql, (), perf_counter() - start)
+
+    def fetchone(self):
+        start = perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record_fetch(perf_counter() - start)
+
+    def fetchmany(self, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            _record_fetch(perf_counter() - start)
+
+    def fetchall(self):
+        start = perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record_fetch(perf_counter() - start)
+
+    def __next__(self):
+        start = perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            _record_fetch(perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Połączenie, którego kursory (także z conn.execute) mierzą czas zapytań."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute nie woła self.cursor(), więc kierujemy go tu ręcznie
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# ---------------------------
+# HISTOGRAMY
+# ---------------------------
+
+class Histogram:
+
+    def __init__(self, name, help_text, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # etykiety -> [liczniki kubełków..., suma, liczba]
+        self._series = defaultdict(lambda: [0] * len(self.buckets) + [0.0, 0])
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series[labels]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            items = [(labels, list(series)) for labels, series in items]
+        for labels, series in items:
+            base = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(label_names, labels))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+
+    LABELS = ("endpoint", "method")
+
+    def __init__(self):
+        self.request_seconds = Histogram(
+            "clinic_request_duration_seconds", "Czas obsługi żądania.")
+        self.db_seconds = Histogram(
+            "clinic_db_duration_seconds", "Czas zapytań SQL w żądaniu.")
+        self.template_seconds = Histogram(
+            "clinic_template_duration_seconds", "Czas renderowania szablonów w żądaniu.")
+        self.queries = Histogram(
+            "clinic_db_queries", "Liczba zapytań SQL w żądaniu.",
+            buckets=(1, 2, 3, 5, 10, 20, 50, 100, 250))
+        self._token = None
+
+    def init_app(self, app):
+        global SLOW_QUERY_MS
+        SLOW_QUERY_MS = float(app.config.get("SLOW_QUERY_MS", SLOW_QUERY_MS))
+        self._token = app.config.get("METRICS_TOKEN")
+        if app.config.get("SLOW_QUERY_LOG"):
+            handler = logging.FileHandler(app.config["SLOW_QUERY_LOG"], encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            slow_log.addHandler(handler)
+
+        database.configure(CONNECTION_FACTORY=TimedConnection)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(self._template_start, app)
+        template_rendered.connect(self._template_end, app)
+        app.add_url_rule("/metrics", "metrics", self.view)
+        app.extensions["metrics"] = self
+
+    # --- haki żądania ---
+
+    @staticmethod
+    def _start():
+        g.request_start = perf_counter()
+        g.db_time = 0.0
+        g.db_queries = 0
+        g.template_time = 0.0
+
+    @staticmethod
+    def _template_start(sender, template, context, **extra):
+        g.template_start = perf_counter()
+
+    @staticmethod
+    def _template_end(sender, template, context, **extra):
+        start = g.pop("template_start", None)
+        if start is not None:
+            g.template_time = g.get("template_time", 0.0) + perf_counter() - start
+
+    def _finish(self, response):
+        start = g.get("request_start")
+        if start is None or request.endpoint == "metrics":
+            return response
+        total = perf_counter() - start
+        labels = (request.endpoint or "404", request.method)
+        self.request_seconds.observe(labels, total)
+        self.db_seconds.observe(labels, g.db_time)
+        self.template_seconds.observe(labels, g.template_time)
+        self.queries.observe(labels, g.db_queries)
+        response.headers["Server-Timing"] = (
+            f'db;dur={g.db_time * 1000:.2f};desc="{g.db_queries} queries", '
+            f"tpl;dur={g.template_time * 1000:.2f}, app;dur={total * 1000:.2f}"
+        )
+        return response
+
+    # --- /metrics ---
+
+    def view(self):
+        if not self._token:
+            abort(404)
+        auth = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth, f"Bearer {self._token}"):
+            abort(401)
+        lines = []
+        for histogram in (self.request_seconds, self.db_seconds, self.template_seconds, self.queries):
+            lines.extend(histogram.render(self.LABELS))
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,466 @@
+"""
+Wersjonowane migracje schematu bazy.
+
+Wersja schematu jest zapisana w nagłówku pliku bazy (PRAGMA user_version).
+Każda migracja ma kolejny numer i wykonuje się dokładnie raz, w jednej
+transakcji razem z podbiciem user_version – przerwana migracja nie zostawia
+bazy w połowie zmiany, a kilka procesów startujących naraz wykona ją tylko raz
+(BEGIN IMMEDIATE, potem ponowne sprawdzenie wersji).
+
+Aplikacja sprawdza wersję leniwie – przy pierwszym połączeniu z puli, nie przy
+imporcie – więc aktualna baza kosztuje jeden odczyt PRAGMA na proces. Nowa,
+pusta baza dostaje też dane testowe z seed.sql (SEED_DEMO_DATA=False wyłącza).
+Przy DB_AUTO_MIGRATE=False aplikacja nie zmienia schematu sama, tylko odmawia
+pracy na nieaktualnej bazie – wtedy migracje uruchamia `flask db upgrade`.
+
+Nowa zmiana schematu = nowa funkcja z dekoratorem @migration(następny numer, opis).
+Wykonanych migracji się nie edytuje.
+"""
+import sqlite3
+from pathlib import Path
+
+import click
+from flask.cli import AppGroup
+from werkzeug.security import generate_password_hash
+
+import database
+from auth import HASH_PREFIXES, PASSWORD_HASH_METHOD
+from database import immediate_transaction
+
+SCHEMA_FILE = Path(__file__).parent / "schema.sql"
+SEED_FILE = Path(__file__).parent / "seed.sql"
+
+MIGRATIONS = []  # (wersja, opis, funkcja(conn))
+
+
+def migration(version, description):
+    def register(apply):
+        expected = MIGRATIONS[-1][0] + 1 if MIGRATIONS else 1
+        if version != expected:
+            raise RuntimeError(f"Migracja {version}: oczekiwano numeru {expected}")
+        MIGRATIONS.append((version, description, apply))
+        return apply
+    return register
+
+
+def _statements(script):
+    """Instrukcje skryptu SQL po kolei (execute() przyjmuje tylko jedną naraz)."""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+    if statement.strip():
+        yield statement
+
+
+def _run_script(conn, path):
+    # nie executescript(): ten zatwierdza bieżącą transakcję, a migracja ma być jedną całością
+    for statement in _statements(path.read_text(encoding="utf-8")):
+        conn.execute(statement)
+
+
+def _add_column(conn, table, column, decl):
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in existing:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# ---------------------------
+# MIGRACJE
+# ---------------------------
+
+@migration(1, "Tabele podstawowe (schema.sql)")
+def _base_tables(conn):
+    _run_script(conn, SCHEMA_FILE)
+
+
+# Zmiany wprowadzane przed wersjonowaniem – wykonywały się przy każdym starcie,
+# dlatego są idempotentne i bezpieczne także dla baz, które część z nich już mają.
+LEGACY_COLUMNS = [
+    # konto lekarza -> lekarz, którego kolejkę widzi w panelu
+    ("users", "doctor_id", "INTEGER REFERENCES doctors(id)"),
+    # kiedy pacjent dołączył do kolejki (do liczenia długości wizyt)
+    ("patients", "added_at", "TEXT"),
+    ("patients", "served_at", "TEXT"),
+    # zablokowane konto nie może się zalogować, a otwarte sesje wygasają
+    ("users", "active", "INTEGER NOT NULL DEFAULT 1"),
+    # reguły powtarzania grafiku: co ile tygodni i w jakim okresie obowiązuje wpis
+    ("doctor_schedule", "every_weeks", "INTEGER NOT NULL DEFAULT 1"),
+    ("doctor_schedule", "valid_from", "TEXT"),
+    ("doctor_schedule", "valid_to", "TEXT"),
+]
+
+LEGACY_STATEMENTS = [
+    # kolejka jest osobna dla każdego lekarza; indeks pokrywa odczyt kolejki
+    # (id to rowid), MAX(position) i szukanie sąsiada przy przesuwaniu
+    "DROP INDEX IF EXISTS idx_patients_position",
+    "CREATE INDEX IF NOT EXISTS idx_patients_queue "
+    "ON patients(doctor_id, status, position, name)",
+    "CREATE INDEX IF NOT EXISTS idx_appointments_free "
+    "ON appointments(status, doctor_id, appointment_time)",
+    # eksport za okres czyta wiersze w kolejności dat (export.py)
+    "CREATE INDEX IF NOT EXISTS idx_appointments_time ON appointments(appointment_time)",
+    "UPDATE users SET doctor_id = 1 WHERE username = 'lekarz1' AND doctor_id IS NULL",
+    # rezerwacje systemu pacjenta (wcześniej tylko w pamięci procesu)
+    """
+    CREATE TABLE IF NOT EXISTS bookings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        slot_id INTEGER NOT NULL,
+        doctor_id INTEGER NOT NULL,
+        doctor_name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        patient_name TEXT NOT NULL,
+        email TEXT,
+        reason TEXT,
+        status TEXT NOT NULL DEFAULT 'BOOKED'
+    )
+    """,
+    # jeden aktywny termin = jedna rezerwacja; INSERT drugiej kończy się IntegrityError
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_bookings_slot "
+    "ON bookings(doctor_id, date, slot_id) WHERE status = 'BOOKED'",
+    "CREATE INDEX IF NOT EXISTS idx_bookings_date ON bookings(date, time)",
+    # rzeczywiste wizyty – na ich podstawie liczymy średni czas wizyty lekarza
+    """
+    CREATE TABLE IF NOT EXISTS visit_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER NOT NULL,
+        patient_id INTEGER NOT NULL,
+        started_at TEXT,
+        ended_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_visit_log_doctor ON visit_log(doctor_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_schedule_doctor_day "
+    "ON doctor_schedule(doctor_id, day_of_week, start_time)",
+    # obsłużeni i porzuceni pacjenci przenoszeni z `patients` przez archive.rollover();
+    # id zostaje to samo, więc appointments.patient_id i visit_log dalej się zgadzają
+    """
+    CREATE TABLE IF NOT EXISTS patients_archive (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        doctor_id INTEGER,
+        note TEXT,
+        added_at TEXT,
+        served_at TEXT,
+        visit_date TEXT NOT NULL,
+        archived_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_patients_archive_doctor_date "
+    "ON patients_archive(doctor_id, visit_date)",
+    "CREATE INDEX IF NOT EXISTS idx_patients_archive_date ON patients_archive(visit_date)",
+    # dni bez przyjęć (urlopy, święta); doctor_id NULL = cała przychodnia
+    """
+    CREATE TABLE IF NOT EXISTS schedule_exceptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER REFERENCES doctors(id),
+        date_from TEXT NOT NULL,
+        date_to TEXT NOT NULL,
+        reason TEXT
+    )
+    """,
+]
+
+
+
+@migration(2, "Kolumny, indeksy i tabele sprzed wersjonowania schematu")
+def _legacy_upgrades(conn):
+    for table, column, decl in LEGACY_COLUMNS:
+        _add_column(conn, table, column, decl)
+    for statement in LEGACY_STATEMENTS:
+        conn.execute(statement)
+
+
+
+# Tokenizer unicode61 zdejmuje ogonki (ą -> a, ż -> z), ale "ł" nie jest literą
+# z diakrytykiem w sensie Unicode – zamieniamy je na "l" przy indeksowaniu
+# (i tak samo w zapytaniu, search.py).
+def _fold(column):
+    return f"replace(replace({column}, 'ł', 'l'), 'Ł', 'L')"
+
+
+@migration(3, "Wyszukiwanie pełnotekstowe pacjentów (FTS5)")
+def _patient_search(conn):
+    # rowid = id pacjenta; id się nie zmienia przy przeniesieniu do archiwum,
+    # więc jeden indeks obejmuje bieżące kolejki i historię
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+            name, note,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    index_new = f"""
+        INSERT INTO patients_fts (rowid, name, note)
+        VALUES (new.id, {_fold("new.name")}, {_fold("COALESCE(new.note, '')")});
+    """
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS patients_fts_insert AFTER INSERT ON patients BEGIN
+            {index_new}
+        END
+    """)
+    # pacjent przenoszony do archiwum ma już wpis w indeksie (to samo id)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS patients_archive_fts_insert AFTER INSERT ON patients_archive BEGIN
+            DELETE FROM patients_fts WHERE rowid = new.id;
+            {index_new}
+        END
+    """)
+    for table in ("patients", "patients_archive"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF name, note ON {table} BEGIN
+                DELETE FROM patients_fts WHERE rowid = old.id;
+                {index_new}
+            END
+        """)
+    # archive.rollover() najpierw kopiuje wiersz do archiwum, potem usuwa z patients –
+    # wtedy wpis w indeksie zostaje
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS patients_fts_delete AFTER DELETE ON patients
+        WHEN NOT EXISTS (SELECT 1 FROM patients_archive WHERE id = old.id) BEGIN
+            DELETE FROM patients_fts WHERE rowid = old.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS patients_archive_fts_delete AFTER DELETE ON patients_archive
+        WHEN NOT EXISTS (SELECT 1 FROM patients WHERE id = old.id) BEGIN
+            DELETE FROM patients_fts WHERE rowid = old.id;
+        END
+    """)
+    conn.execute("DELETE FROM patients_fts")
+    for table in ("patients_archive", "patients"):
+        conn.execute(f"""
+            INSERT INTO patients_fts (rowid, name, note)
+            SELECT id, {_fold("name")}, {_fold("COALESCE(note, '')")} FROM {table}
+            WHERE id NOT IN (SELECT rowid FROM patients_fts)
+        """)
+
+
+
+@migration(4, "Kolejka powiadomień e-mail (outbox)")
+def _notification_outbox(conn):
+    # wiersze zapisywane w transakcji rezerwacji, wysyłane przez notifications.py
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            booking_id INTEGER,
+            kind TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            send_after TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+            sent_at TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox(status, send_after)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_booking ON notification_outbox(booking_id, status)")
+
+
+@migration(5, "Lista oczekujących i oferty zwolnionych terminów")
+def _waitlist(conn):
+    # doctor_id NULL = dowolny lekarz; okno godzin [time_from, time_to)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            doctor_id INTEGER REFERENCES doctors(id),
+            date_from TEXT NOT NULL,
+            date_to TEXT NOT NULL,
+            time_from TEXT NOT NULL DEFAULT '00:00',
+            time_to TEXT NOT NULL DEFAULT '24:00',
+            status TEXT NOT NULL DEFAULT 'waiting',
+            booking_id INTEGER,
+            created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+        )
+    """)
+    # dopasowanie zwolnionego terminu: status = 'waiting', doctor_id = ? / IS NULL, date_from <= dzień
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_waitlist_match ON waitlist(status, doctor_id, date_from)")
+    # oferta trzyma termin rezerwacją HELD do expires_at
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS waitlist_offers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            waitlist_id INTEGER NOT NULL REFERENCES waitlist(id),
+            booking_id INTEGER NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            slot_id INTEGER NOT NULL,
+            token TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'open',
+            expires_at TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_waitlist_offers_due ON waitlist_offers(status, expires_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_waitlist_offers_slot "
+                 "ON waitlist_offers(doctor_id, date, slot_id)")
+    # wstrzymany termin jest zajęty tak samo jak zarezerwowany
+    conn.execute("DROP INDEX IF EXISTS idx_bookings_slot")
+    conn.execute("CREATE UNIQUE INDEX idx_bookings_slot "
+                 "ON bookings(doctor_id, date, slot_id) WHERE status IN ('BOOKED', 'HELD')")
+
+
+@migration(6, "Hasze haseł zapisanych otwartym tekstem")
+def _hash_plaintext_passwords(conn):
+    # auth.py haszowało takie hasła dopiero przy udanym logowaniu
+    rows = conn.execute("SELECT id, password FROM users").fetchall()
+    conn.executemany("UPDATE users SET password=? WHERE id=?", [
+        (generate_password_hash(row["password"], PASSWORD_HASH_METHOD), row["id"])
+        for row in rows if not row["password"].startswith(HASH_PREFIXES)
+    ])
+
+
+@migration(7, "Losowy token anulowania rezerwacji")
+def _booking_cancel_token(conn):
+    # link w e-mailu anuluje po tokenie, nie po kolejnym numerze rezerwacji
+    _add_column(conn, "bookings", "cancel_token", "TEXT")
+    conn.execute("UPDATE bookings SET cancel_token = lower(hex(randomblob(16))) WHERE cancel_token IS NULL")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bookings_cancel_token ON bookings(cancel_token)")
+
+
+@migration(8, "Unikalna pozycja oczekującego w kolejce lekarza")
+def _unique_queue_position(conn):
+    # dodania bez blokady zapisu mogły nadać dwóm pacjentom tę samą pozycję;
+    # numerujemy kolejki od nowa z zachowaniem kolejności (remis rozstrzyga id)
+    conn.execute("""
+        UPDATE patients SET position = (
+            SELECT COUNT(*) FROM patients AS p
+            WHERE p.doctor_id = patients.doctor_id AND p.status = 'oczekuje'
+              AND p.position IS NOT NULL
+              AND (p.position < patients.position
+                   OR (p.position = patients.position AND p.id <= patients.id))
+        )
+        WHERE status = 'oczekuje' AND position IS NOT NULL
+    """)
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_patients_doctor_position "
+        "ON patients(doctor_id, position) WHERE status = 'oczekuje'"
+    )
+
+
+# ---------------------------
+# URUCHAMIANIE
+# ---------------------------
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _is_empty(conn):
+    return conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+
+
+def upgrade(conn=None, target=None):
+    """Wykonuje brakujące migracje (do wersji target włącznie). Zwraca listę wykonanych wersji."""
+    own = conn is None
+    conn = conn or database.connect()
+    applied = []
+    try:
+        for version, _, apply in MIGRATIONS:
+            if target is not None and version > target:
+                break
+            if version <= current_version(conn):
+                continue
+            with immediate_transaction(conn):
+                # inny proces mógł ją wykonać, zanim dostaliśmy blokadę
+                if version <= current_version(conn):
+                    continue
+                apply(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+            applied.append(version)
+    finally:
+        if own:
+            conn.close()
+    return applied
+
+
+def seed(conn=None):
+    """Wczytuje dane testowe z seed.sql (idempotentnie)."""
+    own = conn is None
+    conn = conn or database.connect()
+    try:
+        with immediate_transaction(conn):
+            _run_script(conn, SEED_FILE)
+    finally:
+        if own:
+            conn.close()
+
+
+def ensure_schema(auto_migrate=True, seed_new=True):
+    """Sprawdzenie przy pierwszym połączeniu procesu: migruje (i zasiewa nową bazę) albo zgłasza błąd."""
+    conn = database.connect()
+    try:
+        version = current_version(conn)
+        if version >= latest_version():
+            return
+        if not auto_migrate:
+            raise RuntimeError(
+                f"Baza {database.DB_PATH} ma schemat w wersji {version}, wymagana {latest_version()} "
+                "– uruchom `flask db upgrade`"
+            )
+        is_new = _is_empty(conn)
+        upgrade(conn)
+        if is_new and seed_new:
+            seed(conn)
+    finally:
+        conn.close()
+
+
+# ---------------------------
+# POLECENIA CLI
+# ---------------------------
+
+db_cli = AppGroup("db", help="Schemat i dane bazy.")
+
+
+@db_cli.command("upgrade")
+@click.option("--to", "target", type=int, help="Zatrzymaj się na tej wersji.")
+def upgrade_command(target):
+    """Wykonuje brakujące migracje schematu."""
+    applied = upgrade(target=target)
+    descriptions = {version: description for version, description, _ in MIGRATIONS}
+    for version in applied:
+        click.echo(f"{version}: {descriptions[version]}")
+    click.echo(f"Baza w wersji {applied[-1]}." if applied else "Baza jest aktualna.")
+
+
+@db_cli.command("status")
+def status_command():
+    """Pokazuje wersję schematu i oczekujące migracje."""
+    conn = database.connect()
+    try:
+        version = current_version(conn)
+    finally:
+        conn.close()
+    click.echo(f"Baza: {database.DB_PATH}")
+    click.echo(f"Wersja schematu: {version} (najnowsza: {latest_version()})")
+    for number, description, _ in MIGRATIONS:
+        if number > version:
+            click.echo(f"  do wykonania {number}: {description}")
+
+
+@db_cli.command("seed")
+def seed_command():
+    """Wczytuje dane testowe (konta z README, przykładowy lekarz i kolejka)."""
+    upgrade()
+    seed()
+    click.echo("Dane testowe wczytane.")
+
+
+def init_app(app):
+    auto_migrate = bool(app.config.get("DB_AUTO_MIGRATE", True))
+    seed_new = bool(app.config.get("SEED_DEMO_DATA", True))
+    database.configure(ON_FIRST_CONNECT=lambda: ensure_schema(auto_migrate, seed_new))
+    app.cli.add_command(db_cli)
@@ -0,0 +1,383 @@
+"""
+Powiadomienia e-mail o rezerwacjach: potwierdzenie, anulowanie, zmiana terminu
+oraz przypomnienie dzień przed wizytą.
+
+Wiadomości nie są wysyłane w trakcie żądania. BookingStore zapisuje je do tabeli
+`notification_outbox` w tej samej transakcji co rezerwację (hak transakcji),
+więc nie ma rezerwacji bez powiadomienia ani powiadomienia o wycofanej
+rezerwacji. Wysyłają je wątki w tle (NOTIFY_WORKERS): każdy pobiera partię
+zaległych wiadomości i wysyła je jednym połączeniem SMTP, nieudane ponawia
+z rosnącym odstępem (NOTIFY_MAX_ATTEMPTS prób), a błędy trwałe (np. odrzucony
+adres) oznacza od razu jako "failed".
+
+Przypomnienie trafia do kolejki razem z potwierdzeniem, z send_after ustawionym
+REMINDER_HOURS_BEFORE godzin przed wizytą; anulowanie i zmiana terminu wycofują
+je w tej samej transakcji. Tą samą drogą idą oferty zwolnionych terminów dla
+listy oczekujących (enqueue_offer, wywoływane z waitlist.py).
+
+Wątki startuje `flask notify worker` (osobny proces) albo – przy NOTIFY_IN_PROCESS
+– sam serwer przy pierwszym żądaniu. `flask notify send` wysyła zaległe raz
+(np. z crona). Lokalnie można podstawić serwer testowy:
+`python -m aiosmtpd -n -l localhost:8025` i SMTP_PORT=8025.
+"""
+import logging
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime as dt_datetime, timedelta
+from email.message import EmailMessage
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from database import get_conn, immediate_transaction
+
+SMTP_HOST = "localhost"
+SMTP_PORT = 25
+SMTP_TIMEOUT = 10
+MAIL_FROM = "Przychodnia Medyczna <rejestracja@przychodnia.local>"
+NOTIFY_WORKERS = 2
+NOTIFY_BATCH = 50
+NOTIFY_POLL_SECONDS = 5
+NOTIFY_MAX_ATTEMPTS = 6
+NOTIFY_LEASE_SECONDS = 300    # po tylu sekundach wiadomość "sending" (np. po awarii workera) wraca do kolejki
+RETRY_BASE_SECONDS = 30       # 30 s, 1 min, 2 min, ... (z losowym rozrzutem)
+RETRY_MAX_SECONDS = 3600
+REMINDER_HOURS_BEFORE = 24
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+log = logging.getLogger("clinic.notifications")
+
+
+def _timestamp(moment):
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _visit_start(appt):
+    return dt_datetime.strptime(f"{appt['date']} {appt['time']}", "%Y-%m-%d %H:%M")
+
+
+# ---------------------------
+# TREŚĆ WIADOMOŚCI
+# ---------------------------
+
+def _visit_line(appt):
+    return f"{appt['doctor_name']}, {appt['date']} o godz. {appt['time']}"
+
+
+def _links(appt, public_url):
+    if not public_url:
+        return ""
+    base = public_url.rstrip("/")
+    # anulowanie po losowym tokenie i dopiero po potwierdzeniu (POST) – skanery
+    # poczty otwierające linki nie anulują wizyty, a id rezerwacji nie wystarczy
+    return (f"\n\nZmiana terminu: {base}/reschedule/{appt['id']}"
+            f"\nAnulowanie: {base}/booking/{appt['cancel_token']}/cancel")
+
+
+def _offer_links(offer, public_url):
+    path = f"/waitlist/offer/{offer['token']}"
+    return f"\n\nPotwierdzenie lub rezygnacja: {public_url.rstrip('/') + path if public_url else path}"
+
+
+def compose(kind, appt, previous=None, public_url=None, offer=None):
+    """(temat, treść) wiadomości danego rodzaju."""
+    greeting = f"Dzień dobry {appt['patient_name']},\n\n"
+    if kind == "booked":
+        return ("Potwierdzenie rezerwacji wizyty",
+                greeting + f"potwierdzamy rezerwację wizyty: {_visit_line(appt)}."
+                + _links(appt, public_url))
+    if kind == "rescheduled":
+        return ("Zmiana terminu wizyty",
+                greeting + f"termin wizyty został zmieniony z {previous['date']} {previous['time']} "
+                f"na: {_visit_line(appt)}." + _links(appt, public_url))
+    if kind == "cancelled":
+        return ("Anulowanie wizyty",
+                greeting + f"wizyta {_visit_line(appt)} została anulowana.")
+    if kind == "offer":
+        return ("Zwolnił się termin wizyty",
+                greeting + f"zwolnił się termin pasujący do zapisu na liście oczekujących: "
+                f"{_visit_line(appt)}. Termin czeka na potwierdzenie do {offer['expires_at'][:16]}."
+                + _offer_links(offer, public_url))
+    if kind == "reminder":
+        return ("Przypomnienie o wizycie",
+                greeting + f"przypominamy o zbliżającej się wizycie: {_visit_line(appt)}."
+                + _links(appt, public_url))
+    raise ValueError(kind)
+
+
+# ---------------------------
+# WYSYŁKA
+# ---------------------------
+
+class Notifier:
+
+    def __init__(self, bookings):
+        self.config = {
+            "SMTP_HOST": SMTP_HOST, "SMTP_PORT": SMTP_PORT, "SMTP_USER": None,
+            "SMTP_PASSWORD": None, "SMTP_STARTTLS": False, "SMTP_TIMEOUT": SMTP_TIMEOUT,
+            "MAIL_FROM": MAIL_FROM, "PUBLIC_URL": None,
+            "NOTIFY_WORKERS": NOTIFY_WORKERS, "NOTIFY_BATCH": NOTIFY_BATCH,
+            "NOTIFY_POLL_SECONDS": NOTIFY_POLL_SECONDS, "NOTIFY_MAX_ATTEMPTS": NOTIFY_MAX_ATTEMPTS,
+            "REMINDER_HOURS_BEFORE": REMINDER_HOURS_BEFORE,
+        }
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        bookings.add_transaction_hook(self._enqueue)
+        # zatwierdzona rezerwacja w tym procesie -> budzimy wątki, nie czekamy na odpytanie
+        bookings.add_listener(lambda event, appt, previous=None: self._wake.set())
+
+    def init_app(self, app):
+        for key in self.config:
+            if key in app.config:
+                self.config[key] = app.config[key]
+        if app.config.get("NOTIFY_IN_PROCESS"):
+            app.before_request(self.start)
+        app.cli.add_command(notify_cli)
+        app.extensions["notifier"] = self
+
+    # --- zapis do outboxa (w transakcji rezerwacji) ---
+
+    def _insert(self, conn, appt, messages, previous=None, offer=None):
+        conn.executemany(
+            """
+            INSERT INTO notification_outbox (booking_id, kind, recipient, subject, body, send_after)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (appt["id"], kind, appt["email"],
+                 *compose(kind, appt, previous, self.config["PUBLIC_URL"], offer), _timestamp(send_after))
+                for kind, send_after in messages
+            ]
+        )
+
+    def _enqueue(self, conn, event, appt, previous=None, now=None):
+        now = now or dt_datetime.now()
+        # przypomnienie o starym terminie i niewysłana oferta (przyjęta albo zamknięta) są już nieaktualne
+        stale = {"cancelled": "reminder", "rescheduled": "reminder",
+                 "booked": "offer", "released": "offer"}.get(event)
+        if stale:
+            conn.execute(
+                "UPDATE notification_outbox SET status=? "
+                "WHERE booking_id=? AND kind=? AND status=?",
+                (CANCELLED, appt["id"], stale, PENDING)
+            )
+        # "held"/"released" – ofertę wysyła waitlist.py przez enqueue_offer()
+        if event not in ("booked", "rescheduled", "cancelled") or not appt.get("email"):
+            return
+
+        messages = [(event, now)]
+        if event in ("booked", "rescheduled"):
+            remind_at = _visit_start(appt) - timedelta(hours=float(self.config["REMINDER_HOURS_BEFORE"]))
+            if remind_at > now:  # wizyta za mniej niż dobę – wystarczy potwierdzenie
+                messages.append(("reminder", remind_at))
+        self._insert(conn, appt, messages, previous)
+
+    def enqueue_offer(self, conn, appt, offer, now=None):
+        """Oferta wstrzymanego terminu dla pacjenta z listy oczekujących (w transakcji oferty)."""
+        self._insert(conn, appt, [("offer", now or dt_datetime.now())], offer=offer)
+
+    # --- pobieranie i wysyłka ---
+
+    def _claim(self, conn, limit, now):
+        """Rezerwuje partię zaległych wiadomości (status "sending" na czas dzierżawy)."""
+        with immediate_transaction(conn):
+            return conn.execute(
+                """
+                UPDATE notification_outbox
+                SET status=?, send_after=?, attempts=attempts + 1
+                WHERE id IN (
+                    SELECT id FROM notification_outbox
+                    WHERE status IN (?, ?) AND send_after <= ?
+                    ORDER BY send_after
+                    LIMIT ?
+                )
+                RETURNING id, recipient, subject, body, attempts
+                """,
+                (SENDING, _timestamp(now + timedelta(seconds=NOTIFY_LEASE_SECONDS)),
+                 PENDING, SENDING, _timestamp(now), limit)
+            ).fetchall()
+
+    def _connect_smtp(self):
+        config = self.config
+        smtp = smtplib.SMTP(config["SMTP_HOST"], int(config["SMTP_PORT"]),
+                            timeout=float(config["SMTP_TIMEOUT"]))
+        if config["SMTP_STARTTLS"]:
+            smtp.starttls()
+        if config["SMTP_USER"]:
+            smtp.login(config["SMTP_USER"], config["SMTP_PASSWORD"])
+        return smtp
+
+    def _message(self, row):
+        message = EmailMessage()
+        message["From"] = self.config["MAIL_FROM"]
+        message["To"] = row["recipient"]
+        message["Subject"] = row["subject"]
+        message.set_content(row["body"])
+        return message
+
+    def _retry_delay(self, attempts):
+        delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _finish(self, conn, results, now):
+        """Zapisuje wyniki partii: (id, próby, błąd albo None, czy błąd trwały)."""
+        sent, retry, failed = [], [], []
+        for message_id, attempts, error, permanent in results:
+            if error is None:
+                sent.append((_timestamp(now), message_id))
+            elif permanent or attempts >= int(self.config["NOTIFY_MAX_ATTEMPTS"]):
+                failed.append((error, message_id))
+            else:
+                retry_at = now + timedelta(seconds=self._retry_delay(attempts))
+                retry.append((_timestamp(retry_at), error, message_id))
+        with immediate_transaction(conn):
+            conn.executemany(
+                f"UPDATE notification_outbox SET status='{SENT}', sent_at=?, last_error=NULL WHERE id=?",
+                sent)
+            conn.executemany(
+                f"UPDATE notification_outbox SET status='{PENDING}', send_after=?, last_error=? WHERE id=?",
+                retry)
+            conn.executemany(
+                f"UPDATE notification_outbox SET status='{FAILED}', last_error=? WHERE id=?",
+                failed)
+        return len(sent), len(retry), len(failed)
+
+    def _send_batch(self, rows, smtp):
+        """Wysyła partię jednym połączeniem. Zwraca (wyniki, połączenie do dalszego użycia albo None)."""
+        results = []
+        unavailable = None
+        for row in rows:
+            if unavailable:
+                # serwer niedostępny – reszty partii nie próbujemy, wróci do kolejki
+                results.append((row["id"], row["attempts"], unavailable, False))
+                continue
+            try:
+                if smtp is None:
+                    smtp = self._connect_smtp()
+                smtp.send_message(self._message(row))
+                results.append((row["id"], row["attempts"], None, False))
+            except smtplib.SMTPRecipientsRefused as e:
+                results.append((row["id"], row["attempts"], f"Adres odrzucony: {e.recipients}", True))
+            except smtplib.SMTPResponseException as e:
+                permanent = 500 <= e.smtp_code < 600
+                results.append((row["id"], row["attempts"], f"{e.smtp_code} {e.smtp_error!r}", permanent))
+                if not permanent:
+                    smtp = self._close(smtp)
+            except (OSError, smtplib.SMTPException) as e:
+                unavailable = repr(e)
+                results.append((row["id"], row["attempts"], unavailable, False))
+                smtp = self._close(smtp)
+        return results, smtp
+
+    @staticmethod
+    def _close(smtp):
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (OSError, smtplib.SMTPException):
+                smtp.close()
+        return None
+
+    def drain(self, conn=None, now=None):
+        """
+        Wysyła wszystkie zaległe wiadomości partiami – jednym połączeniem SMTP,
+        otwieranym dopiero, gdy jest co wysłać. Zwraca (wysłane, do ponowienia, nieudane).
+        """
+        conn = conn or get_conn()
+        totals = [0, 0, 0]
+        smtp = None
+        while True:
+            moment = now or dt_datetime.now()
+            rows = self._claim(conn, int(self.config["NOTIFY_BATCH"]), moment)
+            if not rows:
+                break
+            results, smtp = self._send_batch(rows, smtp)
+            for i, count in enumerate(self._finish(conn, results, moment)):
+                totals[i] += count
+            if smtp is None and any(error for _, _, error, _ in results):
+                break  # SMTP nie działa – nie mielimy kolejki, spróbujemy po odstępie
+        self._close(smtp)
+        return tuple(totals)
+
+    # --- wątki w tle ---
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                sent, retry, failed = self.drain()
+                if sent or retry or failed:
+                    log.info("Powiadomienia: wysłane %d, do ponowienia %d, nieudane %d", sent, retry, failed)
+            except Exception:
+                log.exception("Błąd wysyłki powiadomień")
+            # czekamy na nową rezerwację w tym procesie albo kolejne odpytanie bazy
+            self._wake.wait(float(self.config["NOTIFY_POLL_SECONDS"]))
+            self._wake.clear()
+
+    def start(self):
+        """Uruchamia wątki wysyłki (raz na proces)."""
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for n in range(int(self.config["NOTIFY_WORKERS"])):
+                thread = threading.Thread(target=self._worker, name=f"notify-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+# ---------------------------
+# POLECENIA CLI
+# ---------------------------
+
+notify_cli = AppGroup("notify", help="Powiadomienia e-mail.")
+
+
+def _notifier():
+    return current_app.extensions["notifier"]
+
+
+@notify_cli.command("worker")
+def worker_command():
+    """Wysyła powiadomienia w tle do przerwania (Ctrl+C)."""
+    notifier = _notifier()
+    notifier.start()
+    click.echo(f"Wysyłka powiadomień: {notifier.config['NOTIFY_WORKERS']} wątki, Ctrl+C kończy.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        notifier.stop()
+
+
+@notify_cli.command("send")
+def send_command():
+    """Wysyła jednorazowo wszystkie zaległe powiadomienia."""
+    sent, retry, failed = _notifier().drain()
+    click.echo(f"Wysłane: {sent}, do ponowienia: {retry}, nieudane: {failed}.")
+
+
+@notify_cli.command("status")
+def status_command():
+    """Liczba wiadomości w outboxie według statusu."""
+    for row in get_conn().execute(
+        "SELECT status, COUNT(*) AS n FROM notification_outbox GROUP BY status ORDER BY status"
+    ):
+        click.echo(f"{row['status']}: {row['n']}")
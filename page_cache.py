@@ -0,0 +1,129 @@
+"""
+Cache gotowych stron HTML dla rzadko zmieniających się widoków
+(lista lekarzy, wolne terminy, grafik lekarza).
+
+Wpis to wyrenderowana odpowiedź dla (widok, argumenty, rola użytkownika),
+oznaczona tagami danych, z których powstała ("doctors", "slots", ...).
+Trasy zapisujące dane wołają invalidate(tag) – wtedy wypadają tylko strony
+z tym tagiem. Każda odpowiedź ma ETag, więc przeglądarka z aktualną kopią
+dostaje 304 bez treści.
+
+Cache jest w pamięci procesu: ograniczony liczbą wpisów (LRU) i czasem życia
+PAGE_CACHE_TTL – zmiany z innych procesów widać najpóźniej po tym czasie.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+PAGE_CACHE_SIZE = 256
+PAGE_CACHE_TTL = 60
+
+
+class _Page:
+    __slots__ = ("body", "mimetype", "etag", "tags", "stored_at")
+
+    def __init__(self, body, mimetype, etag, tags, stored_at):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.tags = tags
+        self.stored_at = stored_at
+
+
+class PageCache:
+
+    def __init__(self, maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+        # rośnie przy każdym invalidate – strona liczona w trakcie zmiany nie trafi do cache
+        self._generation = 0
+
+    def init_app(self, app):
+        self.maxsize = int(app.config.get("PAGE_CACHE_SIZE", self.maxsize))
+        self.ttl = int(app.config.get("PAGE_CACHE_TTL", self.ttl))
+        app.extensions["page_cache"] = self
+
+    # --- przechowywanie ---
+
+    def _get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                return None
+            if time.monotonic() - page.stored_at > self.ttl:
+                del self._pages[key]
+                return None
+            self._pages.move_to_end(key)
+            return page
+
+    def _put(self, key, page, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.maxsize:
+                self._pages.popitem(last=False)
+
+    def invalidate(self, *tags):
+        """Usuwa strony z którymkolwiek z podanych tagów; bez tagów – wszystkie."""
+        with self._lock:
+            self._generation += 1
+            if not tags:
+                self._pages.clear()
+                return
+            stale = [key for key, page in self._pages.items() if page.tags & set(tags)]
+            for key in stale:
+                del self._pages[key]
+
+    # --- dekorator widoku ---
+
+    @staticmethod
+    def _key():
+        return (
+            request.endpoint,
+            tuple(sorted((request.view_args or {}).items())),
+            tuple(sorted(request.args.items(multi=True))),
+            session.get("role"),
+        )
+
+    @staticmethod
+    def _respond(page):
+        response = current_app.response_class(page.body, mimetype=page.mimetype)
+        response.set_etag(page.etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+
+    def cached(self, *tags):
+        """Cache'uje odpowiedzi GET widoku; tags – dane, od których zależy strona."""
+        tags = frozenset(tags)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != "GET":
+                    return view(*args, **kwargs)
+
+                key = self._key()
+                page = self._get(key)
+                if page is not None:
+                    return self._respond(page)
+
+                generation = self._generation
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+
+                body = response.get_data()
+                page = _Page(body, response.mimetype, hashlib.sha1(body).hexdigest(),
+                             tags, time.monotonic())
+                self._put(key, page, generation)
+                return self._respond(page)
+            return wrapper
+        return decorator
@@ -0,0 +1,316 @@
+"""
+Hurtowy import grafików lekarzy (plik CSV/JSON, polecenie `flask schedule ...`, API).
+
+Wpis grafiku: doctor_id, day (1=pon ... 7=niedz), start_time, end_time ("HH:MM")
+oraz opcjonalnie every_weeks (1 = co tydzień, 2 = co drugi tydzień, ...),
+valid_from i valid_to ("YYYY-MM-DD"). Wyjątki (urlopy, święta): doctor_id
+(puste = cała przychodnia), date_from, date_to, reason.
+
+CSV zawiera same wpisy grafiku (nagłówek z nazwami kolumn, separator , albo ;).
+JSON to lista wpisów albo obiekt {"shifts": [...], "exceptions": [...]}.
+
+Cały plik jest najpierw sprawdzany – błędne wiersze i nakładające się dyżury
+tego samego lekarza przerywają import, a poprawny plik trafia do bazy
+w jednej transakcji (executemany).
+"""
+import csv
+import heapq
+import io
+import json
+import math
+from collections import defaultdict, namedtuple
+from datetime import date as dt_date
+
+import click
+from flask.cli import AppGroup
+
+from database import add_schedules, get_conn
+import slots as slot_calendar
+
+MAX_IMPORT_ROWS = 20000
+MAX_EVERY_WEEKS = 8
+
+DAY_NAMES = {1: "pon", 2: "wt", 3: "śr", 4: "czw", 5: "pt", 6: "sob", 7: "niedz"}
+
+# start/end w minutach od północy; row = numer wpisu w pliku (None = wpis już w bazie)
+Shift = namedtuple("Shift", "doctor_id day start end every_weeks valid_from valid_to row")
+
+
+class ScheduleImportError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors[0] if errors else "Niepoprawny grafik")
+        self.errors = errors
+
+
+# ---------------------------
+# WCZYTYWANIE PLIKÓW
+# ---------------------------
+
+def parse_csv(text):
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;")
+    except csv.Error:
+        dialect = csv.excel
+    return list(csv.DictReader(io.StringIO(text), dialect=dialect)), []
+
+
+def parse_json(text):
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise ScheduleImportError([f"Niepoprawny JSON: {e}"])
+    if isinstance(data, list):
+        return data, []
+    if isinstance(data, dict):
+        return data.get("shifts") or [], data.get("exceptions") or []
+    raise ScheduleImportError(["JSON musi być listą wpisów albo obiektem {shifts, exceptions}"])
+
+
+def parse_upload(filename, text):
+    """(wpisy, wyjątki) z zawartości pliku – format po rozszerzeniu nazwy."""
+    if filename.lower().endswith(".json"):
+        return parse_json(text)
+    if filename.lower().endswith(".csv"):
+        return parse_csv(text)
+    raise ScheduleImportError(["Obsługiwane są pliki .csv i .json"])
+
+
+# ---------------------------
+# WALIDACJA
+# ---------------------------
+
+def _minutes(value):
+    hour, minute = str(value).strip().split(":")
+    hour, minute = int(hour), int(minute)
+    # "24:00" odrzucamy – siatka terminów (slots.py) liczy godziny w obrębie doby
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(value)
+    return hour * 60 + minute
+
+
+def _hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _date(value):
+    value = str(value or "").strip()
+    return dt_date.fromisoformat(value).isoformat() if value else None
+
+
+def _shift(entry, row, doctor_ids):
+    if not isinstance(entry, dict):
+        raise ValueError("wpis musi być obiektem")
+    try:
+        doctor_id = int(entry["doctor_id"])
+        day = int(entry["day"])
+        start = _minutes(entry["start_time"])
+        end = _minutes(entry["end_time"])
+        every_weeks = int(entry.get("every_weeks") or 1)
+        valid_from = _date(entry.get("valid_from"))
+        valid_to = _date(entry.get("valid_to"))
+    except KeyError as e:
+        raise ValueError(f"brak pola {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("niepoprawna liczba, godzina (HH:MM) albo data (YYYY-MM-DD)")
+
+    if doctor_id not in doctor_ids:
+        raise ValueError(f"nie ma lekarza {doctor_id}")
+    if not 1 <= day <= 7:
+        raise ValueError("dzień tygodnia musi być z zakresu 1..7")
+    if start >= end:
+        raise ValueError("godzina rozpoczęcia musi być przed godziną zakończenia")
+    if end - start < slot_calendar.SLOT_MINUTES:
+        raise ValueError(f"dyżur jest krótszy niż jeden termin ({slot_calendar.SLOT_MINUTES} min)")
+    if not 1 <= every_weeks <= MAX_EVERY_WEEKS:
+        raise ValueError(f"every_weeks musi być z zakresu 1..{MAX_EVERY_WEEKS}")
+    if valid_from and valid_to and valid_from > valid_to:
+        raise ValueError("valid_from jest po valid_to")
+    return Shift(doctor_id, day, start, end, every_weeks, valid_from, valid_to, row)
+
+
+def _exception(entry, doctor_ids):
+    if not isinstance(entry, dict):
+        raise ValueError("wyjątek musi być obiektem")
+    try:
+        doctor_id = entry.get("doctor_id")
+        doctor_id = int(doctor_id) if doctor_id not in (None, "") else None
+        date_from = _date(entry["date_from"])
+        date_to = _date(entry.get("date_to")) or date_from
+    except KeyError as e:
+        raise ValueError(f"brak pola {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("niepoprawny lekarz albo data (YYYY-MM-DD)")
+
+    if date_from is None or date_from > date_to:
+        raise ValueError("niepoprawny zakres dat")
+    if doctor_id is not None and doctor_id not in doctor_ids:
+        raise ValueError(f"nie ma lekarza {doctor_id}")
+    return doctor_id, date_from, date_to, entry.get("reason")
+
+
+# ---------------------------
+# NAKŁADANIE SIĘ DYŻURÓW
+# ---------------------------
+
+def _recurrences_meet(a, b):
+    """
+    Czy dwa wpisy na ten sam dzień tygodnia mogą wypaść w tym samym tygodniu.
+    Tygodnie wpisu to anchor + k*every_weeks; dwa takie ciągi się spotykają,
+    gdy różnica początków dzieli się przez NWD okresów. Zakresy dat
+    sprawdzamy tylko pod kątem rozłączności (ocena zachowawcza).
+    """
+    if (a.valid_to and b.valid_from and a.valid_to < b.valid_from) or \
+            (b.valid_to and a.valid_from and b.valid_to < a.valid_from):
+        return False
+    anchor_a = slot_calendar.week_index(dt_date.fromisoformat(a.valid_from)) if a.valid_from else 0
+    anchor_b = slot_calendar.week_index(dt_date.fromisoformat(b.valid_from)) if b.valid_from else 0
+    return (anchor_a - anchor_b) % math.gcd(a.every_weeks, b.every_weeks) == 0
+
+
+class ShiftIndex:
+    """
+    Dyżury pogrupowane po (lekarz, dzień tygodnia) i przeglądane w kolejności
+    godziny rozpoczęcia. Kopiec końców trzyma tylko dyżury trwające w danej chwili,
+    więc każdy nowy dyżur porównujemy z kilkoma aktywnymi, a nie ze wszystkimi.
+    """
+
+    def __init__(self, shifts=()):
+        self._days = defaultdict(list)
+        for shift in shifts:
+            self.add(shift)
+
+    def add(self, shift):
+        self._days[(shift.doctor_id, shift.day)].append(shift)
+
+    def overlaps(self):
+        """Pary (wcześniejszy, późniejszy) nakładających się dyżurów."""
+        for shifts in self._days.values():
+            shifts.sort(key=lambda s: s.start)
+            active = []
+            for seq, shift in enumerate(shifts):
+                while active and active[0][0] <= shift.start:
+                    heapq.heappop(active)
+                for _, _, other in active:
+                    if _recurrences_meet(other, shift):
+                        yield other, shift
+                heapq.heappush(active, (shift.end, seq, shift))
+
+
+def _describe(shift):
+    where = f"wpis {shift.row}" if shift.row is not None else "istniejący grafik"
+    return (f"{where} (lekarz {shift.doctor_id}, {DAY_NAMES[shift.day]} "
+            f"{_hhmm(shift.start)}-{_hhmm(shift.end)})")
+
+
+def _existing_shifts(conn, doctor_ids):
+    for doctor_id in doctor_ids:
+        for row in conn.execute(
+            "SELECT doctor_id, day_of_week, start_time, end_time, every_weeks, valid_from, valid_to "
+            "FROM doctor_schedule WHERE doctor_id=?",
+            (doctor_id,)
+        ):
+            try:
+                start, end = _minutes(row["start_time"]), _minutes(row["end_time"])
+            except ValueError:
+                continue
+            yield Shift(row["doctor_id"], row["day_of_week"], start, end,
+                        row["every_weeks"] or 1, row["valid_from"], row["valid_to"], None)
+
+
+# ---------------------------
+# IMPORT
+# ---------------------------
+
+def import_schedules(entries, exceptions=(), replace=False):
+    """
+    Sprawdza i zapisuje wpisy grafiku oraz wyjątki w jednej transakcji.
+    replace=True – dotychczasowy grafik lekarzy z importu jest zastępowany.
+    Zwraca (liczba wpisów, liczba wyjątków); przy błędach rzuca ScheduleImportError.
+    """
+    if len(entries) + len(exceptions) > MAX_IMPORT_ROWS:
+        raise ScheduleImportError([f"Za dużo wpisów (maks. {MAX_IMPORT_ROWS})"])
+
+    conn = get_conn()
+    doctor_ids = {r["id"] for r in conn.execute("SELECT id FROM doctors")}
+
+    errors = []
+    shifts = []
+    for row, entry in enumerate(entries, start=1):
+        try:
+            shifts.append(_shift(entry, row, doctor_ids))
+        except ValueError as e:
+            errors.append(f"wpis {row}: {e}")
+    closed = []
+    for row, entry in enumerate(exceptions, start=1):
+        try:
+            closed.append(_exception(entry, doctor_ids))
+        except ValueError as e:
+            errors.append(f"wyjątek {row}: {e}")
+    if errors:
+        raise ScheduleImportError(errors)
+
+    imported_doctors = {s.doctor_id for s in shifts}
+    index = ShiftIndex(shifts)
+    if not replace:
+        for shift in _existing_shifts(conn, sorted(imported_doctors)):
+            index.add(shift)
+    for first, second in index.overlaps():
+        if first.row is not None or second.row is not None:
+            errors.append(f"{_describe(second)} nakłada się na {_describe(first)}")
+    if errors:
+        raise ScheduleImportError(errors)
+
+    add_schedules(
+        [
+            (s.doctor_id, s.day, _hhmm(s.start), _hhmm(s.end), s.every_weeks, s.valid_from, s.valid_to)
+            for s in shifts
+        ],
+        exceptions=closed,
+        replace_doctor_ids=sorted(imported_doctors) if replace else (),
+    )
+    return len(shifts), len(closed)
+
+
+# ---------------------------
+# POLECENIA CLI
+# ---------------------------
+
+schedule_cli = AppGroup("schedule", help="Grafiki lekarzy.")
+
+
+@schedule_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--replace", is_flag=True, help="Zastąp dotychczasowy grafik lekarzy z pliku.")
+def import_command(path, replace):
+    """Importuje grafik z pliku CSV albo JSON."""
+    with open(path, encoding="utf-8-sig") as f:
+        text = f.read()
+    try:
+        entries, exceptions = parse_upload(path, text)
+        added, closed = import_schedules(entries, exceptions, replace=replace)
+    except ScheduleImportError as e:
+        for error in e.errors:
+            click.echo(error, err=True)
+        raise click.ClickException("Import przerwany – nic nie zostało zapisane.")
+    slot_calendar.invalidate()
+    click.echo(f"Zaimportowano {added} wpisów grafiku i {closed} wyjątków.")
+
+
+@schedule_cli.command("holiday")
+@click.argument("date_from")
+@click.argument("date_to", required=False)
+@click.option("--doctor", "doctor_id", type=int, help="Tylko dla tego lekarza (domyślnie cała przychodnia).")
+@click.option("--reason", help="Powód, np. nazwa święta.")
+def holiday_command(date_from, date_to, doctor_id, reason):
+    """Dodaje dni bez przyjęć (DATE_FROM [DATE_TO], format YYYY-MM-DD)."""
+    exception = {"doctor_id": doctor_id, "date_from": date_from, "date_to": date_to, "reason": reason}
+    try:
+        import_schedules([], [exception])
+    except ScheduleImportError as e:
+        raise click.ClickException(e.errors[0])
+    slot_calendar.invalidate()
+    click.echo("Zapisano.")
+
+
+def init_app(app):
+    app.cli.add_command(schedule_cli)
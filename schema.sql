@@ -1,8 +1,12 @@
+-- Tabele podstawowe (migracja 1). Dane testowe są w seed.sql,
+-- a kolejne zmiany schematu – w migrations.py.
+
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT UNIQUE NOT NULL,
     password TEXT NOT NULL,
-    role TEXT NOT NULL
+    role TEXT NOT NULL,
+    doctor_id INTEGER REFERENCES doctors(id)
 );
 
 CREATE TABLE IF NOT EXISTS doctors (
@@ -21,16 +25,6 @@ CREATE TABLE IF NOT EXISTS patients (
     FOREIGN KEY(doctor_id) REFERENCES doctors(id)
 );
 
-INSERT OR IGNORE INTO users (username, password, role) VALUES ('rejestratorka', 'haslo123', 'rejestratorka');
-
-INSERT OR IGNORE INTO doctors (id, name, hours) VALUES (1, 'dr Anna Nowak', '08:00-16:00');
-
-INSERT OR IGNORE INTO patients (name, status, doctor_id, position) VALUES ('Jan Kowalski', 'oczekuje', 1, 1);
-INSERT OR IGNORE INTO patients (name, status, doctor_id, position) VALUES ('Maria Zalewska', 'oczekuje', 1, 2);
-
-INSERT INTO users (username, password, role)
-VALUES ('lekarz1', 'haslo123', 'lekarz');
-
 CREATE TABLE IF NOT EXISTS appointments (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     doctor_id INTEGER,
@@ -38,8 +32,6 @@ CREATE TABLE IF NOT EXISTS appointments (
     appointment_time TEXT,
     status TEXT DEFAULT 'wolny'
 );
-INSERT INTO appointments (doctor_id, appointment_time) VALUES (1, '2025-12-18 10:00');
-INSERT INTO appointments (doctor_id, appointment_time) VALUES (1, '2025-12-18 11:00');
 
 CREATE TABLE IF NOT EXISTS doctor_schedule (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
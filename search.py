@@ -0,0 +1,54 @@
+"""
+Wyszukiwanie pacjentów po nazwisku i treści notatek (indeks FTS5 `patients_fts`,
+migracja 3) – w bieżących kolejkach i w archiwum.
+
+Każde słowo zapytania jest dopasowywane jako prefiks ("kowa" znajdzie
+"Kowalski"), bez względu na wielkość liter i polskie znaki ("zolc" znajdzie
+"Żółć"). Wyniki są sortowane po trafności (bm25), trafienie w nazwisku
+waży więcej niż w notatce.
+"""
+import re
+
+from database import get_conn
+
+SEARCH_PAGE_SIZE = 50
+MAX_TERMS = 8
+MIN_TERM_LENGTH = 2   # krótsze słowa pomijamy – indeks prefiksów zaczyna się od 2 znaków
+NAME_WEIGHT = 10.0
+NOTE_WEIGHT = 1.0
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def fts_query(text):
+    """Zapytanie FTS5 z tekstu użytkownika: słowa jako prefiksy w cudzysłowie (bez składni FTS)."""
+    terms = _WORD.findall(text.replace("ł", "l").replace("Ł", "L"))
+    terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH][:MAX_TERMS]
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_patients(text, limit=SEARCH_PAGE_SIZE, offset=0):
+    """Pacjenci pasujący do `text`, najtrafniejsi pierwsi; pusta lista dla pustego zapytania."""
+    query = fts_query(text)
+    if not query:
+        return []
+    return get_conn().execute(f"""
+        SELECT f.rowid AS id,
+               COALESCE(p.name, a.name) AS name,
+               COALESCE(p.note, a.note) AS note,
+               COALESCE(p.status, a.status) AS status,
+               COALESCE(p.doctor_id, a.doctor_id) AS doctor_id,
+               COALESCE(p.added_at, a.added_at) AS added_at,
+               a.visit_date,
+               p.id IS NULL AS archived
+        FROM (
+            SELECT rowid, bm25(patients_fts, {NAME_WEIGHT}, {NOTE_WEIGHT}) AS score
+            FROM patients_fts
+            WHERE patients_fts MATCH ?
+            ORDER BY score, rowid DESC
+            LIMIT ? OFFSET ?
+        ) f
+        LEFT JOIN patients p ON p.id = f.rowid
+        LEFT JOIN patients_archive a ON a.id = f.rowid
+        ORDER BY f.score, f.rowid DESC
+    """, (query, limit, offset)).fetchall()
@@ -0,0 +1,22 @@
+-- Dane testowe (konta z README, jeden lekarz, przykładowa kolejka i terminy).
+-- Wczytywane do nowej bazy albo poleceniem `flask db seed`; każdy INSERT
+-- jest idempotentny, więc ponowne uruchomienie niczego nie dubluje.
+
+INSERT OR IGNORE INTO doctors (id, name, hours) VALUES (1, 'dr Anna Nowak', '08:00-16:00');
+
+-- hasło obu kont: haslo123 (hasz scrypt, jak zapisuje auth.py)
+INSERT OR IGNORE INTO users (username, password, role) VALUES ('rejestratorka',
+    'scrypt:32768:8:1$htnaS88qEVXMVQ4z$a5ab06c9c7433e9c9e49d35e234c15fa4172035c59ffc91dc36b2643b6b653d5f955c3f4422159d20b54737d555cf9dc1bc683ba808be3a8a7d2b32ad8c25e18', 'rejestratorka');
+INSERT OR IGNORE INTO users (username, password, role, doctor_id) VALUES ('lekarz1',
+    'scrypt:32768:8:1$htnaS88qEVXMVQ4z$a5ab06c9c7433e9c9e49d35e234c15fa4172035c59ffc91dc36b2643b6b653d5f955c3f4422159d20b54737d555cf9dc1bc683ba808be3a8a7d2b32ad8c25e18', 'lekarz', 1);
+
+-- pacjent przeniesiony już do archiwum nie wraca do kolejki
+INSERT OR IGNORE INTO patients (id, name, status, doctor_id, position)
+SELECT * FROM (VALUES
+    (1, 'Jan Kowalski', 'oczekuje', 1, 1),
+    (2, 'Maria Zalewska', 'oczekuje', 1, 2)
+)
+WHERE column1 NOT IN (SELECT id FROM patients_archive);
+
+INSERT OR IGNORE INTO appointments (id, doctor_id, appointment_time) VALUES (1, 1, '2025-12-18 10:00');
+INSERT OR IGNORE INTO appointments (id, doctor_id, appointment_time) VALUES (2, 1, '2025-12-18 11:00');
@@ -0,0 +1,229 @@
+"""
+Generowanie terminów wizyt z grafików lekarzy.
+
+Terminy wynikają z tabeli doctor_schedule (dzień tygodnia + godziny).
+Wpis może obowiązywać co N tygodni (every_weeks, liczone od valid_from)
+i tylko w okresie valid_from..valid_to. W dni z schedule_exceptions
+(urlop lekarza, święto całej przychodni) terminów nie ma.
+Lekarz bez żadnego wpisu w grafiku przyjmuje od poniedziałku do piątku
+w godzinach z doctors.hours (np. "08:00-16:00").
+
+Siatka terminów jest liczona raz na (lekarz, dzień) i trzymana w cache,
+który czyścimy przy zmianie grafiku lub danych lekarza (invalidate()).
+Cache jest w pamięci procesu, więc dodatkowo wygasa po SLOT_CACHE_TTL sekund
+– inne procesy zobaczą zmianę grafiku najpóźniej po tym czasie.
+"""
+import logging
+import threading
+import time
+from datetime import date as dt_date, datetime as dt_datetime, timedelta
+from functools import lru_cache
+
+from database import get_conn
+
+SLOT_MINUTES = 30
+SLOT_CACHE_TTL = 300
+SLOT_CACHE_SIZE = 8192
+
+# poniedziałek, od którego liczymy tygodnie wpisów "co N tygodni" bez valid_from
+EPOCH_MONDAY = dt_date(2024, 1, 1)
+
+_lock = threading.Lock()
+_cached_at = time.monotonic()
+
+log = logging.getLogger("clinic.slots")
+
+
+def make_slot_id(doctor_id, hhmm):
+    """slot_id = lekarz * 10000 + HHMM, np. lekarz 2 o 10:30 -> 21030."""
+    hour, minute = hhmm.split(":")
+    return doctor_id * 10000 + int(hour) * 100 + int(minute)
+
+
+def slot_doctor_id(slot_id):
+    return slot_id // 10000
+
+
+def week_index(day):
+    """Numer tygodnia (od EPOCH_MONDAY) dla obiektu date."""
+    return (day - EPOCH_MONDAY).days // 7
+
+
+def applies_on(every_weeks, valid_from, valid_to, day):
+    """Czy wpis grafiku obowiązuje w danym dniu (obiekt date) – dzień tygodnia już pasuje."""
+    iso_day = day.isoformat()
+    if (valid_from and iso_day < valid_from) or (valid_to and iso_day > valid_to):
+        return False
+    anchor = dt_date.fromisoformat(valid_from) if valid_from else EPOCH_MONDAY
+    return (week_index(day) - week_index(anchor)) % (every_weeks or 1) == 0
+
+
+def _parse_hours(hours):
+    """ "08:00-16:00" -> ("08:00", "16:00"); None przy niepoprawnym formacie."""
+    try:
+        start, end = (part.strip() for part in hours.split("-"))
+        dt_datetime.strptime(start, "%H:%M")
+        dt_datetime.strptime(end, "%H:%M")
+    except (AttributeError, ValueError):
+        return None
+    return start, end
+
+
+@lru_cache(maxsize=None)
+def _doctor_rules(doctor_id):
+    """
+    (imię lekarza, {dzień tygodnia: [(od, do, co_ile_tygodni, od_dnia, do_dnia), ...]},
+    [(pierwszy, ostatni dzień bez przyjęć), ...]) albo None, gdy lekarza nie ma.
+    """
+    conn = get_conn()
+    doctor = conn.execute(
+        "SELECT id, name, hours FROM doctors WHERE id=?", (doctor_id,)
+    ).fetchone()
+    if doctor is None:
+        return None
+
+    rules = {}
+    for row in conn.execute(
+        "SELECT day_of_week, start_time, end_time, every_weeks, valid_from, valid_to "
+        "FROM doctor_schedule WHERE doctor_id=? ORDER BY start_time",
+        (doctor_id,)
+    ):
+        rules.setdefault(row["day_of_week"], []).append((
+            row["start_time"], row["end_time"],
+            row["every_weeks"], row["valid_from"], row["valid_to"],
+        ))
+
+    if not rules:
+        default_hours = _parse_hours(doctor["hours"])
+        if default_hours:
+            rules = {day: [(*default_hours, 1, None, None)] for day in range(1, 6)}
+
+    closed = [
+        (row["date_from"], row["date_to"])
+        for row in conn.execute(
+            "SELECT date_from, date_to FROM schedule_exceptions "
+            "WHERE doctor_id=? OR doctor_id IS NULL",
+            (doctor_id,)
+        )
+    ]
+
+    return doctor["name"], rules, closed
+
+
+@lru_cache(maxsize=SLOT_CACHE_SIZE)
+def _day_grid(doctor_id, day):
+    rules = _doctor_rules(doctor_id)
+    if rules is None:
+        return ()
+    doctor_name, weekly, closed = rules
+    if any(date_from <= day <= date_to for date_from, date_to in closed):
+        return ()
+
+    day_date = dt_date.fromisoformat(day)
+    slots = []
+    seen = set()
+    for start, end, every_weeks, valid_from, valid_to in weekly.get(day_date.isoweekday(), []):
+        if not applies_on(every_weeks, valid_from, valid_to, day_date):
+            continue
+        try:
+            current = dt_datetime.strptime(start, "%H:%M")
+            end_dt = dt_datetime.strptime(end, "%H:%M")
+        except (TypeError, ValueError):
+            # błędny wpis w bazie nie może ukryć pozostałych dyżurów tego dnia
+            log.error("Pomijam błędny wpis grafiku lekarza %s: %r-%r", doctor_id, start, end)
+            continue
+        while current + timedelta(minutes=SLOT_MINUTES) <= end_dt:
+            hhmm = current.strftime("%H:%M")
+            current += timedelta(minutes=SLOT_MINUTES)
+            if hhmm in seen:
+                continue  # nakładające się wpisy grafiku nie dublują terminów
+            seen.add(hhmm)
+            slots.append({
+                "slot_id": make_slot_id(doctor_id, hhmm),
+                "doctor_id": doctor_id,
+                "doctor_name": doctor_name,
+                "date": day,
+                "time": hhmm,
+            })
+
+    slots.sort(key=lambda s: s["time"])
+    return tuple(slots)
+
+
+@lru_cache(maxsize=1)
+def _doctors():
+    rows = get_conn().execute("SELECT id, name FROM doctors ORDER BY id").fetchall()
+    return tuple({"id": r["id"], "name": r["name"]} for r in rows)
+
+
+def _expire_if_stale():
+    global _cached_at
+    now = time.monotonic()
+    if now - _cached_at > SLOT_CACHE_TTL:
+        with _lock:
+            if now - _cached_at > SLOT_CACHE_TTL:
+                _clear()
+                _cached_at = now
+
+
+def _clear():
+    _doctors.cache_clear()
+    _doctor_rules.cache_clear()
+    _day_grid.cache_clear()
+
+
+def init_app(app):
+    """Długość terminu i czas życia cache z app.config (SLOT_MINUTES, SLOT_CACHE_TTL)."""
+    global SLOT_MINUTES, SLOT_CACHE_TTL
+    SLOT_MINUTES = int(app.config.get("SLOT_MINUTES", SLOT_MINUTES))
+    SLOT_CACHE_TTL = int(app.config.get("SLOT_CACHE_TTL", SLOT_CACHE_TTL))
+    invalidate()
+
+
+def invalidate():
+    """Wywoływane po zmianie grafiku, godzin pracy albo listy lekarzy."""
+    global _cached_at
+    with _lock:
+        _clear()
+        _cached_at = time.monotonic()
+
+
+def list_doctors():
+    """Lekarze do wyboru w systemie rezerwacji."""
+    _expire_if_stale()
+    return _doctors()
+
+
+def slots_for_day(doctor_id, day):
+    """Wszystkie terminy lekarza w danym dniu (data jako "YYYY-MM-DD")."""
+    _expire_if_stale()
+    try:
+        day = dt_date.fromisoformat(day).isoformat()
+    except (TypeError, ValueError):
+        return ()  # niepoprawna data z adresu/formularza = dzień bez terminów
+    return _day_grid(doctor_id, day)
+
+
+def get_slots_for(selected_date, doctor_id=None):
+    """Terminy danego dnia – jednego lekarza albo wszystkich."""
+    if doctor_id is not None:
+        return list(slots_for_day(doctor_id, selected_date))
+    slots = []
+    for doctor in list_doctors():
+        slots.extend(slots_for_day(doctor["id"], selected_date))
+    return slots
+
+
+def slots_in_range(doctor_id, start_day, days):
+    """Terminy lekarza w kolejnych `days` dniach od start_day (obiekt date)."""
+    for offset in range(days):
+        day = (start_day + timedelta(days=offset)).isoformat()
+        yield day, slots_for_day(doctor_id, day)
+
+
+def find_slot(day, slot_id):
+    """Termin o danym slot_id w danym dniu albo None."""
+    for slot in slots_for_day(slot_doctor_id(slot_id), day):
+        if slot["slot_id"] == slot_id:
+            return slot
+    return None
@@ -0,0 +1,320 @@
+"""
+Lista oczekujących na zwolnione terminy.
+
+Pacjent zapisuje się z preferencjami: lekarz (albo dowolny), zakres dni i okno
+godzin. Gdy termin się zwalnia (anulowanie, zmiana terminu, wygasła lub
+odrzucona oferta), słuchacz BookingStore od razu szuka kandydata – pierwszego
+zapisanego, który do terminu pasuje i nie dostał już oferty na ten termin
+(indeks idx_waitlist_match) – i w jednej transakcji:
+
+- wstrzymuje termin rezerwacją HELD (dla innych jest zajęty, decyduje unikalny
+  indeks rezerwacji, więc wyścig z rezerwacją ze strony przegrywa oferta),
+- zapisuje ofertę z terminem ważności (WAITLIST_HOLD_MINUTES, najpóźniej do
+  początku wizyty),
+- wstawia e-mail z linkiem /waitlist/offer/<token> do outboxa.
+
+Potwierdzona oferta staje się zwykłą rezerwacją (potwierdzenie i przypomnienie
+jak przy rezerwacji ze strony). Odrzucona albo przeterminowana zwalnia termin,
+który trafia do następnego kandydata; zapis pacjenta wraca na listę.
+Przeterminowane oferty zamyka sama aplikacja (co WAITLIST_EXPIRE_SECONDS, przy
+żądaniach) albo `flask waitlist expire` z crona.
+"""
+import logging
+import re
+import secrets
+import threading
+import time
+from datetime import date as dt_date, datetime as dt_datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from booking_store import validate_patient
+from database import get_conn, immediate_transaction
+from slots import list_doctors
+
+WAITLIST_HOLD_MINUTES = 15
+WAITLIST_MIN_LEAD_MINUTES = 60   # termin zaczynający się wcześniej zostaje dla rejestracji
+WAITLIST_EXPIRE_SECONDS = 30     # co ile sekund żądania sprawdzają przeterminowane oferty (0 = tylko CLI)
+EXPIRE_BATCH = 100
+
+# status zapisu
+WAITING = "waiting"
+OFFERED = "offered"
+BOOKED = "booked"
+LEFT = "left"
+EXPIRED = "expired"
+
+# status oferty
+OPEN = "open"
+ACCEPTED = "accepted"
+DECLINED = "declined"
+TIMED_OUT = "expired"
+
+_TIME = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
+
+log = logging.getLogger("clinic.waitlist")
+
+
+class WaitlistError(ValueError):
+    pass
+
+
+def _timestamp(moment):
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _slot_start(slot):
+    return dt_datetime.strptime(f"{slot['date']} {slot['time']}", "%Y-%m-%d %H:%M")
+
+
+def _check_date(value, field):
+    try:
+        return dt_date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise WaitlistError(f"Niepoprawna data w polu '{field}' (YYYY-MM-DD).")
+
+
+class Waitlist:
+
+    def __init__(self, bookings, notifier):
+        self.config = {
+            "WAITLIST_HOLD_MINUTES": WAITLIST_HOLD_MINUTES,
+            "WAITLIST_MIN_LEAD_MINUTES": WAITLIST_MIN_LEAD_MINUTES,
+            "WAITLIST_EXPIRE_SECONDS": WAITLIST_EXPIRE_SECONDS,
+        }
+        self._bookings = bookings
+        self._notifier = notifier
+        self._next_expiry = 0.0
+        self._expiry_lock = threading.Lock()
+        bookings.add_listener(self._on_booking_change)
+
+    def init_app(self, app):
+        for key in self.config:
+            if key in app.config:
+                self.config[key] = app.config[key]
+        if float(self.config["WAITLIST_EXPIRE_SECONDS"]) > 0:
+            app.before_request(self._expire_due)
+        app.cli.add_command(waitlist_cli)
+        app.extensions["waitlist"] = self
+
+    # --- zapisy ---
+
+    def add(self, patient_name, email, date_from, date_to, doctor_id=None,
+            time_from=None, time_to=None):
+        """Zapisuje pacjenta na listę. Zwraca zapis; błędne dane -> WaitlistError."""
+        error = validate_patient(patient_name, email)
+        if error:
+            raise WaitlistError(error)
+        date_from = _check_date(date_from, "date_from")
+        date_to = _check_date(date_to or date_from, "date_to")
+        if date_to < date_from:
+            raise WaitlistError("Koniec zakresu dni jest przed początkiem.")
+        if date_to < dt_date.today().isoformat():
+            raise WaitlistError("Zakres dni już minął.")
+        time_from = time_from or "00:00"
+        time_to = time_to or "24:00"
+        if not _TIME.match(time_from) or not (_TIME.match(time_to) or time_to == "24:00"):
+            raise WaitlistError("Niepoprawna godzina (HH:MM).")
+        if time_to <= time_from:
+            raise WaitlistError("Koniec okna godzin musi być po jego początku.")
+        if doctor_id is not None and doctor_id not in {d["id"] for d in list_doctors()}:
+            raise WaitlistError("Nie znaleziono lekarza.")
+
+        conn = get_conn()
+        with conn:
+            cur = conn.execute(
+                """
+                INSERT INTO waitlist (patient_name, email, doctor_id, date_from, date_to, time_from, time_to)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (patient_name, email, doctor_id, date_from, date_to, time_from, time_to)
+            )
+        return self.get(cur.lastrowid)
+
+    def get(self, entry_id):
+        row = get_conn().execute("SELECT * FROM waitlist WHERE id=?", (entry_id,)).fetchone()
+        return dict(row) if row else None
+
+    # --- dopasowanie i oferta ---
+
+    def _candidate(self, conn, slot):
+        """Najdawniej zapisany pasujący pacjent, który nie dostał jeszcze oferty na ten termin."""
+        match = """
+            SELECT * FROM waitlist
+            WHERE status = 'waiting' AND {doctor} AND date_from <= :date AND date_to >= :date
+              AND time_from <= :time AND time_to > :time
+              AND id NOT IN (SELECT waitlist_id FROM waitlist_offers
+                             WHERE doctor_id = :doctor_id AND date = :date AND slot_id = :slot_id)
+        """
+        return conn.execute(
+            match.format(doctor="doctor_id = :doctor_id") + " UNION ALL "
+            + match.format(doctor="doctor_id IS NULL") + " ORDER BY id LIMIT 1",
+            {"doctor_id": slot["doctor_id"], "date": slot["date"],
+             "time": slot["time"], "slot_id": slot["slot_id"]}
+        ).fetchone()
+
+    def offer_slot(self, slot, now=None):
+        """
+        Oferuje wolny termin pierwszemu pasującemu pacjentowi z listy.
+        Zwraca ofertę albo None (brak kandydata, termin za blisko albo już zajęty).
+        """
+        now = now or dt_datetime.now()
+        start = _slot_start(slot)
+        if start - now < timedelta(minutes=float(self.config["WAITLIST_MIN_LEAD_MINUTES"])):
+            return None
+        expires_at = min(now + timedelta(minutes=float(self.config["WAITLIST_HOLD_MINUTES"])), start)
+
+        conn = get_conn()
+        with immediate_transaction(conn):
+            entry = self._candidate(conn, slot)
+            if entry is None:
+                return None
+            booking_id = self._bookings.hold(conn, slot, entry["patient_name"], entry["email"])
+            if booking_id is None:
+                return None
+            offer = {
+                "waitlist_id": entry["id"], "booking_id": booking_id,
+                "doctor_id": slot["doctor_id"], "date": slot["date"], "slot_id": slot["slot_id"],
+                "token": secrets.token_urlsafe(16), "status": OPEN, "expires_at": _timestamp(expires_at),
+            }
+            cur = conn.execute(
+                """
+                INSERT INTO waitlist_offers
+                    (waitlist_id, booking_id, doctor_id, date, slot_id, token, status, expires_at)
+                VALUES (:waitlist_id, :booking_id, :doctor_id, :date, :slot_id, :token, :status, :expires_at)
+                """, offer
+            )
+            offer["id"] = cur.lastrowid
+            conn.execute("UPDATE waitlist SET status=? WHERE id=?", (OFFERED, entry["id"]))
+            appt = dict(conn.execute("SELECT * FROM bookings WHERE id=?", (booking_id,)).fetchone())
+            self._notifier.enqueue_offer(conn, appt, offer, now)
+        self._bookings.notify("held", appt)
+        log.info("Termin %s %s (lekarz %s) zaoferowany zapisowi %s do %s",
+                 slot["date"], slot["time"], slot["doctor_id"], entry["id"], offer["expires_at"])
+        return offer
+
+    def _on_booking_change(self, event, appt, previous=None):
+        if event not in ("cancelled", "rescheduled", "released") or previous is None:
+            return
+        # zwolnienie jest już zatwierdzone – błąd oferty nie może zepsuć anulowania
+        try:
+            self.offer_slot(previous)
+        except Exception:
+            log.exception("Nie udało się zaoferować zwolnionego terminu")
+
+    # --- odpowiedź na ofertę ---
+
+    def get_offer(self, token):
+        row = get_conn().execute("""
+            SELECT o.*, b.doctor_name, b.time, b.patient_name, w.status AS entry_status
+            FROM waitlist_offers o
+            JOIN bookings b ON b.id = o.booking_id
+            JOIN waitlist w ON w.id = o.waitlist_id
+            WHERE o.token=?
+        """, (token,)).fetchone()
+        return dict(row) if row else None
+
+    def accept(self, token, now=None):
+        """Potwierdza ofertę – termin staje się rezerwacją. None, gdy oferta nieaktualna."""
+        now = _timestamp(now or dt_datetime.now())
+        conn = get_conn()
+        with immediate_transaction(conn):
+            offer = conn.execute(
+                "SELECT * FROM waitlist_offers WHERE token=? AND status=? AND expires_at > ?",
+                (token, OPEN, now)
+            ).fetchone()
+            if offer is None or not self._bookings.confirm_hold(conn, offer["booking_id"]):
+                return None
+            conn.execute("UPDATE waitlist_offers SET status=? WHERE id=?", (ACCEPTED, offer["id"]))
+            conn.execute("UPDATE waitlist SET status=?, booking_id=? WHERE id=?",
+                         (BOOKED, offer["booking_id"], offer["waitlist_id"]))
+        appt = self._bookings.get(offer["booking_id"])
+        self._bookings.notify("booked", appt)
+        return appt
+
+    def _close(self, offer_id, offer_status, entry_status):
+        """Zamyka otwartą ofertę i zwalnia jej termin (słuchacz zaoferuje go następnemu)."""
+        conn = get_conn()
+        with immediate_transaction(conn):
+            offer = conn.execute(
+                "SELECT * FROM waitlist_offers WHERE id=? AND status=?", (offer_id, OPEN)
+            ).fetchone()
+            if offer is None:
+                return False
+            conn.execute("UPDATE waitlist_offers SET status=? WHERE id=?", (offer_status, offer_id))
+            conn.execute("UPDATE waitlist SET status=? WHERE id=? AND status=?",
+                         (entry_status, offer["waitlist_id"], OFFERED))
+            released = self._bookings.release_hold(conn, offer["booking_id"])
+        if released:
+            appt = self._bookings.get(offer["booking_id"])
+            self._bookings.notify("released", appt, dict(appt, status="HELD"))
+        return True
+
+    def decline(self, token, leave=False):
+        """
+        Odrzuca ofertę; zapis wraca na listę (inne terminy) albo – przy leave=True –
+        pacjent rezygnuje z listy. False, gdy oferta nie jest już otwarta.
+        """
+        offer = self.get_offer(token)
+        if offer is None:
+            return False
+        return self._close(offer["id"], DECLINED, LEFT if leave else WAITING)
+
+    # --- wygasanie ---
+
+    def expire_offers(self, now=None):
+        """Zamyka przeterminowane oferty i zapisy z minionym zakresem dni. Zwraca liczbę ofert."""
+        now = now or dt_datetime.now()
+        conn = get_conn()
+        expired = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id FROM waitlist_offers WHERE status=? AND expires_at <= ? "
+                "ORDER BY expires_at LIMIT ?",
+                (OPEN, _timestamp(now), EXPIRE_BATCH)
+            ).fetchall()
+            for row in rows:
+                expired += self._close(row["id"], TIMED_OUT, WAITING)
+            if len(rows) < EXPIRE_BATCH:
+                break
+        with conn:
+            conn.execute("UPDATE waitlist SET status=? WHERE status=? AND date_to < ?",
+                         (EXPIRED, WAITING, now.date().isoformat()))
+        return expired
+
+    def _expire_due(self):
+        moment = time.monotonic()
+        if moment < self._next_expiry or not self._expiry_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_expiry = moment + float(self.config["WAITLIST_EXPIRE_SECONDS"])
+            self.expire_offers()
+        except Exception:
+            log.exception("Błąd wygaszania ofert listy oczekujących")
+        finally:
+            self._expiry_lock.release()
+
+
+# ---------------------------
+# POLECENIA CLI
+# ---------------------------
+
+waitlist_cli = AppGroup("waitlist", help="Lista oczekujących na zwolnione terminy.")
+
+
+@waitlist_cli.command("expire")
+def expire_command():
+    """Zamyka przeterminowane oferty i oferuje ich terminy kolejnym pacjentom."""
+    expired = current_app.extensions["waitlist"].expire_offers()
+    click.echo(f"Przeterminowane oferty: {expired}.")
+
+
+@waitlist_cli.command("status")
+def status_command():
+    """Liczba zapisów i ofert według statusu."""
+    conn = get_conn()
+    for table in ("waitlist", "waitlist_offers"):
+        for row in conn.execute(f"SELECT status, COUNT(*) AS n FROM {table} GROUP BY status ORDER BY status"):
+            click.echo(f"{table} {row['status']}: {row['n']}")